@@ -0,0 +1,131 @@
+"""Deterministic generator of synthetic corpora resembling code that uses feature flags."""
+import os
+import random
+
+FLAG_NAME = "FEATURE_FLAG_NAME"
+RESOLUTION_METHOD_NAME = "is_flag_active"
+IMPORT_PATTERNS = ("from_import", "from_import_aliased", "import_aliased", "declaration", "tuple_declaration")
+
+
+class CorpusSpec:
+    def __init__(
+        self,
+        files=1000,
+        min_statements=20,
+        max_statements=400,
+        flag_density=0.05,
+        max_nesting_depth=4,
+        import_patterns=IMPORT_PATTERNS,
+        test_module_ratio=0.1,
+        mention_density=0.0,
+        seed=0,
+    ):
+        self.files = files
+        self.min_statements = min_statements
+        self.max_statements = max_statements
+        self.flag_density = flag_density
+        self.max_nesting_depth = max_nesting_depth
+        self.import_patterns = import_patterns
+        self.test_module_ratio = test_module_ratio
+        self.mention_density = mention_density
+        self.seed = seed
+
+    def as_dict(self):
+        return dict(self.__dict__, import_patterns=list(self.import_patterns))
+
+
+def generate(spec):
+    """Yield ``(relative_path, source)`` pairs for every module of the corpus, always in the same order."""
+    rng = random.Random(spec.seed)
+    for i in range(spec.files):
+        package = "package_%d" % (i % 37)
+        is_test_module = rng.random() < spec.test_module_ratio
+        filename = ("test_module_%d.py" if is_test_module else "module_%d.py") % i
+        uses_flag = rng.random() < spec.flag_density
+        # Only drawn when asked for, so corpora without mentions stay the same as before they were supported
+        mentions_flag = spec.mention_density > 0 and not uses_flag and rng.random() < spec.mention_density
+        statements = rng.randint(spec.min_statements, spec.max_statements)
+        yield os.path.join(package, filename), _module(rng, spec, statements, uses_flag, mentions_flag)
+
+
+def write(spec, directory):
+    """Write the corpus under the given directory, returning the paths of the written modules."""
+    paths = []
+    for relative_path, source in generate(spec):
+        path = os.path.join(directory, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as module_file:
+            module_file.write(source)
+        paths.append(path)
+
+    return paths
+
+
+def _module(rng, spec, statements, uses_flag, mentions_flag=False):
+    lines = ['"""Generated module."""', "import logging", "", "logger = logging.getLogger(__name__)", ""]
+    if mentions_flag:
+        lines.append("logger.info('%s is rolled out by another service')" % FLAG_NAME)
+    flag_reference = FLAG_NAME
+    if uses_flag:
+        import_pattern = rng.choice(spec.import_patterns)
+        flag_reference = _flag_import(lines, import_pattern)
+
+    emitted_statements = 0
+    function_index = 0
+    while emitted_statements < statements:
+        lines.append("")
+        lines.append("")
+        lines.append("def function_%d(argument):" % function_index)
+        function_index += 1
+        body_statements = rng.randint(3, 30)
+        emitted_statements += _block(rng, spec, lines, 1, body_statements, uses_flag, flag_reference)
+
+    return "\n".join(lines) + "\n"
+
+
+def _flag_import(lines, import_pattern):
+    if import_pattern == "from_import":
+        lines.insert(2, "from flags import %s" % FLAG_NAME)
+        return FLAG_NAME
+    if import_pattern == "from_import_aliased":
+        lines.insert(2, "from flags import OTHER_FLAG, %s as ALIASED_FLAG" % FLAG_NAME)
+        return "ALIASED_FLAG"
+    if import_pattern == "import_aliased":
+        lines.insert(2, "import flags.%s as ALIASED_FLAG" % FLAG_NAME)
+        return "ALIASED_FLAG"
+    if import_pattern == "declaration":
+        lines.insert(2, "%s = 'feature_flag_name'" % FLAG_NAME)
+        return FLAG_NAME
+
+    lines.insert(2, "OTHER_FLAG, %s = 'other_flag', 'feature_flag_name'" % FLAG_NAME)
+    return FLAG_NAME
+
+
+def _block(rng, spec, lines, depth, statements, uses_flag, flag_reference):
+    indentation = "    " * depth
+    emitted_statements = 0
+    while emitted_statements < statements:
+        choice = rng.random()
+        if depth < spec.max_nesting_depth and choice < 0.15:
+            nested_statements = rng.randint(1, 6)
+            if uses_flag and choice < 0.05:
+                negation = "not " if rng.random() < 0.3 else ""
+                lines.append("%sif %s%s(%s):" % (indentation, negation, RESOLUTION_METHOD_NAME, flag_reference))
+            else:
+                lines.append("%sif argument > %d:" % (indentation, rng.randint(0, 100)))
+            emitted_statements += 1 + _block(rng, spec, lines, depth + 1, nested_statements, uses_flag, flag_reference)
+            if rng.random() < 0.5:
+                lines.append("%selse:" % indentation)
+                emitted_statements += _block(rng, spec, lines, depth + 1, rng.randint(1, 4), uses_flag, flag_reference)
+        elif choice < 0.2:
+            lines.append("%sfor item in range(argument):" % indentation)
+            lines.append("%s    argument += item * %d" % (indentation, rng.randint(1, 9)))
+            emitted_statements += 2
+        elif choice < 0.25:
+            lines.append("%sreturn argument" % indentation)
+            return emitted_statements + 1
+        else:
+            lines.append("%slogger.info('value %%s', argument + %d)" % (indentation, rng.randint(0, 1000)))
+            emitted_statements += 1
+
+    return emitted_statements
@@ -0,0 +1,71 @@
+"""Check that PiranhaCommand's cost grows linearly with the size of deeply nested and chained conditionals.
+
+Run with ``python -m benchmarks.if_scaling``. Each row doubles the nesting depth of the generated module, so the time
+per statement should stay roughly flat - the run fails when it grows by more than the allowed factor. Python doesn't
+allow more than 100 indentation levels, which bounds the largest depth.
+"""
+import argparse
+import sys
+import time
+
+import libcst
+from libcst.codemod import CodemodContext
+from piranha_python.codemods import PiranhaCommand
+
+FLAG_NAME = "FEATURE_FLAG_NAME"
+MAX_ALLOWED_GROWTH = 2.0
+
+
+def main(argv=None):
+    """Time the transform of generated modules of doubling sizes and report the time per statement."""
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--min-depth", type=int, default=12)
+    arg_parser.add_argument("--doublings", type=int, default=3)
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    args = arg_parser.parse_args(argv)
+
+    print("%-8s %-12s %-12s %-18s" % ("depth", "statements", "seconds", "microseconds/stmt"))
+    times_per_statement = []
+    for i in range(args.doublings + 1):
+        depth = args.min_depth * 2 ** i
+        code = nested_flag_checks(depth)
+        statements = code.count("\n")
+        seconds = min(_time_transform(code) for _ in range(args.repeat))
+        times_per_statement.append(seconds / statements)
+        print("%-8d %-12d %-12.4f %-18.2f" % (depth, statements, seconds, seconds / statements * 1e6))
+
+    growth = times_per_statement[-1] / times_per_statement[0]
+    print("time per statement grew %.2fx from the smallest to the largest module" % growth)
+
+    return 0 if growth <= MAX_ALLOWED_GROWTH else 1
+
+
+def nested_flag_checks(depth):
+    """Generate a function with ``depth`` nested flag checks, each followed by an elif chain and a return."""
+    lines = ["def func():"]
+    for level in range(1, depth + 1):
+        indentation = "    " * level
+        lines.append("%sif is_flag_active(%s):" % (indentation, FLAG_NAME))
+        lines.append("%s    print('level %d')" % (indentation, level))
+        if level == depth:
+            lines.append("%s    return %d" % (indentation, level))
+    for level in range(depth, 0, -1):
+        indentation = "    " * level
+        lines.append("%selif is_user_logged_in(%d):" % (indentation, level))
+        lines.append("%s    return -%d" % (indentation, level))
+        lines.append("%selse:" % indentation)
+        lines.append("%s    print('fallback %d')" % (indentation, level))
+
+    return "\n".join(lines) + "\n"
+
+
+def _time_transform(code):
+    command = PiranhaCommand(CodemodContext(), flag_name=FLAG_NAME, flag_resolution_methods="is_flag_active")
+    module = libcst.parse_module(code)
+    started_at = time.perf_counter()
+    command.transform_module(module)
+    return time.perf_counter() - started_at
+
+
+if __name__ == "__main__":
+    sys.exit(main())
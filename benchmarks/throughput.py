@@ -0,0 +1,146 @@
+"""Measure PiranhaCommand's throughput over synthetic corpora and compare it against stored baselines.
+
+Run with ``python -m benchmarks.throughput``. Baselines are machine dependent, so they should be recorded with
+``--save-baseline`` on the machine later runs will be compared on.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+from benchmarks import corpus
+from libcst.codemod import CodemodContext
+from piranha_python import driver
+from piranha_python.codemods import PiranhaCommand
+
+DEFAULT_BASELINES_PATH = os.path.join(os.path.dirname(__file__), "baselines.json")
+DEFAULT_TOLERANCE = 0.2
+SCENARIOS = {
+    "sparse": corpus.CorpusSpec(files=2000, flag_density=0.02),
+    "dense": corpus.CorpusSpec(files=200, flag_density=0.6),
+    "deep": corpus.CorpusSpec(files=100, flag_density=0.3, max_nesting_depth=10, max_statements=1500),
+    "aliased": corpus.CorpusSpec(
+        files=200, flag_density=0.5, import_patterns=("from_import_aliased", "import_aliased")
+    ),
+    "mentions": corpus.CorpusSpec(files=1000, flag_density=0.05, mention_density=0.3),
+}
+
+
+def main(argv=None):
+    """Run the benchmark scenarios, report their throughput and check it against the baselines."""
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--scenario", dest="scenarios", action="append", choices=sorted(SCENARIOS))
+    arg_parser.add_argument("--scale", type=float, default=1.0, help="Multiplier applied to every scenario's files")
+    arg_parser.add_argument("--baselines", default=DEFAULT_BASELINES_PATH)
+    arg_parser.add_argument("--save-baseline", action="store_true")
+    arg_parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = arg_parser.parse_args(argv)
+
+    baselines = _load(args.baselines)
+    names = args.scenarios or sorted(SCENARIOS)
+    missing_names = [name for name in names if name not in baselines]
+    if not args.save_baseline and len(missing_names) > 0:
+        # Throughput depends on the machine, so there's no meaningful baseline to fall back to
+        raise SystemExit(
+            "no baseline for %s in %s - record them on this machine with 'make benchmark-baseline'"
+            % (", ".join(missing_names), args.baselines)
+        )
+
+    regressions = []
+    for name in names:
+        spec = SCENARIOS[name]
+        spec = corpus.CorpusSpec(**dict(spec.as_dict(), files=max(1, int(spec.files * args.scale))))
+        results = measure(spec)
+        _print_results(name, results)
+
+        if args.save_baseline:
+            baselines[name] = results
+        elif results["files_per_second"] < baselines[name]["files_per_second"] * (1 - args.tolerance):
+            regressions.append(
+                "%s: %.1f files/s against a baseline of %.1f files/s"
+                % (name, results["files_per_second"], baselines[name]["files_per_second"])
+            )
+
+    if args.save_baseline:
+        with open(args.baselines, "w") as baselines_file:
+            json.dump(baselines, baselines_file, indent=2, sort_keys=True)
+
+    for regression in regressions:
+        print("REGRESSION %s" % regression)
+
+    return 1 if len(regressions) > 0 else 0
+
+
+def measure(spec):
+    """Transform every module of the corpus in-process, timing each one."""
+    command = PiranhaCommand(
+        CodemodContext(), flag_name=corpus.FLAG_NAME, flag_resolution_methods=corpus.RESOLUTION_METHOD_NAME
+    )
+    latencies = []
+    total_bytes = 0
+    report = driver.RunReport()
+    for relative_path, source in corpus.generate(spec):
+        source = source.encode("utf-8")
+        full_module_name = driver.full_module_name_of(relative_path)
+        started_at = time.perf_counter()
+        if command.is_module_ignored(full_module_name):
+            result = driver.FileResult(relative_path, driver.IGNORED)
+        else:
+            result = driver.transform_source(command, relative_path, source, full_module_name)
+        latencies.append(time.perf_counter() - started_at)
+        total_bytes += len(source)
+        report.record(result)
+
+    total_seconds = sum(latencies)
+    latencies.sort()
+    return {
+        "spec": spec.as_dict(),
+        "files": len(latencies),
+        "megabytes": total_bytes / 1e6,
+        "seconds": total_seconds,
+        "files_per_second": len(latencies) / total_seconds,
+        "megabytes_per_second": total_bytes / 1e6 / total_seconds,
+        "latency_milliseconds": {
+            "p50": _percentile(latencies, 50) * 1e3,
+            "p90": _percentile(latencies, 90) * 1e3,
+            "p99": _percentile(latencies, 99) * 1e3,
+            "max": latencies[-1] * 1e3,
+        },
+        "counters": report.counters,
+        "confirmation_rate": report.confirmation_rate(),
+    }
+
+
+def _percentile(sorted_values, percentile):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * percentile / 100))]
+
+
+def _print_results(name, results):
+    latency = results["latency_milliseconds"]
+    print(
+        "%-8s %6d files %7.2f MB %8.1f files/s %6.2f MB/s  p50 %7.2fms  p90 %7.2fms  p99 %7.2fms  max %7.2fms"
+        % (
+            name,
+            results["files"],
+            results["megabytes"],
+            results["files_per_second"],
+            results["megabytes_per_second"],
+            latency["p50"],
+            latency["p90"],
+            latency["p99"],
+            latency["max"],
+        )
+    )
+
+
+def _load(baselines_path):
+    try:
+        with open(baselines_path) as baselines_file:
+            return json.load(baselines_file)
+    except OSError:
+        return {}
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+import hashlib
+import json
+import os
+import tempfile
+import zlib
+
+CACHE_FORMAT_VERSION = 1
+DEFAULT_MAX_SIZE_BYTES = 256 * 1024 * 1024
+EVICTION_INTERVAL = 256
+
+_UNCHANGED_MARKER = b"U"
+_CHANGED_MARKER = b"C"
+
+
+class TransformCache:
+    """Content-addressed cache of transform results, one atomically written file per entry.
+
+    Entries hold a one byte marker followed by the zlib-compressed transformed module, if it changed. Least recently
+    used entries are evicted once the cache grows past its size bound.
+    """
+
+    def __init__(self, directory, max_size_bytes=DEFAULT_MAX_SIZE_BYTES):
+        self.directory = directory
+        self.max_size_bytes = max_size_bytes
+        self._puts_since_eviction = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def key_for(self, configuration_fingerprint, source, module_flag_aliases=None):
+        # The same source may check flags through names that are only flag aliases in some modules
+        aliases = json.dumps(module_flag_aliases or {}, sort_keys=True).encode("utf-8")
+        return hashlib.sha256(configuration_fingerprint + b"\0" + aliases + b"\0" + source).hexdigest()
+
+    def get(self, key):
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, "rb") as entry_file:
+                entry = entry_file.read()
+            os.utime(entry_path)
+        except OSError:
+            return None
+
+        if entry[:1] == _UNCHANGED_MARKER:
+            return CacheEntry(changed=False)
+        if entry[:1] == _CHANGED_MARKER:
+            try:
+                return CacheEntry(changed=True, transformed_source=zlib.decompress(entry[1:]))
+            except zlib.error:
+                return None
+
+        return None
+
+    def put(self, key, transformed_source=None):
+        if transformed_source is None:
+            entry = _UNCHANGED_MARKER
+        else:
+            entry = _CHANGED_MARKER + zlib.compress(transformed_source)
+
+        entry_path = self._entry_path(key)
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=os.path.dirname(entry_path), prefix=".tmp-")
+        try:
+            with os.fdopen(file_descriptor, "wb") as entry_file:
+                entry_file.write(entry)
+            os.replace(temporary_path, entry_path)
+        except OSError:
+            _remove_quietly(temporary_path)
+            return
+
+        self._puts_since_eviction += 1
+        if self._puts_since_eviction >= EVICTION_INTERVAL:
+            self.evict()
+
+    def evict(self):
+        self._puts_since_eviction = 0
+        entries = []
+        total_size = 0
+        for dirpath, _, filenames in os.walk(self.directory):
+            for filename in filenames:
+                entry_path = os.path.join(dirpath, filename)
+                try:
+                    entry_stat = os.stat(entry_path)
+                except OSError:
+                    continue
+                entries.append((entry_stat.st_mtime, entry_stat.st_size, entry_path))
+                total_size += entry_stat.st_size
+
+        if total_size <= self.max_size_bytes:
+            return
+
+        for _, size, entry_path in sorted(entries):
+            _remove_quietly(entry_path)
+            total_size -= size
+            if total_size <= self.max_size_bytes:
+                break
+
+    def _entry_path(self, key):
+        return os.path.join(self.directory, key[:2], key[2:])
+
+
+class CacheEntry:
+    def __init__(self, changed, transformed_source=None):
+        self.changed = changed
+        self.transformed_source = transformed_source
+
+
+def configuration_fingerprint(command):
+    """Serialize everything that can change a command's output into bytes suitable for building cache keys."""
+    return json.dumps(
+        {"cacheFormatVersion": CACHE_FORMAT_VERSION, "configuration": command.configuration()}, sort_keys=True
+    ).encode("utf-8")
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
@@ -0,0 +1,525 @@
+import argparse
+import json
+import os
+import sys
+
+from libcst.codemod import CodemodContext
+from piranha_python import incremental, locate, pipeline, scheduler, sharding, streaming, verdicts
+from piranha_python.codemods import MultiFlagPiranhaCommand
+from piranha_python.daemon import DEFAULT_SOCKET_PATH, Daemon
+from piranha_python.driver import is_within_any
+from piranha_python.ignore import IgnoreRules
+from piranha_python.import_graph import DEFAULT_IMPORT_GRAPH_PATH, ImportGraph
+from piranha_python.index import DEFAULT_INDEX_PATH, FlagUsageIndex
+from piranha_python.profiling import TransformProfiler
+
+
+def main(argv=None):
+    """Run the piranha command line interface."""
+    arg_parser = _arg_parser()
+    args = arg_parser.parse_args(argv)
+    if args.subcommand is None:
+        arg_parser.print_help()
+        return 2
+
+    return args.handler(args)
+
+
+def _arg_parser():
+    arg_parser = argparse.ArgumentParser(
+        prog="piranha", description="Removes feature flag usages from code whilst preserving its behavior"
+    )
+    subparsers = arg_parser.add_subparsers(dest="subcommand")
+
+    run_parser = subparsers.add_parser("run", help="Remove the given flags from the Python files under the paths")
+    _add_flag_args(run_parser)
+    _add_execution_args(run_parser)
+    run_parser.add_argument("paths", metavar="PATH", nargs="+", help="Files or directories to be processed")
+    run_parser.set_defaults(handler=_run)
+
+    stream_parser = subparsers.add_parser(
+        "stream", help="Read files from stdin and write a unified diff of each changed one to stdout as it's done"
+    )
+    _add_flag_args(stream_parser)
+    stream_parser.add_argument(
+        "-0", "--null", dest="null_separated", action="store_true", help="Paths read from stdin are NUL-separated"
+    )
+    stream_parser.add_argument(
+        "--contents",
+        dest="contents",
+        action="store_true",
+        help="Stdin holds NUL-terminated paths, each one followed by the NUL-terminated contents of the file",
+    )
+    stream_parser.add_argument(
+        "-j", "--jobs", dest="jobs", type=int, default=None, help="Number of worker processes (default: CPU count)"
+    )
+    stream_parser.add_argument(
+        "--max-in-flight",
+        dest="max_in_flight",
+        type=int,
+        default=None,
+        help="Upper bound on the files held in memory at once (default: twice the number of workers)",
+    )
+    stream_parser.add_argument(
+        "--repo-root", dest="repo_root", default=".", help="Root that paths in the diffs are relative to"
+    )
+    stream_parser.set_defaults(handler=_stream)
+
+    locate_parser = subparsers.add_parser(
+        "locate", help="Report where the flags are used and which branches would be kept, as JSON lines on stdout"
+    )
+    _add_flag_args(locate_parser)
+    locate_parser.add_argument("--repo-root", dest="repo_root", default=".", help="Root used to compute module names")
+    locate_parser.add_argument("paths", metavar="PATH", nargs="+", help="Files or directories to be analysed")
+    locate_parser.set_defaults(handler=_locate)
+
+    daemon_parser = subparsers.add_parser(
+        "daemon", help="Serve requests sent by piranha-client over a Unix domain socket with warm worker processes"
+    )
+    daemon_parser.add_argument(
+        "--socket", dest="socket_path", default=DEFAULT_SOCKET_PATH, help="Path of the socket the daemon listens on"
+    )
+    daemon_parser.add_argument(
+        "-j", "--jobs", dest="jobs", type=int, default=None, help="Number of worker processes (default: CPU count)"
+    )
+    daemon_parser.set_defaults(handler=_daemon)
+
+    index_parser = subparsers.add_parser(
+        "index", help="Build or update the index of flag usages and report how often each flag is used"
+    )
+    index_parser.add_argument(
+        "--method-name",
+        dest="resolution_method_names",
+        metavar="METHOD_NAME",
+        action="append",
+        required=True,
+        help="Name of a method used to resolve flag values - may be passed several times",
+    )
+    index_parser.add_argument("--index-file", dest="index_path", help="Where the index is stored")
+    index_parser.add_argument(
+        "--repo-root", dest="repo_root", default=".", help="Root the indexed paths are relative to"
+    )
+    index_parser.add_argument(
+        "-j", "--jobs", dest="jobs", type=int, default=1, help="Number of worker processes used to scan files"
+    )
+    index_parser.add_argument("paths", metavar="PATH", nargs="+", help="Files or directories to be indexed")
+    index_parser.set_defaults(handler=_index)
+
+    merge_parser = subparsers.add_parser(
+        "merge", help="Combine the result files of every shard of a run, printing their diffs to stdout"
+    )
+    merge_parser.add_argument("--report-json", dest="report_json_path", help="Where to write the merged report as JSON")
+    merge_parser.add_argument(
+        "shard_result_paths", metavar="SHARD_RESULT", nargs="+", help="Result files written by 'run --shard-result'"
+    )
+    merge_parser.set_defaults(handler=_merge)
+
+    return arg_parser
+
+
+def _add_flag_args(arg_parser):
+    arg_parser.add_argument("--flag-name", dest="flag_name", metavar="FLAG_NAME", help="Name of the feature flag")
+    arg_parser.add_argument(
+        "--method-name",
+        dest="flag_resolution_methods",
+        metavar="METHOD_NAME",
+        help="Name of the method used to resolve the flag value",
+    )
+    arg_parser.add_argument(
+        "--mode",
+        dest="mode",
+        metavar="MODE",
+        default="treated",
+        help="Execution mode - can be 'treated' or 'control'",
+    )
+    arg_parser.add_argument(
+        "--flags-config",
+        dest="flags_config_path",
+        metavar="FLAGS_CONFIG_PATH",
+        help="Path to a JSON file listing several flags to be processed at once",
+    )
+    arg_parser.add_argument(
+        "--ignored-module-check-path",
+        dest="ignored_module_check_fn_path",
+        metavar="IGNORED_MODULE_CHECK_FN_PATH",
+        help="Path to a function that says whether a given module should be ignored given its full dotted path",
+    )
+    arg_parser.add_argument(
+        "--cleanup",
+        dest="cleanup",
+        action="store_true",
+        help="Also remove the imports, assignments and blocks left unused by the removal of the flags",
+    )
+    arg_parser.add_argument(
+        "--then",
+        dest="followed_by",
+        metavar="TRANSFORM_PATH",
+        action="append",
+        default=[],
+        help="Path to a libcst codemod or transformer run over each file the flags were removed from, in the same "
+        "parse, before it's written back. May be passed several times",
+    )
+    arg_parser.add_argument(
+        "--follow-reexports",
+        dest="follow_reexports",
+        action="store_true",
+        help="Also remove the names the flags are re-exported or renamed as, found by following the imports of every "
+        "module under the repo root",
+    )
+    arg_parser.add_argument(
+        "--import-graph-file",
+        dest="import_graph_path",
+        help="Where --follow-reexports caches the imports of each module (default: <repo root>/%s)"
+        % DEFAULT_IMPORT_GRAPH_PATH,
+    )
+    include_help = "only files matching one of the include patterns are processed"
+    exclude_help = "matching files and directories are skipped without being read"
+    for option, dest, pattern_kind, effect in (
+        ("--include", "include_globs", "Glob", include_help),
+        ("--exclude", "exclude_globs", "Glob", exclude_help),
+        ("--include-regex", "include_regexes", "Regex", include_help),
+        ("--exclude-regex", "exclude_regexes", "Regex", exclude_help),
+    ):
+        arg_parser.add_argument(
+            option,
+            dest=dest,
+            metavar=pattern_kind.upper(),
+            action="append",
+            default=[],
+            help="%s matched against paths relative to the repo root - %s. May be passed several times"
+            % (pattern_kind, effect),
+        )
+
+
+def _add_execution_args(arg_parser):
+    arg_parser.add_argument(
+        "-j", "--jobs", dest="jobs", type=int, default=None, help="Number of worker processes (default: CPU count)"
+    )
+    arg_parser.add_argument("--repo-root", dest="repo_root", default=".", help="Root used to compute module names")
+    arg_parser.add_argument("--cache-dir", dest="cache_directory", help="Directory of the persistent result cache")
+    arg_parser.add_argument(
+        "--verdict-store",
+        dest="verdict_store_path",
+        help="SQLite file recording the modules found clean of the flags, which later runs skip without parsing them",
+    )
+    arg_parser.add_argument(
+        "--verdict-store-max-entries",
+        dest="verdict_store_max_entries",
+        type=int,
+        default=verdicts.DEFAULT_MAX_ENTRIES,
+        help="Number of verdicts kept before the least recently used ones are evicted",
+    )
+    arg_parser.add_argument(
+        "--no-write", dest="write", action="store_false", help="Don't write the transformed files back"
+    )
+    arg_parser.add_argument(
+        "--max-batch-bytes",
+        dest="max_batch_bytes",
+        type=int,
+        default=scheduler.DEFAULT_MAX_BATCH_BYTES,
+        help="Upper bound on the bytes of source handed to a worker at once",
+    )
+    arg_parser.add_argument(
+        "--max-tasks-per-child",
+        dest="max_tasks_per_child",
+        type=int,
+        default=scheduler.DEFAULT_MAX_TASKS_PER_CHILD,
+        help="Number of batches a worker processes before being replaced by a fresh one",
+    )
+    arg_parser.add_argument(
+        "--pipelined",
+        dest="pipelined",
+        action="store_true",
+        help="Overlap file discovery, reads and writes with the transforms, which helps on slow filesystems",
+    )
+    arg_parser.add_argument(
+        "--max-queued-files",
+        dest="max_queued_files",
+        type=int,
+        default=pipeline.DEFAULT_MAX_QUEUED_FILES,
+        help="With --pipelined, number of files waiting between two stages before the earlier one is held back",
+    )
+    arg_parser.add_argument(
+        "--max-in-flight",
+        dest="max_in_flight",
+        type=int,
+        default=None,
+        help="With --pipelined, number of files handed to workers at once (default: twice the number of workers)",
+    )
+    arg_parser.add_argument(
+        "--io-threads",
+        dest="io_threads",
+        type=int,
+        default=pipeline.DEFAULT_IO_THREADS,
+        help="With --pipelined, number of threads reading and writing files",
+    )
+    arg_parser.add_argument("--report-json", dest="report_json_path", help="Where to write the run report as JSON")
+    arg_parser.add_argument(
+        "--shard",
+        dest="shard",
+        metavar="INDEX/COUNT",
+        type=_shard_of,
+        help="Only process this shard of the files, e.g. 2/4, split evenly by size the same way on every host",
+    )
+    arg_parser.add_argument(
+        "--shard-result",
+        dest="shard_result_path",
+        help="Where to write this run's counters, failures and diffs, to be combined by 'piranha merge'",
+    )
+    arg_parser.add_argument(
+        "--profile",
+        dest="profile_path",
+        help="Time every visitor callback and the parse, transform and codegen phases of each file, "
+        "writing the results as JSON to the given path",
+    )
+    arg_parser.add_argument(
+        "--index-file",
+        dest="index_path",
+        help="Only open the files that a flag usage index built by 'piranha index' lists for the flags",
+    )
+    arg_parser.add_argument(
+        "--incremental",
+        dest="incremental",
+        action="store_true",
+        help="Only process the files changed in git since the last successful run with the same flags and paths. "
+        "Runs with --no-write or --shard don't record the processed commit",
+    )
+    arg_parser.add_argument(
+        "--state-file",
+        dest="state_path",
+        help="Where incremental runs record the last processed commit (default: <repo root>/%s)"
+        % incremental.DEFAULT_STATE_PATH,
+    )
+
+
+def _run(args):
+    command = _command_from(args)
+    paths = args.paths
+    if args.incremental:
+        state = incremental.IncrementalState(
+            args.state_path or os.path.join(args.repo_root, incremental.DEFAULT_STATE_PATH)
+        )
+        paths, head_commit = incremental.paths_changed_since_last_run(state, command, paths, args.repo_root)
+    if args.index_path is not None:
+        try:
+            index = FlagUsageIndex.covering(
+                args.index_path, _resolution_method_names_of(command), repo_root=args.repo_root
+            )
+        except ValueError as e:
+            raise SystemExit(str(e))
+        # Files added or edited since the index was last updated would otherwise be skipped
+        index.update(paths, jobs=args.jobs)
+        index.save()
+        # Re-exported flags are referenced under their aliases, which the index records like any other name
+        paths = _within(index.files_referencing(command.referencing_names), paths)
+
+    if args.shard is not None:
+        paths = sharding.files_of_shard(paths, *args.shard, ignore_rules=command.ignore_rules, repo_root=args.repo_root)
+
+    profiler = TransformProfiler() if args.profile_path is not None else None
+    verdict_store = None
+    if args.verdict_store_path is not None:
+        verdict_store = verdicts.VerdictStore(args.verdict_store_path, max_entries=args.verdict_store_max_entries)
+    queue_depths = pipeline.QueueDepths() if args.pipelined else None
+    try:
+        if args.pipelined:
+            report = pipeline.run_pipelined(
+                command,
+                paths,
+                repo_root=args.repo_root,
+                write=args.write,
+                cache_directory=args.cache_directory,
+                jobs=args.jobs,
+                max_queued_files=args.max_queued_files,
+                max_in_flight=args.max_in_flight,
+                io_threads=args.io_threads,
+                profiler=profiler,
+                verdicts=verdict_store,
+                diffs=args.shard_result_path is not None,
+                queue_depths=queue_depths,
+            )
+        else:
+            report = scheduler.run_parallel(
+                command,
+                paths,
+                repo_root=args.repo_root,
+                write=args.write,
+                cache_directory=args.cache_directory,
+                jobs=args.jobs,
+                max_batch_bytes=args.max_batch_bytes,
+                max_tasks_per_child=args.max_tasks_per_child,
+                profiler=profiler,
+                verdicts=verdict_store,
+                diffs=args.shard_result_path is not None,
+            )
+    finally:
+        if verdict_store is not None:
+            verdict_store.close()
+    if args.shard_result_path is not None:
+        sharding.write_shard_result(
+            args.shard_result_path, report, args.shard or (1, 1), command.configuration(), args.repo_root
+        )
+    _print_report(report, args.report_json_path)
+    if queue_depths is not None:
+        _print_queue_depths(queue_depths)
+    if profiler is not None:
+        profiler.write_json(args.profile_path)
+
+    if report.counters["files_failed"] > 0:
+        return 1
+
+    # Dry runs and single shards leave files unprocessed, so later runs must still look at them
+    if args.incremental and args.write and args.shard is None:
+        state.record(command, args.paths, head_commit, args.repo_root)
+
+    return 0
+
+
+def _stream(args):
+    stdin = sys.stdin.buffer
+    if args.contents:
+        records = streaming.contents_from(stdin)
+    else:
+        records = streaming.paths_from(stdin, b"\0" if args.null_separated else b"\n")
+
+    failed = False
+    for result in streaming.stream_diffs(
+        _command_from(args),
+        records,
+        repo_root=args.repo_root,
+        jobs=args.jobs or os.cpu_count() or 1,
+        max_in_flight=args.max_in_flight,
+    ):
+        if result.diff is not None:
+            sys.stdout.buffer.write(result.diff.encode("utf-8", "surrogateescape"))
+            sys.stdout.flush()
+        if result.error is not None:
+            failed = True
+            print("failed to process %s - %s" % (result.path, result.error), file=sys.stderr)
+
+    return 1 if failed else 0
+
+
+def _locate(args):
+    failed = False
+    for result in locate.locate(_command_from(args), args.paths, repo_root=args.repo_root):
+        for site in result.sites:
+            print(site.as_json())
+        if result.error is not None:
+            failed = True
+            print("failed to process %s - %s" % (result.path, result.error), file=sys.stderr)
+
+    return 1 if failed else 0
+
+
+def _daemon(args):
+    Daemon(args.socket_path, jobs=args.jobs).serve_forever()
+
+    return 0
+
+
+def _index(args):
+    index = FlagUsageIndex(
+        args.index_path or os.path.join(args.repo_root, DEFAULT_INDEX_PATH),
+        args.resolution_method_names,
+        repo_root=args.repo_root,
+    )
+    scanned_files = index.update(args.paths, jobs=args.jobs)
+    index.save()
+    print("scanned_files: %d" % scanned_files, file=sys.stderr)
+    json.dump(index.usage_counts(), sys.stdout, indent=2)
+    print()
+
+    return 0
+
+
+def _merge(args):
+    try:
+        report = sharding.merge_shard_results(args.shard_result_paths)
+    except ValueError as e:
+        raise SystemExit(str(e))
+
+    for path in sorted(report.diffs):
+        sys.stdout.write(report.diffs[path])
+    _print_report(report, args.report_json_path)
+
+    return 1 if report.counters["files_failed"] > 0 else 0
+
+
+def _shard_of(shard_spec):
+    try:
+        return sharding.parse_shard(shard_spec)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def _command_from(args):
+    if args.flags_config_path is not None:
+        with open(args.flags_config_path) as flags_config_file:
+            flags = json.load(flags_config_file)
+    elif args.flag_name is not None and args.flag_resolution_methods is not None:
+        flags = [{"flagName": args.flag_name, "flagResolutionMethods": args.flag_resolution_methods, "mode": args.mode}]
+    else:
+        raise SystemExit("either --flags-config or both --flag-name and --method-name must be passed")
+
+    ignore_rules = IgnoreRules(
+        include_globs=args.include_globs,
+        exclude_globs=args.exclude_globs,
+        include_regexes=args.include_regexes,
+        exclude_regexes=args.exclude_regexes,
+    )
+    flag_aliases_by_module = None
+    if args.follow_reexports:
+        import_graph = ImportGraph(
+            args.import_graph_path or os.path.join(args.repo_root, DEFAULT_IMPORT_GRAPH_PATH), repo_root=args.repo_root
+        )
+        import_graph.update([args.repo_root])
+        import_graph.save()
+        flag_aliases_by_module = import_graph.flag_aliases_by_module(f["flagName"] for f in flags)
+
+    return MultiFlagPiranhaCommand(
+        CodemodContext(),
+        flags,
+        ignored_module_check_fn_path=args.ignored_module_check_fn_path,
+        ignore_rules=ignore_rules,
+        flag_aliases_by_module=flag_aliases_by_module,
+        cleanup=args.cleanup,
+        followed_by=args.followed_by,
+    )
+
+
+def _resolution_method_names_of(command):
+    return [m for flag in command.configuration()["flags"] for m in _method_names_in(flag["flagResolutionMethods"])]
+
+
+def _method_names_in(flag_resolution_methods):
+    if isinstance(flag_resolution_methods, str):
+        return [flag_resolution_methods]
+
+    return [m["methodName"] for m in flag_resolution_methods]
+
+
+def _within(paths, requested_paths):
+    requested_paths = [os.path.abspath(p) for p in requested_paths]
+    return [p for p in paths if is_within_any(os.path.abspath(p), requested_paths)]
+
+
+def _print_report(report, report_json_path):
+    for name, value in report.counters.items():
+        print("%s: %d" % (name, value), file=sys.stderr)
+    if report.confirmation_rate() is not None:
+        print("confirmation_rate: %.1f%%" % (report.confirmation_rate() * 100), file=sys.stderr)
+    for path, error in sorted(report.failures.items()):
+        print("failed to process %s - %s" % (path, error), file=sys.stderr)
+
+    if report_json_path is not None:
+        with open(report_json_path, "w") as report_file:
+            json.dump(report.as_dict(), report_file, indent=2, sort_keys=True)
+
+
+def _print_queue_depths(queue_depths):
+    for name, depths in queue_depths.as_dict().items():
+        print(
+            "%s_queue_depth: mean %.1f, max %d of %d" % (name, depths["mean"], depths["max"], depths["capacity"]),
+            file=sys.stderr,
+        )
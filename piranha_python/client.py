@@ -0,0 +1,111 @@
+"""Thin client of the piranha daemon.
+
+It only depends on the standard library, so sending a request costs little more than starting the interpreter.
+"""
+import argparse
+import json
+import os
+import socket
+import sys
+
+DEFAULT_SOCKET_PATH = os.path.join(".piranha", "daemon.sock")
+
+
+def request(payload, socket_path=DEFAULT_SOCKET_PATH):
+    """Send a request to the daemon listening on the given socket and return its response."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client_socket:
+        client_socket.connect(socket_path)
+        client_socket.sendall(json.dumps(payload).encode("utf-8") + b"\n")
+        with client_socket.makefile("rb") as response_file:
+            response = json.loads(response_file.readline())
+
+    if "error" in response:
+        raise RuntimeError(response["error"])
+
+    return response
+
+
+def main(argv=None):
+    """Ask the piranha daemon to process the given files and print their unified diffs."""
+    arg_parser = argparse.ArgumentParser(
+        prog="piranha-client", description="Send files to a running 'piranha daemon' and print their diffs"
+    )
+    arg_parser.add_argument("--socket", dest="socket_path", default=DEFAULT_SOCKET_PATH, help="Socket of the daemon")
+    arg_parser.add_argument("--flag-name", dest="flag_name", metavar="FLAG_NAME", help="Name of the feature flag")
+    arg_parser.add_argument(
+        "--method-name",
+        dest="flag_resolution_methods",
+        metavar="METHOD_NAME",
+        help="Name of the method used to resolve the flag value",
+    )
+    arg_parser.add_argument(
+        "--mode", dest="mode", default="treated", help="Execution mode - can be 'treated' or 'control'"
+    )
+    arg_parser.add_argument(
+        "--flags-config",
+        dest="flags_config_path",
+        metavar="FLAGS_CONFIG_PATH",
+        help="Path to a JSON file listing several flags to be processed at once",
+    )
+    arg_parser.add_argument(
+        "--ignored-module-check-path",
+        dest="ignored_module_check_fn_path",
+        metavar="IGNORED_MODULE_CHECK_FN_PATH",
+        help="Path to a function that says whether a given module should be ignored given its full dotted path",
+    )
+    arg_parser.add_argument(
+        "--cleanup",
+        dest="cleanup",
+        action="store_true",
+        help="Also remove the imports, assignments and blocks left unused by the removal of the flags",
+    )
+    arg_parser.add_argument(
+        "--then",
+        dest="followed_by",
+        metavar="TRANSFORM_PATH",
+        action="append",
+        default=[],
+        help="Path to a libcst codemod or transformer run over each file the flags were removed from. "
+        "May be passed several times",
+    )
+    arg_parser.add_argument("--repo-root", dest="repo_root", default=".", help="Root used to compute module names")
+    arg_parser.add_argument("--shutdown", dest="shutdown", action="store_true", help="Stop the daemon")
+    arg_parser.add_argument("paths", metavar="PATH", nargs="*", help="Files or directories to be processed")
+    args = arg_parser.parse_args(argv)
+
+    if args.shutdown:
+        request({"command": "shutdown"}, args.socket_path)
+        return 0
+
+    if args.flags_config_path is not None:
+        with open(args.flags_config_path) as flags_config_file:
+            flags = json.load(flags_config_file)
+    elif args.flag_name is not None and args.flag_resolution_methods is not None:
+        flags = [{"flagName": args.flag_name, "flagResolutionMethods": args.flag_resolution_methods, "mode": args.mode}]
+    else:
+        arg_parser.error("either --flags-config or both --flag-name and --method-name must be passed")
+
+    response = request(
+        {
+            "flags": flags,
+            "ignoredModuleCheckFnPath": args.ignored_module_check_fn_path,
+            "cleanup": args.cleanup,
+            "followedBy": args.followed_by,
+            "repoRoot": os.path.abspath(args.repo_root),
+            "paths": [os.path.abspath(p) for p in args.paths],
+        },
+        args.socket_path,
+    )
+    failed = False
+    for result in response["results"]:
+        if result["diff"] is not None:
+            sys.stdout.write(result["diff"])
+        if result["error"] is not None:
+            failed = True
+            print("failed to process %s - %s" % (result["path"], result["error"]), file=sys.stderr)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
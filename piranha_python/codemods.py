@@ -1,30 +1,59 @@
+import dataclasses
 import functools
 import importlib.util
-
-from libcst import FlattenSentinel, RemoveFromParent, matchers
-from libcst.codemod import VisitorBasedCodemodCommand
-
-
-class PiranhaCommand(VisitorBasedCodemodCommand):
-    DESCRIPTION = "Removes feature flag usages from code whilst trying to preserve the implementation's behavior"
+import json
+import re
+
+from libcst import (
+    Assign,
+    Attribute,
+    BaseNumber,
+    BaseStatement,
+    BooleanOperation,
+    Call,
+    Comparison,
+    ConcatenatedString,
+    CSTTransformer,
+    Dict,
+    DictElement,
+    Element,
+    Else,
+    FlattenSentinel,
+    If,
+    Import,
+    ImportFrom,
+    ImportStar,
+    IndentedBlock,
+    List,
+    MaybeSentinel,
+    Name,
+    Not,
+    RemoveFromParent,
+    Return,
+    Set,
+    SimpleStatementLine,
+    SimpleString,
+    Tuple,
+    UnaryOperation,
+)
+from libcst.codemod import Codemod, SkipFile, VisitorBasedCodemodCommand
+from libcst.metadata import MetadataWrapper, ScopeProvider
+from piranha_python.ignore import IgnoreRules
+
+
+class MultiFlagPiranhaCommand(VisitorBasedCodemodCommand):
+    DESCRIPTION = "Removes usages of several feature flags from code in a single pass over each module"
     DEFAULT_TEST_MODULE_CHECK_PATH = "piranha_python.codemods._is_test_module"
 
     @staticmethod
     def add_args(arg_parser):  # pragma: no cover
         arg_parser.add_argument(
-            "--flag-name",
-            dest="flag_name",
-            metavar="FLAG_NAME",
-            help="Name of the feature flag to be processed",
-            type=str,
-            required=True,
-        )
-        arg_parser.add_argument(
-            "--method-name",
-            dest="flag_resolution_methods",
-            metavar="METHOD_NAME",
-            help="Name of the method used to resolve the flag value",
-            type=str,
+            "--flags-config",
+            dest="flags",
+            metavar="FLAGS_CONFIG_PATH",
+            help="Path to a JSON file listing the flags to be processed, e.g. "
+            '[{"flagName": "MY_FLAG", "flagResolutionMethods": "is_flag_active", "mode": "treated"}]',
+            type=_flags_from_json_file,
             required=True,
         )
         arg_parser.add_argument(
@@ -36,196 +65,741 @@ class PiranhaCommand(VisitorBasedCodemodCommand):
             required=False,
         )
         arg_parser.add_argument(
-            "--mode",
-            dest="mode",
-            metavar="MODE",
-            help="Execution mode - can be 'treated' or 'control'",
-            type=str,
-            required=False,
+            "--cleanup",
+            dest="cleanup",
+            help="Also remove the imports, assignments and blocks left unused by the removal of the flags",
+            action="store_true",
+        )
+        arg_parser.add_argument(
+            "--then",
+            dest="followed_by",
+            metavar="TRANSFORM_PATH",
+            help="Path to a libcst codemod or transformer run over each module the flags were removed from, "
+            "before it's written back. May be passed several times",
+            action="append",
         )
 
-    def __init__(self, context, flag_name, flag_resolution_methods, ignored_module_check_fn_path=None, mode="treated"):
+    def __init__(
+        self,
+        context,
+        flags,
+        ignored_module_check_fn_path=None,
+        ignore_rules=None,
+        flag_aliases_by_module=None,
+        cleanup=False,
+        followed_by=None,
+    ):
         super().__init__(context)
-        if mode not in ("treated", "control"):
-            raise ValueError("mode parameter must be 'treated' or 'control' - '%s' was passed" % mode)
-
-        self.flag_name = flag_name
-        self.is_in_feature_flag_block = False
-        self.found_return_stmt_in_ff_block = False
-        self.running_in_treated_mode = mode == "treated"
+        if len(flags) == 0:
+            raise ValueError("at least one flag must be passed")
+
+        self.flags = [_normalized_flag(f) for f in flags]
+        self._if_flag_values = []
+        self._returned_blocks = [False]
+        self.replacements = 0
+        self.cleanup = cleanup
+        self._statements_by_id = {}
+        self._dropped_subtrees = []
+        self._dropped_node_ids = set()
+        self._augmented_name_ids = set()
+        self.followed_by = [_path_of(t) for t in followed_by or []]
+        self._followers = [_Follower(context, _function_at(p)) for p in self.followed_by]
 
         if ignored_module_check_fn_path is None:
             ignored_module_check_fn_path = self.DEFAULT_TEST_MODULE_CHECK_PATH
-        loaded_ignore_function_module = importlib.import_module(_parent_of(ignored_module_check_fn_path))
-        self._ignore_module = loaded_ignore_function_module.__getattribute__(
-            _last_part_of(ignored_module_check_fn_path)
+        self.ignored_module_check_fn_path = ignored_module_check_fn_path
+        self._ignore_module = _function_at(ignored_module_check_fn_path)
+        self.ignore_rules = ignore_rules if ignore_rules is not None else IgnoreRules()
+
+        self.flag_names = frozenset(f["flagName"] for f in self.flags)
+        self.flag_aliases_by_module = flag_aliases_by_module or {}
+        self._module_flag_aliases = {}
+        self.referencing_names = self.flag_names.union(n for a in self.flag_aliases_by_module.values() for n in a)
+        self._flag_names_pattern = re.compile(
+            b"|".join(re.escape(n.encode("utf-8")) for n in sorted(self.referencing_names))
         )
+        self._flag_values_by_receiver_by_method = _flag_values_by_receiver_by_method(self.flags)
+        self.resolution_method_names = frozenset(self._flag_values_by_receiver_by_method)
+        self._local_flag_names = {n: n for n in self.flag_names}
+
+        self.forget_dispatched_methods()
+
+    def configuration(self):
+        return {
+            "flags": self.flags,
+            "ignoredModuleCheckFnPath": self.ignored_module_check_fn_path,
+            "ignoreRules": self.ignore_rules.as_dict(),
+            "flagAliasesByModule": self.flag_aliases_by_module,
+            "cleanup": self.cleanup,
+            "followedBy": self.followed_by,
+        }
+
+    def may_reference_flags(self, source):
+        return self._flag_names_pattern.search(source) is not None
+
+    def is_module_ignored(self, full_module_name):
+        return self._ignore_module(full_module_name)
+
+    def flag_imports_of(self, import_node):
+        if isinstance(import_node.names, ImportStar):
+            return []
+
+        if isinstance(import_node, ImportFrom):
+            flag_imports = [(n, self._flag_name_imported_by(n)) for n in import_node.names]
+            flag_imports = [(n, flag_name) for n, flag_name in flag_imports if flag_name is not None]
+        else:
+            flag_imports = [(n, self._flag_name_within(n.name)) for n in import_node.names]
+            flag_imports = [(n, flag_name) for n, flag_name in flag_imports if flag_name is not None]
 
-        if isinstance(flag_resolution_methods, str):
-            self.method_resolution_name = flag_resolution_methods
-            self.is_treatment_method = True
+        for n, flag_name in flag_imports:
+            if n.asname is not None:
+                self._local_flag_names[n.asname.name.value] = flag_name
+
+        return flag_imports
+
+    def flag_names_assigned_by(self, assign_node):
+        if _is_tuple_assignment(assign_node):
+            assignee_names = [e.value for e in assign_node.targets[0].target.elements]
         else:
-            self.method_resolution_name = flag_resolution_methods[0]["methodName"]
-            self.is_treatment_method = flag_resolution_methods[0]["flagType"] == "treatment"
+            assignee_names = [t.target for t in assign_node.targets]
 
-        self.flag_resolution_matcher = matchers.Call(
-            func=matchers.Name(self.method_resolution_name),
-            args=matchers.MatchIfTrue(functools.partial(_matches_flag_name, self.flag_name)),
-        )
+        return [self._flag_name_of(n.value) for n in assignee_names if self._is_flag_name(n)]
+
+    def flag_check_of(self, test):
+        if isinstance(test, UnaryOperation) and isinstance(test.operator, Not):
+            flag_check = self._flag_check_of(test.expression)
+            return None if flag_check is None else (flag_check[0], not flag_check[1])
+
+        return self._flag_check_of(test)
+
+    def enter_module(self, full_module_name):
+        self._module_flag_aliases = self.flag_aliases_by_module.get(full_module_name, {})
+        self._local_flag_names.update(self._module_flag_aliases)
+
+    def forget_flag_aliases(self):
+        self._module_flag_aliases = {}
+        self._local_flag_names.clear()
+        self._local_flag_names.update((n, n) for n in self.flag_names)
+
+    def transform_module(self, tree):
+        # Modules are parsed for a single transform, so they're visited as they are instead of being deep copied first.
+        # The state of a traversal that raised midway is dropped too, as the command is reused for the next module
+        self.replacements = 0
+        self._reset_traversal_state()
+        previous_wrapper = self.context.wrapper
+        wrapper = MetadataWrapper(tree, unsafe_skip_copy=True)
+        with self.resolve(wrapper):
+            self.context = dataclasses.replace(self.context, wrapper=wrapper)
+            try:
+                tree = self.transform_module_impl(wrapper.module)
+            finally:
+                self.context = dataclasses.replace(self.context, wrapper=previous_wrapper)
+
+        # The transforms following the flags' removal are handed the tree it produced, so however many of them there
+        # are, a module is still parsed and generated once
+        if self.replacements > 0:
+            for follower in self._followers:
+                tree = follower.transform_module(self.context, tree)
+
+        return tree
+
+    # The visitor hooks below dispatch straight to the visit and leave methods, looked up once per node type, skipping
+    # the matcher decorator machinery libcst otherwise runs on every node, since no matcher decorators are used here
+
+    def forget_dispatched_methods(self):
+        """Look the visit and leave methods up again on the next nodes, e.g. after they were wrapped."""
+        self._visit_methods = {}
+        self._leave_methods = {}
+        self._visit_attribute_methods = {}
+        self._leave_attribute_methods = {}
+
+    def on_visit(self, node):
+        node_type = type(node)
+        if node_type not in self._visit_methods:
+            self._visit_methods[node_type] = getattr(self, "visit_" + node_type.__name__, None)
+
+        visit_method = self._visit_methods[node_type]
+        return visit_method is None or visit_method(node) is not False
+
+    def on_leave(self, original_node, updated_node):
+        # Statements following a flattened flag check whose kept branch returns, in the same block, are unreachable
+        if self._returned_blocks[-1] and isinstance(original_node, BaseStatement):
+            self.replacements += 1
+            self._dropped(original_node)
+            return RemoveFromParent()
+
+        node_type = type(original_node)
+        if node_type not in self._leave_methods:
+            self._leave_methods[node_type] = getattr(self, "leave_" + node_type.__name__, None)
+
+        leave_method = self._leave_methods[node_type]
+        return updated_node if leave_method is None else leave_method(original_node, updated_node)
+
+    def on_visit_attribute(self, node, attribute):
+        key = (type(node), attribute)
+        if key not in self._visit_attribute_methods:
+            self._visit_attribute_methods[key] = getattr(self, "visit_%s_%s" % (key[0].__name__, attribute), None)
+
+        visit_method = self._visit_attribute_methods[key]
+        if visit_method is not None:
+            visit_method(node)
+
+    def on_leave_attribute(self, original_node, attribute):
+        key = (type(original_node), attribute)
+        if key not in self._leave_attribute_methods:
+            self._leave_attribute_methods[key] = getattr(self, "leave_%s_%s" % (key[0].__name__, attribute), None)
+
+        leave_method = self._leave_attribute_methods[key]
+        if leave_method is not None:
+            leave_method(original_node)
 
     def visit_Module(self, node):
-        return self.flag_name in node.code and not self._ignore_module(self.context.full_module_name)
+        if self.is_module_ignored(self.context.full_module_name):
+            return False
+
+        self.replacements = 0
+        self.enter_module(self.context.full_module_name)
+        return True
 
     def leave_Module(self, original_node, updated_node):
-        self.flag_resolution_matcher = matchers.Call(
-            func=matchers.Name(self.method_resolution_name),
-            args=matchers.MatchIfTrue(functools.partial(_matches_flag_name, self.flag_name)),
-        )
+        if self.cleanup:
+            updated_node = updated_node.with_changes(body=self._cleaned_up(updated_node.body, in_function=False))
+        self._reset_traversal_state()
 
         return updated_node
 
     def leave_ImportFrom(self, original_node, updated_node):
-        aliased_flag_name = self._aliased_flag_name_from_import(updated_node)
-        if aliased_flag_name is not None:
-            self.flag_resolution_matcher = matchers.Call(
-                func=matchers.Name(self.method_resolution_name),
-                args=matchers.MatchIfTrue(functools.partial(_matches_flag_name, aliased_flag_name)),
-            )
+        if isinstance(updated_node.names, ImportStar):
+            return updated_node
 
+        flag_imports_nodes = self.flag_imports_of(updated_node)
+        if len(flag_imports_nodes) == 0:
+            return updated_node
+
+        self.replacements += 1
         imported_names_after_removing_flag = [
-            n for n in updated_node.names if not matchers.matches(n.name, matchers.Name(self.flag_name))
+            n for n in updated_node.names if all(n is not flag_node for flag_node, _ in flag_imports_nodes)
         ]
         if len(imported_names_after_removing_flag) == 0:
             return RemoveFromParent()
 
-        return updated_node.with_changes(names=imported_names_after_removing_flag)
+        return _with_names(updated_node, imported_names_after_removing_flag)
 
     def leave_Import(self, original_node, updated_node):
-        flag_imports_nodes = [
-            n for n in updated_node.names if len(matchers.findall(n.name, matchers.Name(self.flag_name))) > 0
-        ]
-        if len(flag_imports_nodes) > 0 and flag_imports_nodes[0].asname is not None:
-            aliased_flag_name = flag_imports_nodes[0].asname.name.value
-            self.flag_resolution_matcher = matchers.Call(
-                func=matchers.Name(self.method_resolution_name),
-                args=matchers.MatchIfTrue(functools.partial(_matches_flag_name, aliased_flag_name)),
-            )
+        flag_imports_nodes = self.flag_imports_of(updated_node)
+        if len(flag_imports_nodes) == 0:
+            return updated_node
 
+        self.replacements += 1
         imported_names_after_removing_flag = [
-            n for n in updated_node.names if len(matchers.findall(n.name, matchers.Name(self.flag_name))) == 0
+            n for n in updated_node.names if all(n is not flag_node for flag_node, _ in flag_imports_nodes)
         ]
         if len(imported_names_after_removing_flag) == 0:
             return RemoveFromParent()
 
-        return updated_node.with_changes(names=imported_names_after_removing_flag)
+        return _with_names(updated_node, imported_names_after_removing_flag)
 
     def leave_FunctionDef(self, original_node, updated_node):
-        self._reset_traversal_state()
+        if self.cleanup and isinstance(updated_node.body, IndentedBlock):
+            body = self._cleaned_up(updated_node.body.body, in_function=True)
+            if body is not updated_node.body.body:
+                updated_node = updated_node.with_changes(body=updated_node.body.with_changes(body=body))
 
         return updated_node
 
     def leave_Assign(self, original_node, updated_node):
+        if len(self.flag_names_assigned_by(updated_node)) == 0:
+            return updated_node
+
+        self.replacements += 1
         if _is_tuple_assignment(updated_node):
             return self._updated_tuple_assignment(updated_node)
 
-        targets_without_flag = [
-            t for t in updated_node.targets if not matchers.matches(t.target, matchers.Name(self.flag_name))
-        ]
+        targets_without_flag = [t for t in updated_node.targets if not self._is_flag_name(t.target)]
         if len(targets_without_flag) == 0:
+            self._dropped(original_node)
             return RemoveFromParent()
 
         return updated_node.with_changes(targets=targets_without_flag)
 
+    def visit_IndentedBlock(self, node):
+        self._returned_blocks.append(False)
+
+    def leave_IndentedBlock(self, original_node, updated_node):
+        self._returned_blocks.pop()
+
+        return updated_node
+
     def visit_If(self, node):
-        self.is_in_feature_flag_block = len(matchers.findall(node.test, self.flag_resolution_matcher)) > 0
-        return True
+        flag_check = self.flag_check_of(node.test)
+        self._if_flag_values.append(None if flag_check is None else flag_check[1])
 
     def leave_If(self, original_node, updated_node):
-        if not self.is_in_feature_flag_block:
-            return updated_node
+        flag_value = self._if_flag_values.pop()
+        if flag_value is None:
+            return self._without_empty_blocks(original_node, updated_node) if self.cleanup else updated_node
+
+        self.replacements += 1
+        if not flag_value and updated_node.orelse is None:
+            self._dropped(original_node)
+            return RemoveFromParent()
 
-        if self._should_assume_that_flag_is_true():
-            if matchers.matches(updated_node.test, self.flag_resolution_matcher):
-                replaced_node = updated_node.body
-            elif matchers.matches(updated_node.test, _inside_not_matcher(self.flag_resolution_matcher)):
-                replaced_node = updated_node.orelse.body
-            else:
-                return updated_node
+        if not flag_value and isinstance(updated_node.orelse, If):
+            # The ELIF branch still depends on its own condition, so it's kept as an IF statement of its own
+            self._dropped(original_node, kept=original_node.orelse)
+            return updated_node.orelse.with_changes(leading_lines=updated_node.leading_lines)
+
+        if flag_value:
+            replaced_node = updated_node.body
+            self._dropped(original_node, kept=original_node.body)
         else:
-            if matchers.matches(updated_node.test, self.flag_resolution_matcher):
-                replaced_node = updated_node.orelse.body
-            elif matchers.matches(updated_node.test, _inside_not_matcher(self.flag_resolution_matcher)):
-                replaced_node = updated_node.body
-            else:
-                return updated_node
+            replaced_node = updated_node.orelse.body
+            self._dropped(original_node, kept=original_node.orelse.body)
+
+        kept_statements = replaced_node.body
+        if len(kept_statements) > 0 and _ends_in_return(kept_statements[-1]):
+            self._returned_blocks[-1] = True
 
-        return_statements = matchers.findall(replaced_node, matchers.Return())
-        self.found_return_stmt_in_ff_block = len(return_statements) > 0
+        return FlattenSentinel(kept_statements)
 
-        self.is_in_feature_flag_block = False
-        return FlattenSentinel(replaced_node.body)
+    def leave_AugAssign(self, original_node, updated_node):
+        if self.cleanup and isinstance(original_node.target, Name):
+            self._augmented_name_ids.add(id(original_node.target))
+
+        return updated_node
 
     def leave_SimpleStatementLine(self, original_node, updated_node):
-        if self.found_return_stmt_in_ff_block:
-            return RemoveFromParent()
+        if self.cleanup and len(updated_node.body) == 1 and _may_be_left_unused(original_node.body[0]):
+            self._statements_by_id[id(updated_node)] = (updated_node, original_node)
 
         return updated_node
 
     def _reset_traversal_state(self):
-        self.is_in_feature_flag_block = False
-        self.found_return_stmt_in_ff_block = False
+        self._if_flag_values.clear()
+        self._returned_blocks[:] = [False]
+        self._statements_by_id.clear()
+        self._dropped_subtrees.clear()
+        self._dropped_node_ids.clear()
+        self._augmented_name_ids.clear()
+        self.forget_flag_aliases()
+
+    # With cleanup on, the parts of the original tree dropped along with the flags are remembered, so that when a scope
+    # is left its imports and assignments whose every reference was dropped can be told apart by the scope metadata,
+    # which is only computed for modules that had something dropped
+
+    def _dropped(self, original_node, kept=None):
+        if self.cleanup:
+            self._dropped_subtrees.append((original_node, kept))
+
+    def _cleaned_up(self, statements, in_function):
+        candidates = [self._statements_by_id.get(id(s), (None, None)) for s in statements]
+        candidates = [(s, original) for s, (updated, original) in zip(statements, candidates) if s is updated]
+        if len(candidates) == 0 or len(self._dropped_subtrees) + len(self._dropped_node_ids) == 0:
+            return statements
+
+        scopes = self.context.wrapper.resolve(ScopeProvider)
+        replacements = {}
+        cleaned_up_any = True
+        while cleaned_up_any:
+            # Removing a statement drops its references too, which may leave the statements before it unused
+            cleaned_up_any = False
+            dropped_node_ids = self._walked_dropped_subtrees()
+            for statement, original_statement in candidates:
+                current_statement = replacements.get(id(statement), statement)
+                if current_statement is None:
+                    continue
+
+                cleaned_up_statement = self._without_unused_bindings(
+                    current_statement, original_statement, scopes, dropped_node_ids, in_function
+                )
+                if cleaned_up_statement is not current_statement:
+                    replacements[id(statement)] = cleaned_up_statement
+                    cleaned_up_any = True
+                    self.replacements += 1
+                    if cleaned_up_statement is None:
+                        self._dropped(original_statement)
+
+        if len(replacements) == 0:
+            return statements
+
+        cleaned_up_statements = [replacements.get(id(s), s) for s in statements]
+        return [s for s in cleaned_up_statements if s is not None]
+
+    def _without_unused_bindings(self, statement, original_statement, scopes, dropped_node_ids, in_function):
+        small_statement = statement.body[0]
+        original_small_statement = original_statement.body[0]
+        if isinstance(original_small_statement, Assign):
+            if not in_function:
+                return statement
+
+            targets = [t.target for t in original_small_statement.targets]
+            is_unused = all(_is_left_unused(scopes, t, t.value, dropped_node_ids) for t in targets)
+            is_augmented = any(self._is_augmented(scopes, t, t.value) for t in targets)
+            return None if is_unused and not is_augmented else statement
+
+        # Names listed in a module's __all__ are used by other modules, which the scope metadata can't know about
+        if not in_function and len(scopes[original_small_statement].assignments["__all__"]) > 0:
+            return statement
+
+        kept_names = [
+            n
+            for n in small_statement.names
+            if not _is_left_unused(scopes, original_small_statement, _name_bound_by(n), dropped_node_ids)
+        ]
+        if len(kept_names) == len(small_statement.names):
+            return statement
+        if len(kept_names) == 0:
+            return None
+
+        return statement.with_changes(body=[_with_names(small_statement, kept_names)])
 
-    def _aliased_flag_name_from_import(self, updated_node):
-        flag_imports_nodes = [n for n in updated_node.names if matchers.matches(n.name, matchers.Name(self.flag_name))]
-        if len(flag_imports_nodes) > 0 and flag_imports_nodes[0].asname is not None:
-            return flag_imports_nodes[0].asname.name.value
+    def _without_empty_blocks(self, original_node, updated_node):
+        if isinstance(updated_node.orelse, Else) and len(updated_node.orelse.body.body) == 0:
+            self.replacements += 1
+            updated_node = updated_node.with_changes(orelse=None)
+
+        if len(updated_node.body.body) == 0 and updated_node.orelse is None and _is_side_effect_free(updated_node.test):
+            self.replacements += 1
+            self._dropped(original_node)
+            return RemoveFromParent()
+
+        return updated_node
+
+    def _is_augmented(self, scopes, binding_node, name):
+        # The scope metadata doesn't count the target of an augmented assignment as a read of the value it's bound to
+        return any(id(a.node) in self._augmented_name_ids for a in scopes[binding_node].assignments[name])
+
+    def _walked_dropped_subtrees(self):
+        for root, kept in self._dropped_subtrees:
+            nodes = [root]
+            while len(nodes) > 0:
+                node = nodes.pop()
+                if node is not kept and id(node) not in self._dropped_node_ids:
+                    self._dropped_node_ids.add(id(node))
+                    nodes.extend(node.children)
+        del self._dropped_subtrees[:]
+
+        return self._dropped_node_ids
+
+    def _is_flag_name(self, node):
+        return isinstance(node, Name) and (node.value in self.flag_names or node.value in self._module_flag_aliases)
+
+    def _flag_name_of(self, name):
+        return name if name in self.flag_names else self._module_flag_aliases.get(name)
+
+    def _flag_name_imported_by(self, import_alias):
+        if self._is_flag_name(import_alias.name):
+            return self._flag_name_of(import_alias.name.value)
+        if import_alias.asname is not None and self._is_flag_name(import_alias.asname.name):
+            return self._flag_name_of(import_alias.asname.name.value)
+
+        return None
+
+    def _flag_name_within(self, node):
+        while isinstance(node, Attribute):
+            if self._is_flag_name(node.attr):
+                return self._flag_name_of(node.attr.value)
+            node = node.value
+
+        if self._is_flag_name(node):
+            return self._flag_name_of(node.value)
 
         return None
 
+    def _flag_check_of(self, node):
+        if not isinstance(node, Call):
+            return None
+
+        # Keyed on the called method's name, so most calls are told apart from flag checks by a single lookup
+        if isinstance(node.func, Name):
+            flag_values_by_receiver = self._flag_values_by_receiver_by_method.get(node.func.value)
+            receiver = None
+        elif isinstance(node.func, Attribute):
+            flag_values_by_receiver = self._flag_values_by_receiver_by_method.get(node.func.attr.value)
+            receiver = _dotted_name_of(node.func.value)
+        else:
+            return None
+
+        if flag_values_by_receiver is None or len(node.args) == 0 or not isinstance(node.args[0].value, Name):
+            return None
+
+        flag_name = self._local_flag_names.get(node.args[0].value.value)
+        if flag_name is None:
+            return None
+
+        flag_value = flag_values_by_receiver.get(receiver, {}).get(flag_name) if receiver is not None else None
+        if flag_value is None:
+            flag_value = flag_values_by_receiver.get(None, {}).get(flag_name)
+
+        return None if flag_value is None else (flag_name, flag_value)
+
     def _updated_tuple_assignment(self, updated_node):
         assignee_tuple = updated_node.targets[0].target
-        assignee_tuple_children_without_flag = [
-            (i, c)
-            for i, c in enumerate(assignee_tuple.children)
-            if not matchers.matches(c.value, matchers.Name(self.flag_name))
-        ]
-        assignee_tuple_children_indices_without_flag = [i for i, _ in assignee_tuple_children_without_flag]
-        assigned_tuple = updated_node.value
+        assigned_value = updated_node.value
+        if not _unpacks_element_by_element(assignee_tuple, assigned_value):
+            # The values are only unpacked at runtime, so the flag's is still unpacked, into a throwaway name instead
+            return updated_node.with_changes(
+                targets=[
+                    updated_node.targets[0].with_changes(
+                        target=assignee_tuple.with_changes(
+                            elements=[
+                                e.with_changes(value=Name("_")) if self._is_flag_name(e.value) else e
+                                for e in assignee_tuple.elements
+                            ]
+                        )
+                    )
+                ]
+            )
+
+        kept_indices = [i for i, e in enumerate(assignee_tuple.elements) if not self._is_flag_name(e.value)]
+        if len(kept_indices) == 0:
+            return RemoveFromParent()
+
         return updated_node.with_changes(
             targets=[
                 updated_node.targets[0].with_changes(
-                    target=assignee_tuple.with_changes(
-                        elements=tuple([c for _, c in assignee_tuple_children_without_flag])
-                    )
+                    target=assignee_tuple.with_changes(elements=_elements_at(assignee_tuple.elements, kept_indices))
                 )
             ],
-            value=assigned_tuple.with_changes(
-                elements=tuple(
-                    [
-                        v
-                        for i, v in enumerate(assigned_tuple.children)
-                        if i in assignee_tuple_children_indices_without_flag
-                    ]
-                )
-            ),
+            value=assigned_value.with_changes(elements=_elements_at(assigned_value.elements, kept_indices)),
         )
 
-    def _should_assume_that_flag_is_true(self):
-        return (self.is_treatment_method and self.running_in_treated_mode) or (
-            not self.is_treatment_method and not self.running_in_treated_mode
+
+class _Follower:
+    def __init__(self, context, transform_class):
+        if isinstance(transform_class, type) and issubclass(transform_class, Codemod):
+            self._codemod = transform_class(context)
+            self._transformer = None
+        elif isinstance(transform_class, type) and issubclass(transform_class, CSTTransformer):
+            self._codemod = None
+            self._transformer = transform_class()
+        else:
+            raise ValueError("transforms must be libcst codemods or transformers - '%r' was passed" % transform_class)
+
+    def transform_module(self, context, tree):
+        if self._codemod is not None:
+            self._codemod.context = context
+            try:
+                return self._codemod.transform_module(tree)
+            except SkipFile:
+                return tree
+
+        if len(self._transformer.get_inherited_dependencies()) > 0:
+            return MetadataWrapper(tree).visit(self._transformer)
+        return tree.visit(self._transformer)
+
+
+class PiranhaCommand(MultiFlagPiranhaCommand):
+    DESCRIPTION = "Removes feature flag usages from code whilst trying to preserve the implementation's behavior"
+
+    @staticmethod
+    def add_args(arg_parser):  # pragma: no cover
+        arg_parser.add_argument(
+            "--flag-name",
+            dest="flag_name",
+            metavar="FLAG_NAME",
+            help="Name of the feature flag to be processed",
+            type=str,
+            required=True,
         )
+        arg_parser.add_argument(
+            "--method-name",
+            dest="flag_resolution_methods",
+            metavar="METHOD_NAME",
+            help="Name of the method used to resolve the flag value",
+            type=str,
+            required=True,
+        )
+        arg_parser.add_argument(
+            "--ignored-module-check-path",
+            dest="ignored_module_check_fn_path",
+            metavar="IGNORED_MODULE_CHECK_FN_PATH",
+            help="Path to a function that says whether a given module should be ignored given its full dotted path",
+            type=str,
+            required=False,
+        )
+        arg_parser.add_argument(
+            "--mode",
+            dest="mode",
+            metavar="MODE",
+            help="Execution mode - can be 'treated' or 'control'",
+            type=str,
+            required=False,
+        )
+        arg_parser.add_argument(
+            "--cleanup",
+            dest="cleanup",
+            help="Also remove the imports, assignments and blocks left unused by the removal of the flag",
+            action="store_true",
+        )
+        arg_parser.add_argument(
+            "--then",
+            dest="followed_by",
+            metavar="TRANSFORM_PATH",
+            help="Path to a libcst codemod or transformer run over each module the flag was removed from, "
+            "before it's written back. May be passed several times",
+            action="append",
+        )
+
+    def __init__(
+        self,
+        context,
+        flag_name,
+        flag_resolution_methods,
+        ignored_module_check_fn_path=None,
+        mode="treated",
+        ignore_rules=None,
+        flag_aliases_by_module=None,
+        cleanup=False,
+        followed_by=None,
+    ):
+        super().__init__(
+            context,
+            [{"flagName": flag_name, "flagResolutionMethods": flag_resolution_methods, "mode": mode}],
+            ignored_module_check_fn_path=ignored_module_check_fn_path,
+            ignore_rules=ignore_rules,
+            flag_aliases_by_module=flag_aliases_by_module,
+            cleanup=cleanup,
+            followed_by=followed_by,
+        )
+        self.flag_name = flag_name
 
 
-def _matches_flag_name(flag_name, n):
-    return matchers.matches(n[0].value, matchers.Name(flag_name))
+def _normalized_flag(flag):
+    mode = flag.get("mode") or "treated"
+    if mode not in ("treated", "control"):
+        raise ValueError("mode parameter must be 'treated' or 'control' - '%s' was passed" % mode)
 
+    return {"flagName": flag["flagName"], "flagResolutionMethods": flag["flagResolutionMethods"], "mode": mode}
 
-def _is_tuple_assignment(updated_node):
-    return len(updated_node.targets) == 1 and matchers.matches(
-        updated_node.targets[0].target, matchers.TypeOf(matchers.Tuple)
+
+def _flag_values_by_receiver_by_method(flags):
+    flag_values_by_receiver_by_method = {}
+    for flag in flags:
+        running_in_treated_mode = flag["mode"] == "treated"
+        flag_resolution_methods = flag["flagResolutionMethods"]
+        if isinstance(flag_resolution_methods, str):
+            flag_resolution_methods = [{"methodName": flag_resolution_methods, "flagType": "treatment"}]
+
+        for m in flag_resolution_methods:
+            flag_values = flag_values_by_receiver_by_method.setdefault(m["methodName"], {}).setdefault(
+                m.get("receiverType"), {}
+            )
+            flag_values[flag["flagName"]] = _should_assume_that_flag_is_true(
+                m["flagType"] == "treatment", running_in_treated_mode
+            )
+
+    return flag_values_by_receiver_by_method
+
+
+def _dotted_name_of(node):
+    if isinstance(node, Name):
+        return node.value
+    if isinstance(node, Attribute):
+        receiver = _dotted_name_of(node.value)
+        return None if receiver is None else receiver + "." + node.attr.value
+
+    return None
+
+
+def _ends_in_return(statement):
+    return isinstance(statement, SimpleStatementLine) and isinstance(statement.body[-1], Return)
+
+
+def _with_names(import_node, names):
+    # Trailing commas are only allowed within parentheses, so the comma of what used to be a middle name is dropped
+    if not isinstance(import_node, ImportFrom) or import_node.rpar is None:
+        names = names[:-1] + [names[-1].with_changes(comma=MaybeSentinel.DEFAULT)]
+
+    return import_node.with_changes(names=names)
+
+
+def _elements_at(elements, indices):
+    kept_elements = [elements[i] for i in indices]
+    # The comma that separated the last kept element from a removed one is dropped, letting libcst add the one a
+    # single element tuple needs
+    if indices[-1] != len(elements) - 1:
+        kept_elements[-1] = kept_elements[-1].with_changes(comma=MaybeSentinel.DEFAULT)
+
+    return kept_elements
+
+
+def _may_be_left_unused(small_statement):
+    if isinstance(small_statement, (Import, ImportFrom)):
+        return not isinstance(small_statement.names, ImportStar)
+    if isinstance(small_statement, Assign):
+        return all(isinstance(t.target, Name) for t in small_statement.targets) and _is_side_effect_free(
+            small_statement.value
+        )
+
+    return False
+
+
+def _is_left_unused(scopes, binding_node, name, dropped_node_ids):
+    assignments = [a for a in scopes[binding_node].assignments[name] if a.node is binding_node]
+    return len(assignments) > 0 and all(
+        len(a.references) > 0 and all(id(r.node) in dropped_node_ids for r in a.references) for a in assignments
     )
 
 
+def _name_bound_by(import_alias):
+    if import_alias.asname is not None:
+        return import_alias.asname.name.value
+
+    return _dotted_name_of(import_alias.name)
+
+
+def _is_side_effect_free(node):
+    if isinstance(node, (Name, BaseNumber, SimpleString)):
+        return True
+    if isinstance(node, ConcatenatedString):
+        return _is_side_effect_free(node.left) and _is_side_effect_free(node.right)
+    if isinstance(node, (Tuple, List, Set)):
+        return all(isinstance(e, Element) and _is_side_effect_free(e.value) for e in node.elements)
+    if isinstance(node, Dict):
+        return all(
+            isinstance(e, DictElement) and _is_side_effect_free(e.key) and _is_side_effect_free(e.value)
+            for e in node.elements
+        )
+    if isinstance(node, UnaryOperation):
+        return _is_side_effect_free(node.expression)
+    if isinstance(node, BooleanOperation):
+        return _is_side_effect_free(node.left) and _is_side_effect_free(node.right)
+    if isinstance(node, Comparison):
+        return _is_side_effect_free(node.left) and all(_is_side_effect_free(c.comparator) for c in node.comparisons)
+
+    return False
+
+
+def _should_assume_that_flag_is_true(is_treatment_method, running_in_treated_mode):
+    return (is_treatment_method and running_in_treated_mode) or (
+        not is_treatment_method and not running_in_treated_mode
+    )
+
+
+def _flags_from_json_file(path):  # pragma: no cover
+    with open(path) as flags_config_file:
+        return json.load(flags_config_file)
+
+
+def _path_of(transform):
+    if isinstance(transform, str):
+        return transform
+
+    return "%s.%s" % (transform.__module__, transform.__qualname__)
+
+
+def _unpacks_element_by_element(assignee_tuple, assigned_value):
+    if not isinstance(assigned_value, Tuple) or len(assigned_value.elements) != len(assignee_tuple.elements):
+        return False
+
+    return all(isinstance(e, Element) for e in assignee_tuple.elements + assigned_value.elements)
+
+
+def _is_tuple_assignment(updated_node):
+    return len(updated_node.targets) == 1 and isinstance(updated_node.targets[0].target, Tuple)
+
+
 def _is_test_module(full_module_name):
     if full_module_name is not None:
         filename = _last_part_of(full_module_name)
@@ -234,13 +808,14 @@ def _is_test_module(full_module_name):
     return False
 
 
+@functools.lru_cache(maxsize=None)
+def _function_at(function_path):
+    return importlib.import_module(_parent_of(function_path)).__getattribute__(_last_part_of(function_path))
+
+
 def _parent_of(module_test_function_path):
     return ".".join(module_test_function_path.split(".")[:-1])
 
 
 def _last_part_of(module_test_function_path):
     return module_test_function_path.split(".")[-1]
-
-
-def _inside_not_matcher(fn_call_matcher):
-    return matchers.UnaryOperation(operator=matchers.Not(), expression=fn_call_matcher)
@@ -0,0 +1,165 @@
+import collections
+import concurrent.futures
+import json
+import os
+import socket
+import socketserver
+import threading
+
+from libcst.codemod import CodemodContext
+from piranha_python import driver
+from piranha_python.client import DEFAULT_SOCKET_PATH
+from piranha_python.codemods import MultiFlagPiranhaCommand
+from piranha_python.ignore import IgnoreRules
+
+MAX_CACHED_COMMANDS = 16
+WARM_UP_SOURCE = b"from flags import WARM_UP_FLAG\nif is_flag_active(WARM_UP_FLAG):\n    print('warm')\n"
+WARM_UP_CONFIGURATION = {
+    "flags": [{"flagName": "WARM_UP_FLAG", "flagResolutionMethods": "is_flag_active", "mode": "treated"}]
+}
+
+_commands = collections.OrderedDict()
+_commands_lock = threading.Lock()
+_transform_lock = threading.Lock()
+
+
+class Daemon:
+    """Serves removal requests sent over a Unix domain socket with a pool of workers kept warm between requests.
+
+    Each request is a single line of JSON holding the flags, the paths and optionally the repo root, ignore rules and
+    module check function to be used, and is answered with a single line of JSON holding each file's diff.
+    Commands are built once per configuration and reused by later requests, both in the daemon and in its workers.
+    """
+
+    def __init__(self, socket_path=DEFAULT_SOCKET_PATH, jobs=None):
+        self.socket_path = socket_path
+        self.jobs = jobs or os.cpu_count() or 1
+        self._executor = None
+        self._server = None
+
+    def serve_forever(self):
+        _remove_stale_socket(self.socket_path)
+        os.makedirs(os.path.dirname(os.path.abspath(self.socket_path)), exist_ok=True)
+        if self.jobs > 1:
+            self._executor = concurrent.futures.ProcessPoolExecutor(self.jobs)
+            concurrent.futures.wait([self._executor.submit(_warm_up) for _ in range(self.jobs)])
+        else:
+            _warm_up()
+
+        self._server = _DaemonServer(self.socket_path, _RequestHandler)
+        self._server.piranha_daemon = self
+        os.chmod(self.socket_path, 0o600)
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            os.unlink(self.socket_path)
+            if self._executor is not None:
+                self._executor.shutdown()
+
+    def shutdown(self):
+        if self._server is not None:
+            threading.Thread(target=self._server.shutdown).start()
+
+    def handle(self, request):
+        if request.get("command") == "shutdown":
+            self.shutdown()
+            return {"results": []}
+
+        configuration = {
+            "flags": request["flags"],
+            "ignoredModuleCheckFnPath": request.get("ignoredModuleCheckFnPath"),
+            "ignoreRules": request.get("ignoreRules", {}),
+            "cleanup": request.get("cleanup", False),
+            "followedBy": request.get("followedBy", []),
+        }
+        repo_root = request.get("repoRoot", ".")
+        command = _command_for(configuration)
+        paths = [
+            p
+            for p in driver.python_files_in(request["paths"], command.ignore_rules, repo_root)
+            if not command.is_module_ignored(driver.full_module_name_of(p, repo_root))
+        ]
+        if self._executor is None or len(paths) < 2:
+            results = [_diffed(configuration, path, repo_root) for path in paths]
+        else:
+            results = list(self._executor.map(_diffed, [configuration] * len(paths), paths, [repo_root] * len(paths)))
+
+        return {"results": results}
+
+
+class _DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            response = self.server.piranha_daemon.handle(json.loads(self.rfile.readline()))
+        except Exception as e:
+            response = {"error": "%s: %s" % (type(e).__name__, e)}
+
+        self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+
+
+def _command_for(configuration):
+    key = json.dumps(configuration, sort_keys=True)
+    with _commands_lock:
+        command = _commands.get(key)
+        if command is not None:
+            _commands.move_to_end(key)
+            return command
+
+    command = MultiFlagPiranhaCommand(
+        CodemodContext(),
+        configuration["flags"],
+        ignored_module_check_fn_path=configuration.get("ignoredModuleCheckFnPath"),
+        ignore_rules=IgnoreRules.from_dict(configuration.get("ignoreRules", {})),
+        flag_aliases_by_module=configuration.get("flagAliasesByModule"),
+        cleanup=configuration.get("cleanup", False),
+        followed_by=configuration.get("followedBy"),
+    )
+    with _commands_lock:
+        _commands[key] = command
+        while len(_commands) > MAX_CACHED_COMMANDS:
+            _commands.popitem(last=False)
+
+    return command
+
+
+def _diffed(configuration, path, repo_root):
+    try:
+        with open(path, "rb") as source_file:
+            source = source_file.read()
+    except OSError as e:
+        return {"path": path, "status": driver.FAILED, "diff": None, "error": "%s: %s" % (type(e).__name__, e)}
+
+    command = _command_for(configuration)
+    # Commands keep traversal state while transforming a module, so requests served by the daemon's own threads
+    # must take turns - the lock is never contended in workers, which handle one file at a time
+    with _transform_lock:
+        result = driver.transform_source(command, path, source, driver.full_module_name_of(path, repo_root))
+
+    diff = None
+    if result.status == driver.CHANGED:
+        diff = driver.unified_diff(path, source, result.transformed_source, repo_root)
+    return {"path": path, "status": result.status, "diff": diff, "error": result.error}
+
+
+def _warm_up():
+    command = _command_for(WARM_UP_CONFIGURATION)
+    driver.transform_source(command, "warm_up.py", WARM_UP_SOURCE)
+
+
+def _remove_stale_socket(socket_path):
+    if not os.path.exists(socket_path):
+        return
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client_socket:
+        try:
+            client_socket.connect(socket_path)
+        except OSError:
+            os.unlink(socket_path)
+            return
+
+    raise RuntimeError("a daemon is already listening on %s" % socket_path)
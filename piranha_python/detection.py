@@ -0,0 +1,68 @@
+"""Fast detection of the modules a removal would actually change, using the standard library's parser.
+
+Building a libcst tree costs many times more than ``ast.parse``, and many of the files mentioning a flag's name never
+check, assign or import it, so only the modules confirmed here are worth transforming. Detection errs on the side of
+confirming: it ignores receiver types and confirms any module the standard library can't parse, leaving it to libcst.
+"""
+import ast
+
+
+def confirms_flag_usage(command, source, full_module_name=None):
+    """Tell whether a module has any flag check, assignment or import the command may remove."""
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return True
+
+    flag_names = command.flag_names.union(command.flag_aliases_by_module.get(full_module_name, {}))
+    for node in ast.walk(tree):
+        node_type = type(node)
+        if node_type is ast.If:
+            if _is_flag_check(node.test, flag_names, command.resolution_method_names):
+                return True
+        elif node_type is ast.ImportFrom:
+            if any(a.name in flag_names or a.asname in flag_names for a in node.names):
+                return True
+        elif node_type is ast.Import:
+            if any(not flag_names.isdisjoint(a.name.split(".")) for a in node.names):
+                return True
+        elif node_type is ast.Assign:
+            if any(_assigns_any_of(flag_names, t) for t in node.targets):
+                return True
+
+    return False
+
+
+def _is_flag_check(test, flag_names, resolution_method_names):
+    if isinstance(test, ast.UnaryOp) and isinstance(test.op, ast.Not):
+        test = test.operand
+    if not isinstance(test, ast.Call):
+        return False
+
+    if isinstance(test.func, ast.Name):
+        method_name = test.func.id
+    elif isinstance(test.func, ast.Attribute):
+        method_name = test.func.attr
+    else:
+        return False
+
+    # Flags imported under other names are confirmed through their import, so only the flag names are looked for
+    if method_name not in resolution_method_names:
+        return False
+    if len(test.args) > 0:
+        flag_arg = test.args[0].value if isinstance(test.args[0], ast.Starred) else test.args[0]
+    elif len(test.keywords) > 0:
+        flag_arg = test.keywords[0].value
+    else:
+        return False
+
+    return isinstance(flag_arg, ast.Name) and flag_arg.id in flag_names
+
+
+def _assigns_any_of(flag_names, target):
+    if isinstance(target, ast.Name):
+        return target.id in flag_names
+    if isinstance(target, (ast.Tuple, ast.List)):
+        return any(isinstance(e, ast.Name) and e.id in flag_names for e in target.elts)
+
+    return False
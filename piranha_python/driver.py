@@ -0,0 +1,489 @@
+import bisect
+import collections
+import contextlib
+import difflib
+import hashlib
+import mmap
+import os
+import stat
+import tempfile
+
+from libcst import parse_module
+from libcst.codemod import CodemodContext, SkipFile
+from piranha_python.cache import configuration_fingerprint
+from piranha_python.detection import confirms_flag_usage
+from piranha_python.ignore import relative_path_of
+from piranha_python.profiling import timed_phase
+
+SKIPPED_BY_PREFILTER = "skipped_by_prefilter"
+SKIPPED_BY_DETECTION = "skipped_by_detection"
+IGNORED = "ignored"
+UNCHANGED = "unchanged"
+CHANGED = "changed"
+FAILED = "failed"
+MATCHING_BUDGET_PER_LINE = 8
+
+
+class FileResult:
+    def __init__(
+        self,
+        path,
+        status,
+        transformed_source=None,
+        error=None,
+        from_cache=False,
+        profile=None,
+        edits=None,
+        source_digest=None,
+        confirmed=None,
+        from_verdict_store=False,
+        diff=None,
+    ):
+        self.path = path
+        self.status = status
+        self.transformed_source = transformed_source
+        self.error = error
+        self.from_cache = from_cache
+        self.profile = profile
+        self.edits = edits
+        self.source_digest = source_digest
+        self.confirmed = confirmed
+        self.from_verdict_store = from_verdict_store
+        self.diff = diff
+
+
+class RunReport:
+    COUNTERS = (
+        "files_processed",
+        "files_skipped_by_prefilter",
+        "files_skipped_by_detection",
+        "files_ignored",
+        "files_unchanged",
+        "files_changed",
+        "files_failed",
+        "files_confirmed",
+        "cache_hits",
+        "verdict_hits",
+    )
+
+    def __init__(self):
+        self.counters = dict.fromkeys(self.COUNTERS, 0)
+        self.failures = {}
+        self.diffs = {}
+
+    @classmethod
+    def from_dict(cls, report_dict):
+        report = cls()
+        report.counters.update(report_dict["counters"])
+        report.failures.update(report_dict["failures"])
+        report.diffs.update(report_dict.get("diffs", {}))
+        return report
+
+    def record(self, result):
+        self.counters["files_processed"] += 1
+        self.counters["files_%s" % result.status] += 1
+        if result.from_cache:
+            self.counters["cache_hits"] += 1
+        if result.from_verdict_store:
+            self.counters["verdict_hits"] += 1
+        if result.confirmed:
+            self.counters["files_confirmed"] += 1
+        if result.status == FAILED:
+            self.failures[result.path] = result.error
+        if result.diff is not None:
+            self.diffs[result.path] = result.diff
+
+    def merge(self, other):
+        for name, value in other.counters.items():
+            self.counters[name] = self.counters.get(name, 0) + value
+        self.failures.update(other.failures)
+        self.diffs.update(other.diffs)
+
+        return self
+
+    def confirmation_rate(self):
+        """Share of the files run through flag usage detection that it confirmed, or None if none were."""
+        detected_files = self.counters["files_confirmed"] + self.counters["files_skipped_by_detection"]
+        return self.counters["files_confirmed"] / detected_files if detected_files > 0 else None
+
+    def as_dict(self):
+        return {
+            "counters": dict(self.counters),
+            "failures": dict(self.failures),
+            "diffs": dict(self.diffs),
+            "confirmationRate": self.confirmation_rate(),
+        }
+
+
+def run(command, paths, repo_root=".", write=True, cache=None, profiler=None, verdicts=None, diffs=False):
+    """Transform every Python file under the given paths, returning a report of what was done.
+
+    With ``diffs``, the report also holds the unified diff of every changed file.
+    """
+    report = RunReport()
+    if profiler is not None:
+        profiler.instrument(command)
+    for path in python_files_in(paths, command.ignore_rules, repo_root):
+        result = transform_file(command, path, repo_root=repo_root, cache=cache, profiler=profiler, verdicts=verdicts)
+        if diffs:
+            result = with_diff(result, repo_root)
+        if write and result.status == CHANGED:
+            result = write_result(result)
+        report.record(result)
+        if profiler is not None:
+            profiler.record(result.profile)
+
+    return report
+
+
+def transform_file(command, path, repo_root=".", cache=None, profiler=None, verdicts=None):
+    """Transform a single file, skipping the parse entirely when its bytes can't reference any flag."""
+    full_module_name = full_module_name_of(path, repo_root)
+    if command.is_module_ignored(full_module_name):
+        return FileResult(path, IGNORED)
+
+    source = read_if_may_reference_flags(command, path)
+    if source is None:
+        return FileResult(path, SKIPPED_BY_PREFILTER)
+
+    return transform_source(command, path, source, full_module_name, cache=cache, profiler=profiler, verdicts=verdicts)
+
+
+def read_if_may_reference_flags(command, path):
+    """Read a file only if its bytes may reference the command's flags, returning None otherwise.
+
+    The prefilter runs over a memory map of the file, so the files it rejects are never copied into memory.
+    """
+    with mapped_if_may_reference_flags(command, path) as mapped_source:
+        return mapped_source[:] if mapped_source is not None else None
+
+
+@contextlib.contextmanager
+def mapped_if_may_reference_flags(command, path):
+    """Memory map a file if its bytes may reference the command's flags, yielding None otherwise."""
+    with open(path, "rb") as source_file:
+        if os.fstat(source_file.fileno()).st_size == 0:
+            yield None
+            return
+
+        with mmap.mmap(source_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped_source:
+            yield mapped_source if command.may_reference_flags(mapped_source) else None
+
+
+def transform_source(command, path, source, full_module_name=None, cache=None, profiler=None, verdicts=None):
+    """Transform the raw bytes of a module, running the prefilter, lookups and detection before the CST is built.
+
+    Modules the verdict store knows to be clean of every flag, or whose results are cached, are never parsed.
+
+    Detection confirms with the standard library's much faster parser that the module really checks, assigns or
+    imports a flag, so the modules merely mentioning a flag's name are never parsed by libcst.
+    """
+    if not command.may_reference_flags(source):
+        return FileResult(path, SKIPPED_BY_PREFILTER)
+
+    if verdicts is None:
+        return _transformed_unless_cached(command, path, source, full_module_name, cache, profiler)
+
+    verdict_keys = verdicts.keys_for(command, source, full_module_name)
+    if verdicts.is_clean(verdict_keys):
+        return FileResult(path, UNCHANGED, from_verdict_store=True)
+
+    result = _transformed_unless_cached(command, path, source, full_module_name, cache, profiler)
+    record_verdict(verdicts, verdict_keys, command, result, full_module_name)
+    return result
+
+
+def record_verdict(verdicts, verdict_keys, command, result, full_module_name=None):
+    """Record a module as clean of the command's flags if its result shows that it is."""
+    if result.status in (UNCHANGED, SKIPPED_BY_DETECTION) and not command.is_module_ignored(full_module_name):
+        verdicts.record_clean(verdict_keys)
+
+
+def _transformed_unless_cached(command, path, source, full_module_name, cache, profiler):
+    if cache is None:
+        return _detected_and_transformed(command, path, source, full_module_name, profiler)
+
+    module_flag_aliases = command.flag_aliases_by_module.get(full_module_name)
+    cache_key = cache.key_for(configuration_fingerprint(command), source, module_flag_aliases)
+    cache_entry = cache.get(cache_key)
+    if cache_entry is not None:
+        if cache_entry.changed:
+            return FileResult(path, CHANGED, transformed_source=cache_entry.transformed_source, from_cache=True)
+        return FileResult(path, UNCHANGED, from_cache=True)
+
+    result = _detected_and_transformed(command, path, source, full_module_name, profiler)
+    if result.status in (CHANGED, UNCHANGED):
+        cache.put(cache_key, result.transformed_source)
+
+    return result
+
+
+def _detected_and_transformed(command, path, source, full_module_name, profiler=None):
+    file_profile = profiler.start_file(path, len(source)) if profiler is not None else None
+    with timed_phase(file_profile, "detect"):
+        confirmed = confirms_flag_usage(command, source, full_module_name)
+    if not confirmed:
+        return FileResult(path, SKIPPED_BY_DETECTION, profile=_profile_of(file_profile))
+
+    result = _transformed(command, path, source, full_module_name, file_profile)
+    result.confirmed = True
+    return result
+
+
+def _transformed(command, path, source, full_module_name, file_profile=None):
+    command.context = CodemodContext(filename=path, full_module_name=full_module_name)
+    try:
+        with timed_phase(file_profile, "parse"):
+            tree = parse_module(source)
+        with timed_phase(file_profile, "transform"):
+            tree = command.transform_module(tree)
+        if command.replacements == 0:
+            return FileResult(path, UNCHANGED, profile=_profile_of(file_profile))
+        with timed_phase(file_profile, "codegen"):
+            transformed_source = tree.bytes
+    except SkipFile:
+        return FileResult(path, IGNORED, profile=_profile_of(file_profile))
+    except Exception as e:
+        return FileResult(path, FAILED, error="%s: %s" % (type(e).__name__, e), profile=_profile_of(file_profile))
+
+    if transformed_source == source:
+        return FileResult(path, UNCHANGED, profile=_profile_of(file_profile))
+
+    return FileResult(path, CHANGED, transformed_source=transformed_source, profile=_profile_of(file_profile))
+
+
+def as_edits(result, source):
+    """Swap a changed result's transformed source for the edits turning the source into it, which are smaller."""
+    if result.status == CHANGED:
+        result.edits = edits_between(source, result.transformed_source)
+        result.source_digest = hashlib.sha256(source).hexdigest()
+        result.transformed_source = None
+
+    return result
+
+
+def edits_between(source, transformed_source):
+    """Compute the ``(start, end, replacement)`` line spans turning the source into the transformed source.
+
+    Lines are matched as in patience diff, which takes about linear time however repetitive the lines are: the lines
+    found exactly once on both sides anchor the match, and the runs between anchors are matched the same way. Runs
+    without any such line are replaced as a whole.
+    """
+    source_lines = source.splitlines(keepends=True)
+    transformed_lines = transformed_source.splitlines(keepends=True)
+    line_offsets = [0]
+    for line in source_lines:
+        line_offsets.append(line_offsets[-1] + len(line))
+
+    edits = []
+    source_position = transformed_position = 0
+    matching_lines = _matching_lines(source_lines, transformed_lines)
+    for i, j in matching_lines + [(len(source_lines), len(transformed_lines))]:
+        if i > source_position or j > transformed_position:
+            edits.append(
+                (line_offsets[source_position], line_offsets[i], b"".join(transformed_lines[transformed_position:j]))
+            )
+        source_position, transformed_position = i + 1, j + 1
+
+    return edits
+
+
+def _matching_lines(a, b):
+    # Each line is examined a bounded number of times, past which the runs left are replaced as a whole
+    budget = MATCHING_BUDGET_PER_LINE * (len(a) + len(b))
+    matches = []
+    runs = [(0, len(a), 0, len(b))]
+    while len(runs) > 0:
+        a_start, a_end, b_start, b_end = runs.pop()
+        while a_start < a_end and b_start < b_end and a[a_start] == b[b_start]:
+            matches.append((a_start, b_start))
+            a_start += 1
+            b_start += 1
+        while a_start < a_end and b_start < b_end and a[a_end - 1] == b[b_end - 1]:
+            a_end -= 1
+            b_end -= 1
+            matches.append((a_end, b_end))
+
+        budget -= (a_end - a_start) + (b_end - b_start)
+        if a_start == a_end or b_start == b_end or budget < 0:
+            continue
+
+        previous_i, previous_j = a_start, b_start
+        for i, j in _unique_line_anchors(a, a_start, a_end, b, b_start, b_end):
+            runs.append((previous_i, i, previous_j, j))
+            matches.append((i, j))
+            previous_i, previous_j = i + 1, j + 1
+        if previous_i > a_start:
+            runs.append((previous_i, a_end, previous_j, b_end))
+
+    return sorted(matches)
+
+
+def _unique_line_anchors(a, a_start, a_end, b, b_start, b_end):
+    a_counts = collections.Counter(a[a_start:a_end])
+    b_positions = {}
+    for j in range(b_start, b_end):
+        b_positions[b[j]] = j if b[j] not in b_positions else None
+    pairs = [
+        (i, b_positions[a[i]])
+        for i in range(a_start, a_end)
+        if a_counts[a[i]] == 1 and b_positions.get(a[i]) is not None
+    ]
+
+    # The longest run of pairs in order on both sides, found by patience sorting
+    pile_tops = []
+    pile_top_indices = []
+    predecessors = []
+    for index, (_, j) in enumerate(pairs):
+        pile = bisect.bisect_left(pile_tops, j)
+        predecessors.append(pile_top_indices[pile - 1] if pile > 0 else None)
+        if pile == len(pile_tops):
+            pile_tops.append(j)
+            pile_top_indices.append(index)
+        else:
+            pile_tops[pile] = j
+            pile_top_indices[pile] = index
+
+    anchors = []
+    index = pile_top_indices[-1] if len(pile_top_indices) > 0 else None
+    while index is not None:
+        anchors.append(pairs[index])
+        index = predecessors[index]
+
+    return anchors[::-1]
+
+
+def spliced(source, edits):
+    """Apply the given ``(start, end, replacement)`` edits, sorted by position, to the source."""
+    parts = []
+    position = 0
+    for start, end, replacement in edits:
+        parts.append(source[position:start])
+        parts.append(replacement)
+        position = end
+    parts.append(source[position:])
+
+    return b"".join(parts)
+
+
+def unified_diff(path, source, transformed_source, repo_root="."):
+    """Render the change to a file as a unified diff that can be fed to ``git apply``."""
+    relative_path = os.path.relpath(path, repo_root).replace(os.sep, "/")
+    diff_lines = difflib.unified_diff(
+        _lines_of(source), _lines_of(transformed_source), fromfile="a/%s" % relative_path, tofile="b/%s" % relative_path
+    )
+    return "".join(
+        diff_line if diff_line.endswith("\n") else diff_line + "\n\\ No newline at end of file\n"
+        for diff_line in diff_lines
+    )
+
+
+def with_diff(result, repo_root="."):
+    """Attach to a changed result the unified diff of its file, which must not have been written back yet."""
+    if result.status != CHANGED:
+        return result
+
+    try:
+        with open(result.path, "rb") as source_file:
+            source = source_file.read()
+    except OSError as e:
+        return FileResult(result.path, FAILED, error="%s: %s" % (type(e).__name__, e), profile=result.profile)
+
+    transformed_source = result.transformed_source if result.edits is None else spliced(source, result.edits)
+    result.diff = unified_diff(result.path, source, transformed_source, repo_root)
+    return result
+
+
+def _lines_of(source):
+    lines = source.decode("utf-8", "surrogateescape").split("\n")
+    return [line + "\n" for line in lines[:-1]] + ([lines[-1]] if len(lines[-1]) > 0 else [])
+
+
+def write_result(result):
+    """Write a changed file back, unless it already holds the new content, returning the result of doing so.
+
+    Results carrying edits are spliced into the file's current bytes, provided that those are still the bytes that
+    were transformed, and the file is replaced atomically so that readers never see it half-written.
+    """
+    try:
+        with open(result.path, "rb") as current_file:
+            current_source = current_file.read()
+        if result.edits is None:
+            transformed_source = result.transformed_source
+        elif hashlib.sha256(current_source).hexdigest() != result.source_digest:
+            return FileResult(
+                result.path, FAILED, error="file changed while it was being transformed", profile=result.profile
+            )
+        else:
+            transformed_source = spliced(current_source, result.edits)
+
+        if transformed_source != current_source:
+            write_atomically(result.path, transformed_source)
+    except OSError as e:
+        return FileResult(result.path, FAILED, error="%s: %s" % (type(e).__name__, e), profile=result.profile)
+
+    return result
+
+
+def write_atomically(path, content):
+    """Replace the content of a file through a rename, keeping the file's permissions."""
+    file_descriptor, temporary_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix=".piranha-")
+    try:
+        with os.fdopen(file_descriptor, "wb") as temporary_file:
+            temporary_file.write(content)
+        os.chmod(temporary_path, stat.S_IMODE(os.stat(path).st_mode))
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.unlink(temporary_path)
+        raise
+
+
+def _profile_of(file_profile):
+    return file_profile.as_dict() if file_profile is not None else None
+
+
+def python_files_in(paths, ignore_rules=None, repo_root="."):
+    """Yield the Python files found under the given files and directories, in a stable order.
+
+    Files the ignore rules reject are never yielded, and directories they exclude aren't even walked.
+    """
+    if ignore_rules is not None and ignore_rules.is_empty():
+        ignore_rules = None
+
+    for path in paths:
+        if not os.path.isdir(path):
+            if ignore_rules is None or not ignore_rules.ignores_file(path, repo_root):
+                yield path
+            continue
+
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames.sort()
+            if ignore_rules is None:
+                yield from (os.path.join(dirpath, f) for f in sorted(filenames) if f.endswith(".py"))
+                continue
+
+            relative_dirpath = relative_path_of(dirpath, repo_root)
+            relative_dirpath = "" if relative_dirpath == "." else relative_dirpath + "/"
+            dirnames[:] = [d for d in dirnames if not ignore_rules.prunes(relative_dirpath + d)]
+            for filename in sorted(filenames):
+                if filename.endswith(".py") and not ignore_rules.ignores(relative_dirpath + filename):
+                    yield os.path.join(dirpath, filename)
+
+
+def is_within_any(path, directories):
+    """Say whether an absolute path is one of the given absolute paths or lies under any of them."""
+    return any(path == d or path.startswith(d.rstrip(os.sep) + os.sep) for d in directories)
+
+
+def full_module_name_of(path, repo_root="."):
+    """Compute the dotted module name of a file relative to the repository root."""
+    relative_path = os.path.relpath(os.path.abspath(path), os.path.abspath(repo_root))
+    if relative_path.startswith(os.pardir):
+        return None
+
+    module_path, _ = os.path.splitext(relative_path)
+    module_parts = module_path.split(os.sep)
+    if module_parts[-1] == "__init__":
+        module_parts = module_parts[:-1]
+
+    return ".".join(module_parts) or None
@@ -0,0 +1,64 @@
+import fnmatch
+import os
+import re
+
+
+class IgnoreRules:
+    """Include and exclude patterns matched against file paths relative to the repository root.
+
+    Globs must match the whole path, with ``*`` also matching path separators, whereas regexes may match anywhere in
+    it. All the patterns on each side are compiled into a single regex, so checking a path costs one match at most.
+    """
+
+    def __init__(self, include_globs=(), exclude_globs=(), include_regexes=(), exclude_regexes=()):
+        self.include_globs = list(include_globs)
+        self.exclude_globs = list(exclude_globs)
+        self.include_regexes = list(include_regexes)
+        self.exclude_regexes = list(exclude_regexes)
+        self._include = _compiled(self.include_globs, self.include_regexes)
+        self._exclude = _compiled(self.exclude_globs, self.exclude_regexes)
+
+    @classmethod
+    def from_dict(cls, rules):
+        return cls(
+            include_globs=rules.get("includeGlobs", ()),
+            exclude_globs=rules.get("excludeGlobs", ()),
+            include_regexes=rules.get("includeRegexes", ()),
+            exclude_regexes=rules.get("excludeRegexes", ()),
+        )
+
+    def as_dict(self):
+        return {
+            "includeGlobs": self.include_globs,
+            "excludeGlobs": self.exclude_globs,
+            "includeRegexes": self.include_regexes,
+            "excludeRegexes": self.exclude_regexes,
+        }
+
+    def is_empty(self):
+        return self._include is None and self._exclude is None
+
+    def ignores(self, relative_path):
+        if self._exclude is not None and self._exclude.match(relative_path) is not None:
+            return True
+
+        return self._include is not None and self._include.match(relative_path) is None
+
+    def prunes(self, relative_directory):
+        return self._exclude is not None and self._exclude.match(relative_directory + "/") is not None
+
+    def ignores_file(self, path, repo_root="."):
+        return not self.is_empty() and self.ignores(relative_path_of(path, repo_root))
+
+
+def relative_path_of(path, repo_root="."):
+    """Compute the slash-separated path of a file relative to the repository root, which rules are matched against."""
+    return os.path.relpath(os.path.abspath(path), os.path.abspath(repo_root)).replace(os.sep, "/")
+
+
+def _compiled(globs, regexes):
+    alternatives = [fnmatch.translate(g) for g in globs] + [".*?(?:%s)" % r for r in regexes]
+    if len(alternatives) == 0:
+        return None
+
+    return re.compile("|".join("(?:%s)" % a for a in alternatives))
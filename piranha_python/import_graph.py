@@ -0,0 +1,157 @@
+import ast
+import json
+import os
+import tempfile
+
+from piranha_python.driver import full_module_name_of, is_within_any, python_files_in
+
+IMPORT_GRAPH_FORMAT_VERSION = 1
+DEFAULT_IMPORT_GRAPH_PATH = os.path.join(".piranha", "import_graph.json")
+_NESTED_BODY_FIELDS = ("body", "orelse", "finalbody")
+
+
+class ImportGraph:
+    """Names bound at module level by imports and plain name assignments across a project.
+
+    Following these bindings finds the flags re-exported under other names, e.g. through a package's ``__init__``
+    module, so each module's aliases of a flag can be looked up without parsing the modules it imports from.
+    Like the flag usage index, the graph is stored on disk and only the files changed since the last update are parsed.
+    """
+
+    def __init__(self, path, repo_root="."):
+        self.path = path
+        self.repo_root = repo_root
+        self.files = {}
+
+        try:
+            with open(path) as graph_file:
+                stored_graph = json.load(graph_file)
+        except (OSError, ValueError):
+            return
+
+        if stored_graph.get("formatVersion") == IMPORT_GRAPH_FORMAT_VERSION:
+            self.files = stored_graph["files"]
+
+    def update(self, paths):
+        """Re-parse the files under the given paths that changed since the last update, returning how many were."""
+        requested_paths = [os.path.abspath(p) for p in paths]
+        seen_paths = set()
+        parsed_files = 0
+        for path in python_files_in(paths):
+            relative_path = os.path.relpath(os.path.abspath(path), os.path.abspath(self.repo_root))
+            seen_paths.add(relative_path)
+            try:
+                file_stat = os.stat(path)
+            except OSError:
+                continue
+
+            entry = self.files.get(relative_path)
+            if entry is None or entry["stat"] != [file_stat.st_mtime_ns, file_stat.st_size]:
+                module = full_module_name_of(path, self.repo_root)
+                self.files[relative_path] = _parsed_file_entry(path, file_stat, module)
+                parsed_files += 1
+
+        for relative_path in list(self.files):
+            absolute_path = os.path.normpath(os.path.join(os.path.abspath(self.repo_root), relative_path))
+            if relative_path not in seen_paths and is_within_any(absolute_path, requested_paths):
+                del self.files[relative_path]
+
+        return parsed_files
+
+    def save(self):
+        graph_directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(graph_directory, exist_ok=True)
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=graph_directory, prefix=".tmp-")
+        with os.fdopen(file_descriptor, "w") as graph_file:
+            json.dump({"formatVersion": IMPORT_GRAPH_FORMAT_VERSION, "files": self.files}, graph_file, sort_keys=True)
+        os.replace(temporary_path, self.path)
+
+    def flag_aliases_by_module(self, flag_names):
+        """Map each module binding any of the flags under other names to those names and the flags they're bound to."""
+        flag_names = frozenset(flag_names)
+        entries_by_module = {e["module"]: e for e in self.files.values() if e["module"] is not None}
+        aliases_by_module = {}
+
+        def aliases_of(module):
+            if module in aliases_by_module:
+                return aliases_by_module[module]
+
+            # Registered before being filled in, so cyclic imports see a partial result instead of recursing forever
+            aliases = aliases_by_module[module] = {}
+            entry = entries_by_module.get(module)
+            if entry is None:
+                return aliases
+
+            for star_imported_module in entry["starImports"]:
+                aliases.update((n, f) for n, f in aliases_of(star_imported_module).items() if not n.startswith("_"))
+            for local_name, (source_module, source_name) in entry["bindings"].items():
+                flag_name = source_name if source_name in flag_names else aliases_of(source_module).get(source_name)
+                if flag_name is not None:
+                    aliases[local_name] = flag_name
+                else:
+                    aliases.pop(local_name, None)
+
+            return aliases
+
+        flag_aliases_by_module = {}
+        for module in sorted(entries_by_module):
+            aliases = {n: f for n, f in aliases_of(module).items() if n not in flag_names}
+            if len(aliases) > 0:
+                flag_aliases_by_module[module] = aliases
+
+        return flag_aliases_by_module
+
+
+def _parsed_file_entry(path, file_stat, module):
+    entry = {"stat": [file_stat.st_mtime_ns, file_stat.st_size], "module": module, "bindings": {}, "starImports": []}
+    try:
+        with open(path, "rb") as source_file:
+            statements = ast.parse(source_file.read()).body
+    except (OSError, SyntaxError, ValueError):
+        return entry
+
+    is_package = os.path.basename(path) == "__init__.py"
+    for statement in _module_level_statements_in(statements):
+        if isinstance(statement, ast.ImportFrom):
+            source_module = _absolute_module_of(statement, module, is_package)
+            for alias in statement.names:
+                if alias.name == "*":
+                    entry["starImports"].append(source_module)
+                else:
+                    entry["bindings"][alias.asname or alias.name] = [source_module, alias.name]
+        elif isinstance(statement, ast.Import):
+            for alias in statement.names:
+                if alias.asname is not None and "." in alias.name:
+                    entry["bindings"][alias.asname] = list(alias.name.rsplit(".", 1))
+        elif isinstance(statement, ast.Assign) and _rebinds_a_name(statement):
+            entry["bindings"][statement.targets[0].id] = [module, statement.value.id]
+
+    return entry
+
+
+def _rebinds_a_name(assign_node):
+    if len(assign_node.targets) != 1 or not isinstance(assign_node.targets[0], ast.Name):
+        return False
+
+    return isinstance(assign_node.value, ast.Name)
+
+
+def _module_level_statements_in(statements):
+    for statement in statements:
+        yield statement
+        if isinstance(statement, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            continue
+
+        for field in _NESTED_BODY_FIELDS:
+            yield from _module_level_statements_in(getattr(statement, field, []))
+        for handler in getattr(statement, "handlers", []):
+            yield from _module_level_statements_in(handler.body)
+
+
+def _absolute_module_of(import_from, module, is_package):
+    if import_from.level == 0:
+        return import_from.module
+
+    package_parts = (module or "").split(".") if is_package else (module or "").split(".")[:-1]
+    package_parts = package_parts[: len(package_parts) - (import_from.level - 1)]
+    return ".".join(package_parts + ([import_from.module] if import_from.module else []))
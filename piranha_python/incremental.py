@@ -0,0 +1,85 @@
+import hashlib
+import json
+import os
+import subprocess
+import tempfile
+
+from piranha_python.cache import configuration_fingerprint
+from piranha_python.driver import is_within_any
+
+DEFAULT_STATE_PATH = os.path.join(".piranha", "state.json")
+
+
+class IncrementalState:
+    """Last commit successfully processed by each flag configuration and set of paths, persisted as a JSON file."""
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            with open(path) as state_file:
+                self._base_commits = json.load(state_file)
+        except (OSError, ValueError):
+            self._base_commits = {}
+
+    def base_commit_for(self, command, paths, repo_root="."):
+        return self._base_commits.get(_state_key_of(command, paths, repo_root))
+
+    def record(self, command, paths, commit, repo_root="."):
+        self._base_commits[_state_key_of(command, paths, repo_root)] = commit
+
+        state_directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(state_directory, exist_ok=True)
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=state_directory, prefix=".tmp-")
+        with os.fdopen(file_descriptor, "w") as state_file:
+            json.dump(self._base_commits, state_file, indent=2, sort_keys=True)
+        os.replace(temporary_path, self.path)
+
+
+def paths_changed_since_last_run(state, command, paths, repo_root="."):
+    """Narrow the given paths down to the Python files changed since the command's last successful run.
+
+    Returns the paths to be processed along with the current HEAD commit, which should be recorded in the state once
+    the run succeeds. The given paths are returned untouched when there's no usable base commit.
+    """
+    head_commit = _git(repo_root, "rev-parse", "HEAD").strip()
+    base_commit = state.base_commit_for(command, paths, repo_root)
+    if base_commit is None or not _commit_exists(repo_root, base_commit):
+        return list(paths), head_commit
+
+    toplevel = _git(repo_root, "rev-parse", "--show-toplevel").strip()
+    changed_files = _git(repo_root, "diff", "--name-only", "-z", "--diff-filter=ACMR", base_commit).split("\0")
+    untracked_files = _git(repo_root, "ls-files", "--others", "--exclude-standard", "-z", "--full-name").split("\0")
+    requested_paths = [os.path.abspath(p) for p in paths]
+
+    return (
+        sorted(
+            {
+                os.path.join(toplevel, f)
+                for f in changed_files + untracked_files
+                if f.endswith(".py") and is_within_any(os.path.join(toplevel, f), requested_paths)
+            }
+        ),
+        head_commit,
+    )
+
+
+def _commit_exists(repo_root, commit):
+    completed_process = subprocess.run(
+        ["git", "cat-file", "-e", "%s^{commit}" % commit],
+        cwd=repo_root,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    return completed_process.returncode == 0
+
+
+def _git(repo_root, *args):
+    return subprocess.run(
+        ["git"] + list(args), cwd=repo_root, stdout=subprocess.PIPE, check=True, universal_newlines=True
+    ).stdout
+
+
+def _state_key_of(command, paths, repo_root):
+    # A commit processed for some paths says nothing about the files outside them, so each set of paths gets its own
+    requested_paths = sorted({os.path.relpath(os.path.abspath(p), os.path.abspath(repo_root)) for p in paths})
+    return hashlib.sha256(configuration_fingerprint(command) + b"\0" + json.dumps(requested_paths).encode()).hexdigest()
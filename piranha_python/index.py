@@ -0,0 +1,220 @@
+import ast
+import json
+import multiprocessing
+import os
+import re
+import tempfile
+
+import libcst
+from libcst import matchers
+from libcst.metadata import MetadataWrapper, PositionProvider
+from piranha_python.driver import is_within_any, python_files_in
+
+INDEX_FORMAT_VERSION = 1
+DEFAULT_INDEX_PATH = os.path.join(".piranha", "flag_index.json")
+
+
+class FlagUsageIndex:
+    """Inverted index from the flags passed to the resolution methods to the files and line spans using them.
+
+    Each indexed file also records the names it binds through imports and module level assignments, so a removal run
+    can find the modules declaring or re-exporting a flag without opening every file in the repository.
+    """
+
+    def __init__(self, path, resolution_method_names, repo_root="."):
+        self.path = path
+        self.resolution_method_names = sorted(set(resolution_method_names))
+        self.repo_root = repo_root
+        self.files = {}
+
+        try:
+            with open(path) as index_file:
+                stored_index = json.load(index_file)
+        except (OSError, ValueError):
+            return
+
+        is_current_format = stored_index.get("formatVersion") == INDEX_FORMAT_VERSION
+        if is_current_format and stored_index.get("resolutionMethodNames") == self.resolution_method_names:
+            self.files = stored_index["files"]
+
+    @classmethod
+    def covering(cls, path, resolution_method_names, repo_root="."):
+        """Load the index stored at the path, which must have been built for at least the given resolution methods."""
+        try:
+            with open(path) as index_file:
+                indexed_method_names = json.load(index_file)["resolutionMethodNames"]
+        except (OSError, ValueError, KeyError, TypeError):
+            raise ValueError("no flag usage index could be read from '%s' - build it with 'piranha index'" % path)
+
+        missing_method_names = sorted(set(resolution_method_names).difference(indexed_method_names))
+        if len(missing_method_names) > 0:
+            raise ValueError(
+                "the flag usage index at '%s' wasn't built for %s - rebuild it passing every method to 'piranha index'"
+                % (path, ", ".join(missing_method_names))
+            )
+
+        return cls(path, indexed_method_names, repo_root=repo_root)
+
+    def update(self, paths, jobs=1):
+        """Re-scan the files under the given paths that changed since the last update, returning how many were."""
+        requested_paths = [os.path.abspath(p) for p in paths]
+        seen_paths = set()
+        stale_paths = []
+        for path in python_files_in(paths):
+            relative_path = self._relative_path_of(path)
+            seen_paths.add(relative_path)
+            try:
+                file_stat = os.stat(path)
+            except OSError:
+                continue
+
+            entry = self.files.get(relative_path)
+            if entry is None or entry["stat"] != [file_stat.st_mtime_ns, file_stat.st_size]:
+                stale_paths.append((relative_path, path))
+
+        for relative_path in list(self.files):
+            absolute_path = self._absolute_path_of(relative_path)
+            if relative_path not in seen_paths and is_within_any(absolute_path, requested_paths):
+                del self.files[relative_path]
+
+        scan_args = [(path, self.resolution_method_names) for _, path in stale_paths]
+        if jobs == 1 or len(stale_paths) < 2:
+            entries = map(_scanned_file_entry, scan_args)
+            self._store_entries(stale_paths, entries)
+        else:
+            with multiprocessing.Pool(jobs) as pool:
+                self._store_entries(stale_paths, pool.imap(_scanned_file_entry, scan_args, chunksize=16))
+
+        return len(stale_paths)
+
+    def save(self):
+        index_directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(index_directory, exist_ok=True)
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=index_directory, prefix=".tmp-")
+        with os.fdopen(file_descriptor, "w") as index_file:
+            json.dump(
+                {
+                    "formatVersion": INDEX_FORMAT_VERSION,
+                    "resolutionMethodNames": self.resolution_method_names,
+                    "files": self.files,
+                },
+                index_file,
+                sort_keys=True,
+            )
+        os.replace(temporary_path, self.path)
+
+    def usages_of(self, flag_name):
+        return {
+            relative_path: entry["usages"][flag_name]
+            for relative_path, entry in sorted(self.files.items())
+            if flag_name in entry["usages"]
+        }
+
+    def usage_counts(self):
+        counts = {}
+        for entry in self.files.values():
+            for flag_name, spans in entry["usages"].items():
+                flag_counts = counts.setdefault(flag_name, {"usages": 0, "files": 0})
+                flag_counts["usages"] += len(spans)
+                flag_counts["files"] += 1
+
+        return dict(sorted(counts.items(), key=lambda c: (-c[1]["usages"], c[0])))
+
+    def files_referencing(self, flag_names):
+        flag_names = set(flag_names)
+        return [
+            os.path.join(self.repo_root, relative_path)
+            for relative_path, entry in sorted(self.files.items())
+            if not flag_names.isdisjoint(entry["usages"]) or not flag_names.isdisjoint(entry["boundNames"])
+        ]
+
+    def _store_entries(self, stale_paths, entries):
+        for (relative_path, _), entry in zip(stale_paths, entries):
+            if entry is None:
+                self.files.pop(relative_path, None)
+            else:
+                self.files[relative_path] = entry
+
+    def _absolute_path_of(self, relative_path):
+        return os.path.normpath(os.path.join(os.path.abspath(self.repo_root), relative_path))
+
+    def _relative_path_of(self, path):
+        return os.path.normpath(os.path.relpath(os.path.abspath(path), os.path.abspath(self.repo_root)))
+
+
+class _FlagUsageCollector(libcst.CSTVisitor):
+    METADATA_DEPENDENCIES = (PositionProvider,)
+
+    def __init__(self, resolution_method_names):
+        super().__init__()
+        method_name_matcher = matchers.Name(matchers.MatchIfTrue(frozenset(resolution_method_names).__contains__))
+        self.flag_resolution_matcher = matchers.Call(
+            func=method_name_matcher | matchers.Attribute(attr=method_name_matcher),
+            args=[matchers.Arg(value=matchers.Name()), matchers.ZeroOrMore()],
+        )
+        self.imported_names = {}
+        self.usages = {}
+
+    def visit_ImportAlias(self, node):
+        imported_name = _last_name_in(node.name)
+        if node.asname is not None and isinstance(node.asname.name, libcst.Name):
+            self.imported_names[node.asname.name.value] = imported_name
+
+    def visit_Call(self, node):
+        if matchers.matches(node, self.flag_resolution_matcher):
+            local_name = node.args[0].value.value
+            flag_name = self.imported_names.get(local_name, local_name)
+            position = self.get_metadata(PositionProvider, node)
+            self.usages.setdefault(flag_name, []).append([position.start.line, position.end.line])
+
+
+def _scanned_file_entry(scan_args):
+    path, resolution_method_names = scan_args
+    try:
+        file_stat = os.stat(path)
+        with open(path, "rb") as source_file:
+            source = source_file.read()
+    except OSError:
+        return None
+
+    entry = {"stat": [file_stat.st_mtime_ns, file_stat.st_size], "usages": {}, "boundNames": []}
+    try:
+        entry["boundNames"] = sorted(_names_bound_at_module_level(ast.parse(source)))
+    except (SyntaxError, ValueError):
+        pass
+
+    if _resolution_methods_pattern(resolution_method_names).search(source) is not None:
+        collector = _FlagUsageCollector(resolution_method_names)
+        try:
+            MetadataWrapper(libcst.parse_module(source)).visit(collector)
+        except libcst.ParserSyntaxError:
+            pass
+        entry["usages"] = collector.usages
+
+    return entry
+
+
+def _names_bound_at_module_level(module):
+    bound_names = set()
+    for statement in module.body:
+        if isinstance(statement, (ast.Import, ast.ImportFrom)):
+            bound_names.update(alias.name.split(".")[-1] for alias in statement.names)
+            bound_names.update(alias.asname for alias in statement.names if alias.asname is not None)
+        elif isinstance(statement, ast.Assign):
+            for target in statement.targets:
+                for node in ast.walk(target):
+                    if isinstance(node, ast.Name):
+                        bound_names.add(node.id)
+
+    return bound_names
+
+
+def _resolution_methods_pattern(resolution_method_names):
+    return re.compile(b"|".join(re.escape(m.encode("utf-8")) for m in resolution_method_names))
+
+
+def _last_name_in(node):
+    while isinstance(node, libcst.Attribute):
+        node = node.attr
+
+    return node.value
@@ -0,0 +1,170 @@
+import ast
+import json
+
+import libcst
+from piranha_python import driver
+
+_LOCATED_STATEMENT_TYPES = (ast.If, ast.Import, ast.ImportFrom, ast.Assign)
+
+
+class FlagSite:
+    def __init__(self, path, kind, flag_name, start, end, lines, kept_branch=None, kept_lines=None):
+        self.path = path
+        self.kind = kind
+        self.flag_name = flag_name
+        self.start = start
+        self.end = end
+        self.lines = lines
+        self.kept_branch = kept_branch
+        self.kept_lines = kept_lines
+
+    def as_dict(self):
+        return {
+            "path": self.path,
+            "kind": self.kind,
+            "flagName": self.flag_name,
+            "start": self.start,
+            "end": self.end,
+            "lines": list(self.lines),
+            "keptBranch": self.kept_branch,
+            "keptLines": None if self.kept_lines is None else list(self.kept_lines),
+        }
+
+    def as_json(self):
+        return json.dumps(self.as_dict(), sort_keys=True)
+
+
+class LocateResult:
+    def __init__(self, path, sites=(), error=None):
+        self.path = path
+        self.sites = sites
+        self.error = error
+
+
+class _FlagSiteCollector(libcst.CSTVisitor):
+    def __init__(self, command):
+        super().__init__()
+        self.command = command
+        self.statement_count = 0
+        self.sites = []
+
+    def visit_SimpleStatementLine(self, node):
+        for statement in node.body:
+            if isinstance(statement, (libcst.Import, libcst.ImportFrom)):
+                for _, flag_name in self.command.flag_imports_of(statement):
+                    self.sites.append((self.statement_count, "import", flag_name, None))
+            elif isinstance(statement, libcst.Assign):
+                for flag_name in self.command.flag_names_assigned_by(statement):
+                    self.sites.append((self.statement_count, "assignment", flag_name, None))
+            else:
+                continue
+            self.statement_count += 1
+
+        return False
+
+    visit_SimpleStatementSuite = visit_SimpleStatementLine
+
+    def visit_If(self, node):
+        flag_check = self.command.flag_check_of(node.test)
+        self.statement_count += 1
+        if flag_check is None:
+            return
+
+        flag_name, flag_value = flag_check
+        if flag_value:
+            kept_branch = "body"
+        elif node.orelse is None:
+            kept_branch = None
+        else:
+            kept_branch = "elif" if isinstance(node.orelse, libcst.If) else "else"
+        self.sites.append((self.statement_count - 1, "if", flag_name, kept_branch))
+
+
+def locate(command, paths, repo_root="."):
+    """Yield a ``LocateResult`` for each Python file under the given paths that isn't ignored."""
+    for path in driver.python_files_in(paths, command.ignore_rules, repo_root):
+        full_module_name = driver.full_module_name_of(path, repo_root)
+        if command.is_module_ignored(full_module_name):
+            continue
+
+        try:
+            with open(path, "rb") as source_file:
+                source = source_file.read()
+            yield LocateResult(path, locate_in_source(command, path, source, full_module_name))
+        except Exception as e:
+            yield LocateResult(path, error="%s: %s" % (type(e).__name__, e))
+
+
+def locate_in_source(command, path, source, full_module_name=None):
+    """List the flag sites of a module along with the branch that would be kept, without transforming it."""
+    if not command.may_reference_flags(source):
+        return []
+
+    module = libcst.parse_module(source)
+    collector = _FlagSiteCollector(command)
+    try:
+        command.enter_module(full_module_name)
+        module.visit(collector)
+    finally:
+        command.forget_flag_aliases()
+    if len(collector.sites) == 0:
+        return []
+
+    # libcst only computes positions by generating the code of the whole module, so the spans are taken from the
+    # matching statements of the module's stdlib ast instead, which come in the same order as libcst visits them.
+    statements = sorted(
+        (n for n in ast.walk(ast.parse(source)) if isinstance(n, _LOCATED_STATEMENT_TYPES)),
+        key=lambda n: (n.lineno, n.col_offset),
+    )
+    byte_offset_of = _byte_offsets_of(source, module.encoding)
+    sites = []
+    for statement_index, kind, flag_name, kept_branch in collector.sites:
+        statement = statements[statement_index]
+        sites.append(
+            FlagSite(
+                path,
+                kind,
+                flag_name,
+                byte_offset_of(statement.lineno, statement.col_offset),
+                byte_offset_of(statement.end_lineno, statement.end_col_offset),
+                (statement.lineno, statement.end_lineno),
+                "else" if kept_branch == "elif" else kept_branch,
+                _lines_of(_kept_statements_of(statement, kept_branch)),
+            )
+        )
+
+    return sites
+
+
+def _kept_statements_of(if_statement, kept_branch):
+    if kept_branch == "body":
+        return if_statement.body
+    if kept_branch == "elif":
+        return if_statement.orelse[0].body
+    if kept_branch == "else":
+        return if_statement.orelse
+
+    return None
+
+
+def _lines_of(statements):
+    if statements is None:
+        return None
+
+    return statements[0].lineno, statements[-1].end_lineno
+
+
+def _byte_offsets_of(source, encoding):
+    lines = source.splitlines(keepends=True)
+    line_offsets = [0]
+    for line in lines:
+        line_offsets.append(line_offsets[-1] + len(line))
+
+    def byte_offset_of(line_number, utf8_column):
+        if encoding.lower().replace("_", "-") in ("utf-8", "utf8"):
+            return line_offsets[line_number - 1] + utf8_column
+
+        line_prefix = lines[line_number - 1].decode(encoding).encode("utf-8")[:utf8_column]
+        return line_offsets[line_number - 1] + len(line_prefix.decode("utf-8").encode(encoding))
+
+    return byte_offset_of
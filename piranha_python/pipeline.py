@@ -0,0 +1,219 @@
+"""Pipelined driver overlapping file discovery, reads and writes with the transforms run by worker processes.
+
+Discovery and reads feed bounded queues that workers take files from, and writes drain the results as they come, so
+on slow filesystems the time spent waiting for I/O is hidden behind parsing. The queues' bounds hold back the reads
+whenever the workers fall behind, so memory use doesn't depend on the number of files.
+"""
+import asyncio
+import concurrent.futures
+import itertools
+import os
+
+from piranha_python import driver, scheduler
+
+DEFAULT_MAX_QUEUED_FILES = 64
+DEFAULT_IO_THREADS = 8
+DISCOVERY_BATCH_SIZE = 256
+
+
+class QueueDepths:
+    """Depths of the pipeline's queues, sampled whenever a file is put in one of them, to help tune their bounds."""
+
+    def __init__(self):
+        self.samples = {}
+        self.capacities = {}
+
+    def sample(self, name, queue):
+        samples = self.samples.setdefault(name, [0, 0, 0])
+        samples[0] += 1
+        samples[1] += queue.qsize()
+        samples[2] = max(samples[2], queue.qsize())
+        self.capacities[name] = queue.maxsize
+
+    def as_dict(self):
+        return {
+            name: {"samples": count, "mean": total / count, "max": maximum, "capacity": self.capacities[name]}
+            for name, (count, total, maximum) in sorted(self.samples.items())
+        }
+
+
+def run_pipelined(
+    command,
+    paths,
+    repo_root=".",
+    write=True,
+    cache_directory=None,
+    jobs=None,
+    max_queued_files=DEFAULT_MAX_QUEUED_FILES,
+    max_in_flight=None,
+    io_threads=DEFAULT_IO_THREADS,
+    profiler=None,
+    verdicts=None,
+    diffs=False,
+    queue_depths=None,
+):
+    """Transform every Python file under the given paths, overlapping their reads and writes with the transforms.
+
+    At most ``max_queued_files`` files wait between any two stages, at most ``max_in_flight`` (by default twice the
+    number of workers) are handed to workers at once, and reads and writes share ``io_threads`` threads.
+    """
+    jobs = jobs or os.cpu_count() or 1
+    pipeline = _Pipeline(
+        command,
+        repo_root,
+        write,
+        max_queued_files,
+        max_in_flight or jobs * 2,
+        profiler,
+        verdicts,
+        diffs,
+        queue_depths if queue_depths is not None else QueueDepths(),
+    )
+    worker_args = (command.configuration(), cache_directory, repo_root, profiler is not None)
+    with concurrent.futures.ThreadPoolExecutor(io_threads) as io_executor, concurrent.futures.ProcessPoolExecutor(
+        jobs, initializer=scheduler.initialize_worker, initargs=worker_args
+    ) as transform_executor:
+        return asyncio.run(pipeline.run(paths, io_executor, transform_executor, io_threads))
+
+
+class _Pipeline:
+    def __init__(
+        self, command, repo_root, write, max_queued_files, max_in_flight, profiler, verdicts, diffs, queue_depths
+    ):
+        self.command = command
+        self.repo_root = repo_root
+        self.write = write
+        self.max_queued_files = max_queued_files
+        self.max_in_flight = max_in_flight
+        self.profiler = profiler
+        self.verdicts = verdicts
+        self.diffs = diffs
+        self.queue_depths = queue_depths
+        self.report = driver.RunReport()
+        self._verdict_keys = {}
+
+    async def run(self, paths, io_executor, transform_executor, io_threads):
+        loop = asyncio.get_running_loop()
+        paths_queue = asyncio.Queue(self.max_queued_files)
+        sources_queue = asyncio.Queue(self.max_queued_files)
+        results_queue = asyncio.Queue(self.max_queued_files)
+
+        readers = [
+            asyncio.ensure_future(self._read(loop, io_executor, paths_queue, sources_queue)) for _ in range(io_threads)
+        ]
+        transformers = [
+            asyncio.ensure_future(self._transform(loop, transform_executor, sources_queue, results_queue))
+            for _ in range(self.max_in_flight)
+        ]
+        writers = [asyncio.ensure_future(self._write(loop, io_executor, results_queue)) for _ in range(io_threads)]
+        stages = [(paths_queue, readers), (sources_queue, transformers), (results_queue, writers)]
+        feeder = asyncio.ensure_future(self._feed(loop, io_executor, paths, stages))
+        tasks = [feeder] + readers + transformers + writers
+        try:
+            # A stage that fails leaves the others blocked on queues nothing takes from anymore, so the run stops as
+            # soon as any of them fails instead of once they all finish
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                task.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        return self.report
+
+    async def _feed(self, loop, io_executor, paths, stages):
+        await self._discover(loop, io_executor, paths, stages[0][0])
+        # Each stage is stopped once everything it takes files from was put in its queue
+        for queue, consumers in stages:
+            await _finish(queue, consumers)
+
+    async def _discover(self, loop, io_executor, paths, paths_queue):
+        discovered_paths = driver.python_files_in(paths, self.command.ignore_rules, self.repo_root)
+        while True:
+            # Directories are walked in batches on an I/O thread, so a slow filesystem never blocks the event loop
+            batch = await loop.run_in_executor(io_executor, _next_batch_of, discovered_paths)
+            if len(batch) == 0:
+                return
+
+            for path in batch:
+                await self._put(paths_queue, "paths", path)
+
+    async def _read(self, loop, io_executor, paths_queue, sources_queue):
+        while True:
+            path = await paths_queue.get()
+            if path is None:
+                return
+
+            full_module_name, result, source = await loop.run_in_executor(io_executor, self._read_file, path)
+            if result is None and self.verdicts is not None:
+                keys = self.verdicts.keys_for(self.command, source, full_module_name)
+                if self.verdicts.is_clean(keys):
+                    result = driver.FileResult(path, driver.UNCHANGED, from_verdict_store=True)
+                else:
+                    self._verdict_keys[path] = (keys, full_module_name)
+
+            if result is None:
+                await self._put(sources_queue, "sources", (path, source))
+            else:
+                self.report.record(result)
+
+    async def _transform(self, loop, transform_executor, sources_queue, results_queue):
+        while True:
+            record = await sources_queue.get()
+            if record is None:
+                return
+
+            path, source = record
+            result = await loop.run_in_executor(transform_executor, scheduler.transform_in_worker, path, source, True)
+            await self._put(results_queue, "results", result)
+
+    async def _write(self, loop, io_executor, results_queue):
+        while True:
+            result = await results_queue.get()
+            if result is None:
+                return
+
+            result = await loop.run_in_executor(io_executor, self._written, result)
+            self.report.record(result)
+            if self.profiler is not None:
+                self.profiler.record(result.profile)
+            if self.verdicts is not None:
+                keys, full_module_name = self._verdict_keys.pop(result.path)
+                driver.record_verdict(self.verdicts, keys, self.command, result, full_module_name)
+
+    async def _put(self, queue, name, item):
+        await queue.put(item)
+        self.queue_depths.sample(name, queue)
+
+    def _read_file(self, path):
+        full_module_name = driver.full_module_name_of(path, self.repo_root)
+        if self.command.is_module_ignored(full_module_name):
+            return full_module_name, driver.FileResult(path, driver.IGNORED), None
+
+        try:
+            source = driver.read_if_may_reference_flags(self.command, path)
+        except OSError as e:
+            error = "%s: %s" % (type(e).__name__, e)
+            return full_module_name, driver.FileResult(path, driver.FAILED, error=error), None
+        if source is None:
+            return full_module_name, driver.FileResult(path, driver.SKIPPED_BY_PREFILTER), None
+
+        return full_module_name, None, source
+
+    def _written(self, result):
+        if self.diffs:
+            result = driver.with_diff(result, self.repo_root)
+        if self.write and result.status == driver.CHANGED:
+            result = driver.write_result(result)
+
+        return result
+
+
+async def _finish(queue, consumers):
+    for _ in consumers:
+        await queue.put(None)
+    await asyncio.gather(*consumers)
+
+
+def _next_batch_of(iterator):
+    return list(itertools.islice(iterator, DISCOVERY_BATCH_SIZE))
@@ -0,0 +1,119 @@
+import contextlib
+import functools
+import json
+import time
+
+PHASES = ("detect", "parse", "transform", "codegen")
+CALLBACK_PREFIXES = ("visit_", "leave_")
+
+
+class TransformProfiler:
+    """Opt-in instrumentation of the visitor callbacks and of the phases each file goes through."""
+
+    def __init__(self):
+        self.callbacks = {}
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.files = []
+        self._current_file_profile = None
+
+    def instrument(self, command):
+        if getattr(command, "_instrumented_by", None) is self:
+            return command
+
+        command._instrumented_by = self
+        for name in _callback_names_of(type(command)):
+            setattr(command, name, self._timed_callback(name, getattr(command, name)))
+        # Commands that already transformed files may still hold on to the callbacks they looked up before
+        if hasattr(command, "forget_dispatched_methods"):
+            command.forget_dispatched_methods()
+
+        return command
+
+    def start_file(self, path, size):
+        self._current_file_profile = FileProfile(path, size)
+        return self._current_file_profile
+
+    def record(self, file_profile):
+        if file_profile is None:
+            return
+
+        for name, (calls, seconds) in file_profile["callbacks"].items():
+            callback_stats = self.callbacks.setdefault(name, [0, 0.0])
+            callback_stats[0] += calls
+            callback_stats[1] += seconds
+        for phase in PHASES:
+            self.phases[phase] += file_profile["phases"][phase]
+        self.files.append(
+            dict(
+                file_profile["phases"],
+                path=file_profile["path"],
+                bytes=file_profile["bytes"],
+                total=sum(file_profile["phases"].values()),
+            )
+        )
+
+    def as_dict(self):
+        return {
+            "callbacks": {
+                name: {"calls": calls, "seconds": seconds}
+                for name, (calls, seconds) in sorted(self.callbacks.items(), key=lambda c: -c[1][1])
+            },
+            "phases": dict(self.phases),
+            "files": sorted(self.files, key=lambda f: -f["total"]),
+        }
+
+    def write_json(self, path):
+        with open(path, "w") as profile_file:
+            json.dump(self.as_dict(), profile_file, indent=2)
+
+    def _timed_callback(self, name, callback):
+        @functools.wraps(callback)
+        def timed_callback(*args):
+            started_at = time.perf_counter()
+            try:
+                return callback(*args)
+            finally:
+                if self._current_file_profile is not None:
+                    self._current_file_profile.add_callback_time(name, time.perf_counter() - started_at)
+
+        return timed_callback
+
+
+class FileProfile:
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.callbacks = {}
+
+    def add_callback_time(self, name, seconds):
+        callback_stats = self.callbacks.setdefault(name, [0, 0.0])
+        callback_stats[0] += 1
+        callback_stats[1] += seconds
+
+    def as_dict(self):
+        return {"path": self.path, "bytes": self.size, "phases": dict(self.phases), "callbacks": self.callbacks}
+
+
+@contextlib.contextmanager
+def timed_phase(file_profile, phase):
+    """Add the time spent inside the block to the given phase of the file profile, if there's one."""
+    if file_profile is None:
+        yield
+        return
+
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        file_profile.phases[phase] += time.perf_counter() - started_at
+
+
+def _callback_names_of(command_class):
+    callback_names = set()
+    for cls in command_class.__mro__:
+        if cls.__module__.startswith("libcst") or cls is object:
+            continue
+        callback_names.update(n for n in vars(cls) if n.startswith(CALLBACK_PREFIXES) and callable(vars(cls)[n]))
+
+    return sorted(callback_names)
@@ -0,0 +1,193 @@
+import concurrent.futures
+import multiprocessing
+import os
+
+from libcst.codemod import CodemodContext
+from piranha_python import driver
+from piranha_python.cache import TransformCache
+from piranha_python.codemods import MultiFlagPiranhaCommand
+from piranha_python.ignore import IgnoreRules
+from piranha_python.profiling import TransformProfiler
+
+DEFAULT_MAX_BATCH_BYTES = 1024 * 1024
+DEFAULT_MAX_BATCH_FILES = 64
+DEFAULT_BATCHES_PER_WORKER = 4
+DEFAULT_MAX_TASKS_PER_CHILD = 1000
+WRITER_THREADS = 8
+
+_worker_command = None
+_worker_cache = None
+_worker_repo_root = None
+_worker_profiler = None
+
+
+def run_parallel(
+    command,
+    paths,
+    repo_root=".",
+    write=True,
+    cache_directory=None,
+    jobs=None,
+    max_batch_bytes=DEFAULT_MAX_BATCH_BYTES,
+    max_batch_files=DEFAULT_MAX_BATCH_FILES,
+    max_tasks_per_child=DEFAULT_MAX_TASKS_PER_CHILD,
+    profiler=None,
+    verdicts=None,
+    diffs=False,
+):
+    """Transform every Python file under the given paths using a pool of worker processes.
+
+    Files are prefiltered here over memory maps, so workers only ever receive the files that may reference the flags.
+    Workers read the files as they transform them, so only the batches in flight are ever held in memory. When a
+    profiler is passed, workers instrument their commands and the profiler collects each file's timings. The verdict
+    store, if any, is only ever used from this process. With ``diffs``, the report also holds the unified diff of
+    every changed file.
+    """
+    jobs = jobs or os.cpu_count() or 1
+    report = driver.RunReport()
+    files_with_sizes = []
+    verdict_keys = {}
+    for path in driver.python_files_in(paths, command.ignore_rules, repo_root):
+        full_module_name = driver.full_module_name_of(path, repo_root)
+        if command.is_module_ignored(full_module_name):
+            report.record(driver.FileResult(path, driver.IGNORED))
+            continue
+
+        try:
+            with driver.mapped_if_may_reference_flags(command, path) as mapped_source:
+                size = len(mapped_source) if mapped_source is not None else None
+                if mapped_source is not None and verdicts is not None:
+                    keys = verdicts.keys_for(command, mapped_source, full_module_name)
+        except OSError as e:
+            report.record(driver.FileResult(path, driver.FAILED, error="%s: %s" % (type(e).__name__, e)))
+            continue
+        if size is None:
+            report.record(driver.FileResult(path, driver.SKIPPED_BY_PREFILTER))
+            continue
+
+        if verdicts is not None:
+            if verdicts.is_clean(keys):
+                report.record(driver.FileResult(path, driver.UNCHANGED, from_verdict_store=True))
+                continue
+            verdict_keys[path] = (keys, full_module_name)
+
+        files_with_sizes.append((path, size))
+
+    batches = batches_of(files_with_sizes, jobs, max_batch_bytes=max_batch_bytes, max_batch_files=max_batch_files)
+    worker_args = (command.configuration(), cache_directory, repo_root, profiler is not None)
+    if jobs == 1:
+        initialize_worker(*worker_args)
+        results_per_batch = map(_transform_batch, batches)
+        return _collect(results_per_batch, report, write, profiler, command, verdicts, verdict_keys, diffs, repo_root)
+
+    with multiprocessing.Pool(
+        jobs, initializer=initialize_worker, initargs=worker_args, maxtasksperchild=max_tasks_per_child
+    ) as pool:
+        results_per_batch = pool.imap_unordered(_transform_batch, batches, chunksize=1)
+        return _collect(results_per_batch, report, write, profiler, command, verdicts, verdict_keys, diffs, repo_root)
+
+
+def batches_of(
+    files_with_sizes, jobs, max_batch_bytes=DEFAULT_MAX_BATCH_BYTES, max_batch_files=DEFAULT_MAX_BATCH_FILES
+):
+    """Group files into batches, largest files first, shrinking batches as the remaining work shrinks.
+
+    Workers pull one batch at a time, so a worker that finishes early takes the next batch instead of waiting for the
+    others, and the small batches at the tail of the queue keep every worker busy until the very end.
+    """
+    files_with_sizes = sorted(files_with_sizes, key=lambda f: (-f[1], f[0]))
+    remaining_bytes = sum(size for _, size in files_with_sizes)
+    batches = []
+    batch = []
+    batch_bytes = 0
+    for path, size in files_with_sizes:
+        if len(batch) == 0:
+            target_batch_bytes = min(max_batch_bytes, remaining_bytes // (jobs * DEFAULT_BATCHES_PER_WORKER))
+        batch.append(path)
+        batch_bytes += size
+        remaining_bytes -= size
+        if batch_bytes >= target_batch_bytes or len(batch) >= max_batch_files:
+            batches.append(batch)
+            batch = []
+            batch_bytes = 0
+
+    if len(batch) > 0:
+        batches.append(batch)
+
+    return batches
+
+
+def _collect(
+    results_per_batch,
+    report,
+    write,
+    profiler=None,
+    command=None,
+    verdicts=None,
+    verdict_keys=None,
+    diffs=False,
+    repo_root=".",
+):
+    with concurrent.futures.ThreadPoolExecutor(WRITER_THREADS) as writer:
+        for results in results_per_batch:
+            if diffs:
+                results = [driver.with_diff(r, repo_root) for r in results]
+            if write:
+                # The writes of a whole batch are issued at once, so that their latency overlaps on slow filesystems
+                results = writer.map(_written, results)
+            for result in results:
+                report.record(result)
+                if profiler is not None:
+                    profiler.record(result.profile)
+                if verdicts is not None:
+                    keys, full_module_name = verdict_keys.pop(result.path)
+                    driver.record_verdict(verdicts, keys, command, result, full_module_name)
+
+    return report
+
+
+def _written(result):
+    return driver.write_result(result) if result.status == driver.CHANGED else result
+
+
+def initialize_worker(configuration, cache_directory=None, repo_root=".", profile=False):
+    """Build the command, cache and profiler used by the transforms run in the current process."""
+    global _worker_command, _worker_cache, _worker_repo_root, _worker_profiler
+
+    _worker_command = MultiFlagPiranhaCommand(
+        CodemodContext(),
+        configuration["flags"],
+        ignored_module_check_fn_path=configuration["ignoredModuleCheckFnPath"],
+        ignore_rules=IgnoreRules.from_dict(configuration["ignoreRules"]),
+        flag_aliases_by_module=configuration["flagAliasesByModule"],
+        cleanup=configuration["cleanup"],
+        followed_by=configuration["followedBy"],
+    )
+    _worker_cache = TransformCache(cache_directory) if cache_directory is not None else None
+    _worker_repo_root = repo_root
+    _worker_profiler = TransformProfiler() if profile else None
+    if _worker_profiler is not None:
+        _worker_profiler.instrument(_worker_command)
+
+
+def transform_in_worker(path, source=None, as_edits=False):
+    """Transform a file with the command built by initialize_worker, reading it first unless its source is given.
+
+    With ``as_edits``, changed files come back as the edits to apply to them rather than as their whole new source.
+    """
+    if source is None:
+        try:
+            with open(path, "rb") as source_file:
+                source = source_file.read()
+        except OSError as e:
+            return driver.FileResult(path, driver.FAILED, error="%s: %s" % (type(e).__name__, e))
+
+    full_module_name = driver.full_module_name_of(path, _worker_repo_root)
+    result = driver.transform_source(
+        _worker_command, path, source, full_module_name, cache=_worker_cache, profiler=_worker_profiler
+    )
+    return driver.as_edits(result, source) if as_edits else result
+
+
+def _transform_batch(batch):
+    return [transform_in_worker(path, as_edits=True) for path in batch]
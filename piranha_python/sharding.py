@@ -0,0 +1,89 @@
+"""Deterministic split of a run across hosts, each writing a self-contained result file, and the merge of those files.
+
+Every shard discovers the same files and splits them the same way, so shards never need to talk to each other.
+"""
+import heapq
+import json
+import os
+
+from piranha_python.driver import RunReport, python_files_in
+from piranha_python.ignore import relative_path_of
+
+SHARD_RESULT_FORMAT_VERSION = 1
+
+
+def parse_shard(shard_spec):
+    """Parse an ``INDEX/COUNT`` shard specification, whose index starts at 1, into an ``(index, count)`` pair."""
+    try:
+        index, count = (int(p) for p in shard_spec.split("/"))
+    except ValueError:
+        raise ValueError("shards must be given as INDEX/COUNT, e.g. 1/4 - '%s' was passed" % shard_spec)
+
+    if count < 1 or not 1 <= index <= count:
+        raise ValueError("shard index must be between 1 and the shard count - '%s' was passed" % shard_spec)
+
+    return index, count
+
+
+def files_of_shard(paths, shard_index, shard_count, ignore_rules=None, repo_root="."):
+    """List the Python files under the paths that belong to the given shard, in discovery order.
+
+    Files are handed out largest first, each one to the shard holding the fewest bytes so far, so shards end up with
+    about the same amount of source. Ties are broken by relative path, which makes every host agree on the split.
+    """
+    sizes = {}
+    for path in python_files_in(paths, ignore_rules, repo_root):
+        try:
+            sizes[path] = os.stat(path).st_size
+        except OSError:
+            sizes[path] = 0
+
+    relative_paths = {p: relative_path_of(p, repo_root) for p in sizes}
+    shard_bytes = [(0, i) for i in range(1, shard_count + 1)]
+    shard_paths = set()
+    for path in sorted(sizes, key=lambda p: (-sizes[p], relative_paths[p])):
+        total_bytes, index = heapq.heappop(shard_bytes)
+        if index == shard_index:
+            shard_paths.add(path)
+        heapq.heappush(shard_bytes, (total_bytes + sizes[path], index))
+
+    return [p for p in sizes if p in shard_paths]
+
+
+def write_shard_result(path, report, shard, configuration, repo_root="."):
+    """Write a shard's report, diffs included, keyed by paths relative to the repo root so hosts can differ."""
+    report_dict = report.as_dict()
+    shard_result = {
+        "formatVersion": SHARD_RESULT_FORMAT_VERSION,
+        "shard": list(shard),
+        "configuration": configuration,
+        "counters": report_dict["counters"],
+        "failures": {relative_path_of(p, repo_root): e for p, e in report_dict["failures"].items()},
+        "diffs": {relative_path_of(p, repo_root): d for p, d in report_dict["diffs"].items()},
+    }
+    with open(path, "w") as shard_result_file:
+        json.dump(shard_result, shard_result_file, indent=2, sort_keys=True)
+
+
+def merge_shard_results(paths):
+    """Combine the result files of every shard of a run into a single report."""
+    shard_results = []
+    for path in paths:
+        with open(path) as shard_result_file:
+            shard_results.append(json.load(shard_result_file))
+
+    if any(r.get("formatVersion") != SHARD_RESULT_FORMAT_VERSION for r in shard_results):
+        raise ValueError("shard results were written by an incompatible version")
+    if any(r["configuration"] != shard_results[0]["configuration"] for r in shard_results):
+        raise ValueError("shard results come from runs with different configurations")
+
+    shard_count = shard_results[0]["shard"][1] if len(shard_results) > 0 else 0
+    shard_indices = sorted(r["shard"][0] for r in shard_results if r["shard"][1] == shard_count)
+    if shard_indices != list(range(1, shard_count + 1)) or len(shard_results) != shard_count:
+        raise ValueError("expected the results of shards 1 to %d exactly once each" % shard_count)
+
+    report = RunReport()
+    for shard_result in shard_results:
+        report.merge(RunReport.from_dict(shard_result))
+
+    return report
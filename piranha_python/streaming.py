@@ -0,0 +1,102 @@
+import concurrent.futures
+import os
+
+from piranha_python import driver, scheduler
+
+READ_CHUNK_SIZE = 64 * 1024
+
+
+class StreamedResult:
+    def __init__(self, path, status, diff=None, error=None):
+        self.path = path
+        self.status = status
+        self.diff = diff
+        self.error = error
+
+
+def stream_diffs(command, records, repo_root=".", jobs=1, max_in_flight=None):
+    """Transform the ``(path, source)`` records, yielding each file's unified diff as soon as it's computed.
+
+    Records whose source is None are read from disk. Results are yielded in completion order and at most
+    ``max_in_flight`` records are held in memory at once, however many records there are.
+    """
+    worker_args = (command.configuration(), None, repo_root)
+    records = (r for r in records if not _is_ignored(command, r[0], repo_root))
+    if jobs == 1:
+        scheduler.initialize_worker(*worker_args)
+        for path, source in records:
+            yield _diffed(path, source, repo_root)
+        return
+
+    max_in_flight = max_in_flight or jobs * 2
+    with concurrent.futures.ProcessPoolExecutor(
+        jobs, initializer=scheduler.initialize_worker, initargs=worker_args
+    ) as executor:
+        in_flight = set()
+        for path, source in records:
+            if len(in_flight) >= max_in_flight:
+                done, in_flight = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+            in_flight.add(executor.submit(_diffed, path, source, repo_root))
+
+        for future in concurrent.futures.as_completed(in_flight):
+            yield future.result()
+
+
+def paths_from(stream, separator=b"\n"):
+    """Yield ``(path, None)`` records for the paths read from a binary stream."""
+    for path in _split_records(stream, separator):
+        if len(path.strip()) > 0:
+            yield os.fsdecode(path.strip() if separator == b"\n" else path), None
+
+
+def contents_from(stream):
+    """Yield ``(path, source)`` records from a binary stream of NUL-terminated paths, each followed by its contents."""
+    records = _split_records(stream, b"\0")
+    for path in records:
+        yield os.fsdecode(path), next(records, b"")
+
+
+def _diffed(path, source, repo_root):
+    if source is None:
+        try:
+            with open(path, "rb") as source_file:
+                source = source_file.read()
+        except OSError as e:
+            return StreamedResult(path, driver.FAILED, error="%s: %s" % (type(e).__name__, e))
+
+    result = scheduler.transform_in_worker(path, source)
+    if result.status != driver.CHANGED:
+        return StreamedResult(path, result.status, error=result.error)
+
+    diff = driver.unified_diff(path, source, result.transformed_source, repo_root)
+    return StreamedResult(path, result.status, diff=diff)
+
+
+def _is_ignored(command, path, repo_root):
+    if command.ignore_rules.ignores_file(path, repo_root):
+        return True
+
+    return command.is_module_ignored(driver.full_module_name_of(path, repo_root))
+
+
+def _split_records(stream, separator):
+    record_parts = []
+    while True:
+        chunk = stream.read(READ_CHUNK_SIZE)
+        if len(chunk) == 0:
+            break
+
+        start = 0
+        separator_index = chunk.find(separator)
+        while separator_index != -1:
+            record_parts.append(chunk[start:separator_index])
+            yield b"".join(record_parts)
+            record_parts = []
+            start = separator_index + len(separator)
+            separator_index = chunk.find(separator, start)
+        record_parts.append(chunk[start:])
+
+    if any(len(p) > 0 for p in record_parts):
+        yield b"".join(record_parts)
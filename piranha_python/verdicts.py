@@ -0,0 +1,104 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+VERDICT_FORMAT_VERSION = 1
+DEFAULT_MAX_ENTRIES = 1000000
+EVICTION_INTERVAL = 4096
+COMMIT_INTERVAL = 1024
+
+
+class VerdictStore:
+    """Single file SQLite store of the modules known to be clean of a flag, so they aren't transformed again.
+
+    Verdicts are keyed on the sha256 digest of a module's bytes and on the flag's name, resolution methods and mode,
+    plus the names the flag is re-exported to the module under, so runs removing any combination of flags share them.
+    Only verdicts are stored, never transformed modules, which keeps the file small enough to be shared between CI
+    runners. Least recently used verdicts are evicted once there are more than ``max_entries`` of them.
+    """
+
+    def __init__(self, path, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._pending_writes = 0
+        self._records_since_eviction = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connection = sqlite3.connect(path, timeout=30)
+        if self._connection.execute("PRAGMA user_version").fetchone()[0] != VERDICT_FORMAT_VERSION:
+            self._connection.executescript(
+                """
+                DROP TABLE IF EXISTS clean_verdicts;
+                CREATE TABLE clean_verdicts (
+                    digest TEXT NOT NULL,
+                    flag_name TEXT NOT NULL,
+                    resolution_methods TEXT NOT NULL,
+                    mode TEXT NOT NULL,
+                    aliases TEXT NOT NULL,
+                    last_used INTEGER NOT NULL,
+                    PRIMARY KEY (digest, flag_name, resolution_methods, mode, aliases)
+                ) WITHOUT ROWID;
+                CREATE INDEX clean_verdicts_by_last_used ON clean_verdicts (last_used);
+                PRAGMA user_version = %d;
+                """
+                % VERDICT_FORMAT_VERSION
+            )
+
+    def keys_for(self, command, source, full_module_name=None):
+        """Build the keys of a module's verdicts, one for each of the command's flags."""
+        digest = hashlib.sha256(source).hexdigest()
+        module_aliases = command.flag_aliases_by_module.get(full_module_name, {})
+        return [
+            (
+                digest,
+                flag["flagName"],
+                json.dumps(flag["flagResolutionMethods"], sort_keys=True),
+                flag["mode"],
+                json.dumps(sorted(n for n, f in module_aliases.items() if f == flag["flagName"])),
+            )
+            for flag in command.flags
+        ]
+
+    def is_clean(self, keys):
+        """Tell whether the module is known to be clean of every flag the keys were built for."""
+        found_keys = 0
+        for key in keys:
+            cursor = self._connection.execute(
+                "UPDATE clean_verdicts SET last_used = ? WHERE digest = ? AND flag_name = ? AND resolution_methods = ? "
+                "AND mode = ? AND aliases = ?",
+                (time.time_ns(),) + key,
+            )
+            found_keys += cursor.rowcount
+        self._wrote(found_keys)
+
+        return found_keys == len(keys)
+
+    def record_clean(self, keys):
+        self._connection.executemany(
+            "INSERT OR REPLACE INTO clean_verdicts VALUES (?, ?, ?, ?, ?, ?)", [k + (time.time_ns(),) for k in keys]
+        )
+        self._wrote(len(keys))
+        self._records_since_eviction += 1
+        if self._records_since_eviction >= EVICTION_INTERVAL:
+            self.evict()
+
+    def evict(self):
+        self._records_since_eviction = 0
+        self._connection.execute(
+            "DELETE FROM clean_verdicts WHERE last_used <= "
+            "(SELECT last_used FROM clean_verdicts ORDER BY last_used DESC LIMIT 1 OFFSET ?)",
+            (self.max_entries,),
+        )
+        self._connection.commit()
+
+    def close(self):
+        self.evict()
+        self._connection.close()
+
+    def _wrote(self, rows):
+        # Writes are committed in batches, as committing each one would sync the file to disk once per module
+        self._pending_writes += rows
+        if self._pending_writes >= COMMIT_INTERVAL:
+            self._pending_writes = 0
+            self._connection.commit()
@@ -0,0 +1,84 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from libcst.codemod import CodemodContext
+from piranha_python import driver
+from piranha_python.cache import TransformCache, configuration_fingerprint
+from piranha_python.codemods import PiranhaCommand
+
+FEATURE_FLAG_NAME = "FEATURE_FLAG_NAME"
+FLAG_USAGE = b"if is_flag_active(FEATURE_FLAG_NAME):\n    print('Flag is active')\n"
+
+
+class TransformCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache_directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.cache_directory.cleanup)
+        self.cache = TransformCache(self.cache_directory.name)
+
+    def test_stores_unchanged_and_changed_verdicts(self):
+        self.cache.put("aa" * 32)
+        self.cache.put("bb" * 32, b"print('Flag is active')\n")
+
+        self.assertFalse(self.cache.get("aa" * 32).changed)
+        self.assertTrue(self.cache.get("bb" * 32).changed)
+        self.assertEqual(self.cache.get("bb" * 32).transformed_source, b"print('Flag is active')\n")
+        self.assertIsNone(self.cache.get("cc" * 32))
+
+    def test_keys_depend_on_the_command_configuration(self):
+        treated_fingerprint = configuration_fingerprint(_command(mode="treated"))
+        control_fingerprint = configuration_fingerprint(_command(mode="control"))
+
+        self.assertNotEqual(
+            self.cache.key_for(treated_fingerprint, FLAG_USAGE), self.cache.key_for(control_fingerprint, FLAG_USAGE)
+        )
+        self.assertEqual(
+            self.cache.key_for(treated_fingerprint, FLAG_USAGE),
+            self.cache.key_for(configuration_fingerprint(_command(mode="treated")), FLAG_USAGE),
+        )
+
+    def test_modules_checking_flags_through_aliases_dont_share_entries_with_other_modules(self):
+        source = b"from .flags import ALIAS\nif is_flag_active(ALIAS):\n    print('Flag is active')\n"
+        command = _command(flag_aliases_by_module={"aliasing.module": {"ALIAS": FEATURE_FLAG_NAME}})
+
+        aliasing_result = driver.transform_source(command, "aliasing/module.py", source, "aliasing.module", self.cache)
+        other_result = driver.transform_source(command, "other/module.py", source, "other.module", self.cache)
+
+        self.assertEqual(aliasing_result.status, driver.CHANGED)
+        self.assertEqual(other_result.status, driver.SKIPPED_BY_DETECTION)
+        self.assertFalse(other_result.from_cache)
+
+    def test_evicts_least_recently_used_entries_past_the_size_bound(self):
+        cache = TransformCache(self.cache_directory.name, max_size_bytes=64)
+        for i, key in enumerate(["aa" * 32, "bb" * 32, "cc" * 32]):
+            cache.put(key, os.urandom(40))
+            os.utime(cache._entry_path(key), (i, i))
+
+        cache.evict()
+
+        self.assertIsNone(cache.get("aa" * 32))
+        self.assertIsNone(cache.get("bb" * 32))
+        self.assertIsNotNone(cache.get("cc" * 32))
+
+    def test_cache_hits_dont_invoke_libcst(self):
+        first_result = driver.transform_source(_command(), "module.py", FLAG_USAGE, cache=self.cache)
+        with mock.patch.object(driver, "parse_module") as parse_module:
+            second_result = driver.transform_source(_command(), "module.py", FLAG_USAGE, cache=self.cache)
+
+        parse_module.assert_not_called()
+        self.assertFalse(first_result.from_cache)
+        self.assertTrue(second_result.from_cache)
+        self.assertEqual(second_result.status, driver.CHANGED)
+        self.assertEqual(second_result.transformed_source, first_result.transformed_source)
+
+
+def _command(mode="treated", flag_aliases_by_module=None):
+    return PiranhaCommand(
+        CodemodContext(),
+        flag_name=FEATURE_FLAG_NAME,
+        flag_resolution_methods="is_flag_active",
+        mode=mode,
+        flag_aliases_by_module=flag_aliases_by_module,
+    )
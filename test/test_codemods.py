@@ -1,9 +1,11 @@
 import textwrap
 
-from libcst.codemod import CodemodContext, CodemodTest
-from piranha_python.codemods import PiranhaCommand
+from libcst import CSTTransformer, parse_module
+from libcst.codemod import CodemodContext, CodemodTest, VisitorBasedCodemodCommand
+from piranha_python.codemods import MultiFlagPiranhaCommand, PiranhaCommand
 
 FEATURE_FLAG_NAME = "FEATURE_FLAG_NAME"
+OTHER_FEATURE_FLAG_NAME = "OTHER_FEATURE_FLAG_NAME"
 
 
 class PiranhaCodemodInitializationTests(CodemodTest):
@@ -496,6 +498,136 @@ class PiranhaTreatmentFlagTest(CodemodTest):
             flag_resolution_methods="is_flag_active",
         )
 
+    # Nested IF blocks tests
+    def test_keeps_IF_block_body_containing_unrelated_nested_IF_block(self):
+        self.assertCodemod(
+            _with_correct_indentation(
+                """\
+            def func():
+                if is_flag_active(%s):
+                    if is_user_logged_in():
+                        print('Flag is active')
+
+                print('This is not related to the feature flag value at all')
+            """
+                % FEATURE_FLAG_NAME
+            ),
+            _with_correct_indentation(
+                """\
+            def func():
+                if is_user_logged_in():
+                    print('Flag is active')
+
+                print('This is not related to the feature flag value at all')
+            """
+            ),
+            flag_name=FEATURE_FLAG_NAME,
+            flag_resolution_methods="is_flag_active",
+        )
+
+    def test_return_statement_removed_from_nested_IF_block_doesnt_remove_remainder(self):
+        self.assertCodemod(
+            _with_correct_indentation(
+                """\
+            def func():
+                if is_flag_active(%(flag_name)s):
+                    if not is_flag_active(%(flag_name)s):
+                        return 0
+                    print('Flag is active')
+
+                print('This is not related to the feature flag value at all')
+            """
+                % {"flag_name": FEATURE_FLAG_NAME}
+            ),
+            _with_correct_indentation(
+                """\
+            def func():
+                print('Flag is active')
+
+                print('This is not related to the feature flag value at all')
+            """
+            ),
+            flag_name=FEATURE_FLAG_NAME,
+            flag_resolution_methods="is_flag_active",
+        )
+
+    def test_keeps_only_nested_IF_block_body_when_it_has_an_unconditional_return_expression(self):
+        self.assertCodemod(
+            _with_correct_indentation(
+                """\
+            def func():
+                if is_flag_active(%(flag_name)s):
+                    if is_flag_active(%(flag_name)s):
+                        return 0
+                else:
+                    print('Flag is inactive')
+
+                print('This is not related to the feature flag value at all')
+            """
+                % {"flag_name": FEATURE_FLAG_NAME}
+            ),
+            _with_correct_indentation(
+                """\
+            def func():
+                return 0
+            """
+            ),
+            flag_name=FEATURE_FLAG_NAME,
+            flag_resolution_methods="is_flag_active",
+        )
+
+    def test_keeps_ELSE_block_when_the_removed_branch_has_a_nested_IF_block_with_a_return(self):
+        self.assertCodemod(
+            _with_correct_indentation(
+                """\
+            def func(x):
+                if not is_flag_active(%(flag_name)s):
+                    if is_flag_active(%(flag_name)s):
+                        return x
+                else:
+                    print('Flag is active')
+                    print('Still active')
+
+                print('This is not related to the feature flag value at all')
+            """
+                % {"flag_name": FEATURE_FLAG_NAME}
+            ),
+            _with_correct_indentation(
+                """\
+            def func(x):
+                print('Flag is active')
+                print('Still active')
+
+                print('This is not related to the feature flag value at all')
+            """
+            ),
+            flag_name=FEATURE_FLAG_NAME,
+            flag_resolution_methods="is_flag_active",
+        )
+
+    def test_removes_compound_statements_following_an_unconditional_return_expression(self):
+        self.assertCodemod(
+            _with_correct_indentation(
+                """\
+            def func(items):
+                if is_flag_active(%s):
+                    return 0
+
+                for item in items:
+                    print(item)
+            """
+                % FEATURE_FLAG_NAME
+            ),
+            _with_correct_indentation(
+                """\
+            def func(items):
+                return 0
+            """
+            ),
+            flag_name=FEATURE_FLAG_NAME,
+            flag_resolution_methods="is_flag_active",
+        )
+
 
 class PiranhaControlFlagTest(CodemodTest):
     TRANSFORM = PiranhaCommand
@@ -549,6 +681,31 @@ class PiranhaControlFlagTest(CodemodTest):
             flag_resolution_methods=[{"methodName": "is_control_resolution_method", "flagType": "control"}],
         )
 
+    def test_keeps_remainder_when_the_IF_block_holding_a_return_expression_is_removed_in_control_mode(self):
+        self.assertCodemod(
+            _with_correct_indentation(
+                """\
+            def func(x):
+                if is_flag_active(%(flag_name)s):
+                    if not is_flag_active(%(flag_name)s):
+                        return 1
+                print('This is not related to the feature flag value at all')
+                return 2
+            """
+                % {"flag_name": FEATURE_FLAG_NAME}
+            ),
+            _with_correct_indentation(
+                """\
+            def func(x):
+                print('This is not related to the feature flag value at all')
+                return 2
+            """
+            ),
+            flag_name=FEATURE_FLAG_NAME,
+            flag_resolution_methods="is_flag_active",
+            mode="control",
+        )
+
     def test_keeps_IF_block_when_flag_resolution_method_is_set_as_control_and_conditional_is_a_NOT(self):
         self.assertCodemod(
             _with_correct_indentation(
@@ -580,6 +737,215 @@ class PiranhaControlFlagTest(CodemodTest):
             flag_resolution_methods=[{"methodName": "is_control_resolution_method", "flagType": "control"}],
         )
 
+    def test_resolves_every_configured_method_in_a_single_pass(self):
+        self.assertCodemod(
+            _with_correct_indentation(
+                """\
+            if is_enabled(%(flag_name)s):
+                print('Flag is active')
+            else:
+                print('Flag is inactive')
+
+            if is_disabled(%(flag_name)s):
+                print('Flag is inactive')
+            else:
+                print('Flag is active')
+
+            print('This is not related to the feature flag value at all')
+            """
+                % {"flag_name": FEATURE_FLAG_NAME}
+            ),
+            _with_correct_indentation(
+                """\
+            print('Flag is active')
+            print('Flag is active')
+
+            print('This is not related to the feature flag value at all')
+            """
+            ),
+            flag_name=FEATURE_FLAG_NAME,
+            flag_resolution_methods=[
+                {"methodName": "is_enabled", "flagType": "treatment"},
+                {"methodName": "is_disabled", "flagType": "control"},
+            ],
+        )
+
+    def test_resolves_every_configured_method_in_control_mode(self):
+        self.assertCodemod(
+            _with_correct_indentation(
+                """\
+            if is_enabled(%(flag_name)s):
+                print('Flag is active')
+
+            if not is_disabled(%(flag_name)s):
+                print('Flag is active')
+
+            print('This is not related to the feature flag value at all')
+            """
+                % {"flag_name": FEATURE_FLAG_NAME}
+            ),
+            _with_correct_indentation(
+                """\
+            print('This is not related to the feature flag value at all')
+            """
+            ),
+            flag_name=FEATURE_FLAG_NAME,
+            flag_resolution_methods=[
+                {"methodName": "is_enabled", "flagType": "treatment"},
+                {"methodName": "is_disabled", "flagType": "control"},
+            ],
+            mode="control",
+        )
+
+    def test_keeps_ELIF_block_with_its_condition_and_ELSE_block_when_mode_is_control(self):
+        self.assertCodemod(
+            _with_correct_indentation(
+                """\
+            def func():
+                if is_flag_active(%(flag_name)s):
+                    print('Flag is active')
+                elif other_condition():
+                    print('Other condition')
+                else:
+                    print('Neither')
+                print('Done')
+            """
+                % {"flag_name": FEATURE_FLAG_NAME}
+            ),
+            _with_correct_indentation(
+                """\
+            def func():
+                if other_condition():
+                    print('Other condition')
+                else:
+                    print('Neither')
+                print('Done')
+            """
+            ),
+            flag_name=FEATURE_FLAG_NAME,
+            flag_resolution_methods="is_flag_active",
+            mode="control",
+        )
+
+    def test_keeps_ELIF_blocks_with_their_conditions_when_mode_is_control(self):
+        self.assertCodemod(
+            _with_correct_indentation(
+                """\
+            if is_flag_active(%(flag_name)s):
+                print('Flag is active')
+            elif other_condition():
+                print('Other condition')
+            elif another_condition():
+                print('Another condition')
+            """
+                % {"flag_name": FEATURE_FLAG_NAME}
+            ),
+            _with_correct_indentation(
+                """\
+            if other_condition():
+                print('Other condition')
+            elif another_condition():
+                print('Another condition')
+            """
+            ),
+            flag_name=FEATURE_FLAG_NAME,
+            flag_resolution_methods="is_flag_active",
+            mode="control",
+        )
+
+
+class PiranhaCodemodReceiverTest(CodemodTest):
+    TRANSFORM = MultiFlagPiranhaCommand
+
+    def test_resolves_methods_called_on_any_receiver_when_no_receiver_type_is_set(self):
+        self.assertCodemod(
+            _with_correct_indentation(
+                """\
+            if flags_client.is_enabled(%(flag_name)s):
+                print('Flag is active')
+
+            if not settings.FLAGS.is_enabled(%(flag_name)s):
+                print('Flag is inactive')
+
+            print('This is not related to the feature flag value at all')
+            """
+                % {"flag_name": FEATURE_FLAG_NAME}
+            ),
+            _with_correct_indentation(
+                """\
+            print('Flag is active')
+
+            print('This is not related to the feature flag value at all')
+            """
+            ),
+            flags=[{"flagName": FEATURE_FLAG_NAME, "flagResolutionMethods": "is_enabled"}],
+        )
+
+    def test_only_resolves_methods_called_on_the_configured_receiver_type(self):
+        self.assertCodemod(
+            _with_correct_indentation(
+                """\
+            if settings.FLAGS.enabled(%(flag_name)s):
+                print('Flag is active')
+
+            if other_client.enabled(%(flag_name)s):
+                print('Nothing to see here')
+
+            if enabled(%(flag_name)s):
+                print('Nothing to see here either')
+            """
+                % {"flag_name": FEATURE_FLAG_NAME}
+            ),
+            _with_correct_indentation(
+                """\
+            print('Flag is active')
+
+            if other_client.enabled(%(flag_name)s):
+                print('Nothing to see here')
+
+            if enabled(%(flag_name)s):
+                print('Nothing to see here either')
+            """
+                % {"flag_name": FEATURE_FLAG_NAME}
+            ),
+            flags=[
+                {
+                    "flagName": FEATURE_FLAG_NAME,
+                    "flagResolutionMethods": [
+                        {"methodName": "enabled", "flagType": "treatment", "receiverType": "settings.FLAGS"}
+                    ],
+                }
+            ],
+        )
+
+    def test_prefers_the_configured_receiver_type_over_the_method_on_any_receiver(self):
+        self.assertCodemod(
+            _with_correct_indentation(
+                """\
+            if flags_client.is_active(%(flag_name)s):
+                print('Flag is active')
+
+            if legacy_flags.is_active(%(flag_name)s):
+                print('Flag is inactive')
+            """
+                % {"flag_name": FEATURE_FLAG_NAME}
+            ),
+            _with_correct_indentation(
+                """\
+            print('Flag is active')
+            """
+            ),
+            flags=[
+                {
+                    "flagName": FEATURE_FLAG_NAME,
+                    "flagResolutionMethods": [
+                        {"methodName": "is_active", "flagType": "treatment", "receiverType": "flags_client"},
+                        {"methodName": "is_active", "flagType": "control"},
+                    ],
+                }
+            ],
+        )
+
 
 class PiranhaCodemodFlagDeclarationRemovalTest(CodemodTest):
     TRANSFORM = PiranhaCommand
@@ -658,6 +1024,16 @@ class PiranhaCodemodFlagDeclarationRemovalTest(CodemodTest):
             flag_resolution_methods="is_flag_active",
         )
 
+    def test_unpacks_flag_into_a_throwaway_name_when_the_assigned_value_isnt_a_tuple(self):
+        self.assertCodemod(
+            "%(flag_name)s, other = build_flags()\n"
+            "(value, %(flag_name)s) = (1, 2)\n"
+            "first, %(flag_name)s, last = 1, 2, 3\n" % {"flag_name": FEATURE_FLAG_NAME},
+            "_, other = build_flags()\n(value,) = (1,)\nfirst, last = 1, 3\n",
+            flag_name=FEATURE_FLAG_NAME,
+            flag_resolution_methods="is_flag_active",
+        )
+
 
 class PiranhaCodemodFlagImportsHandlingTest(CodemodTest):
     TRANSFORM = PiranhaCommand
@@ -798,6 +1174,29 @@ class PiranhaCodemodFlagImportsHandlingTest(CodemodTest):
             flag_resolution_methods="is_flag_active",
         )
 
+    def test_removes_flag_listed_last_in_IMPORT_FROM_without_leaving_a_trailing_comma(self):
+        self.assertCodemod(
+            _with_correct_indentation(
+                """\
+            from feature_flags import ANOTHER_FLAG, %(flag_name)s
+
+
+            print('This is not related to the feature flag value at all')
+            """
+                % {"flag_name": FEATURE_FLAG_NAME}
+            ),
+            _with_correct_indentation(
+                """\
+            from feature_flags import ANOTHER_FLAG
+
+
+            print('This is not related to the feature flag value at all')
+            """
+            ),
+            flag_name=FEATURE_FLAG_NAME,
+            flag_resolution_methods="is_flag_active",
+        )
+
 
 class PiranhaCodemodUnchangedCodeTest(CodemodTest):
     TRANSFORM = PiranhaCommand
@@ -903,6 +1302,413 @@ class PiranhaCodemodUnchangedCodeTest(CodemodTest):
         )
 
 
+class PiranhaMultiFlagTest(CodemodTest):
+    TRANSFORM = MultiFlagPiranhaCommand
+
+    def test_unsupported_mode_name_in_any_flag_raises_exception(self):
+        with self.assertRaises(ValueError) as thrown_exception:
+            self.assertCodemod(
+                "print('This is not related to the feature flag value at all')",
+                "print('This is not related to the feature flag value at all')",
+                flags=[
+                    {"flagName": FEATURE_FLAG_NAME, "flagResolutionMethods": "is_flag_active"},
+                    {
+                        "flagName": OTHER_FEATURE_FLAG_NAME,
+                        "flagResolutionMethods": "is_flag_active",
+                        "mode": "not-a-supported-mode",
+                    },
+                ],
+            )
+
+        self.assertIn("mode", thrown_exception.exception.args[0])
+
+    def test_resolves_each_flag_with_its_own_method_and_mode(self):
+        self.assertCodemod(
+            _with_correct_indentation(
+                """\
+            if is_flag_active(%(flag_name)s):
+                print('Flag is active')
+            else:
+                print('Flag is inactive')
+
+            if is_other_flag_active(%(other_flag_name)s):
+                print('Other flag is active')
+            else:
+                print('Other flag is inactive')
+
+            if is_other_flag_active(%(flag_name)s):
+                print('Nothing to see here')
+
+            print('This is not related to the feature flag value at all')
+            """
+                % {"flag_name": FEATURE_FLAG_NAME, "other_flag_name": OTHER_FEATURE_FLAG_NAME}
+            ),
+            _with_correct_indentation(
+                """\
+            print('Flag is active')
+            print('Other flag is inactive')
+
+            if is_other_flag_active(%(flag_name)s):
+                print('Nothing to see here')
+
+            print('This is not related to the feature flag value at all')
+            """
+                % {"flag_name": FEATURE_FLAG_NAME}
+            ),
+            flags=[
+                {"flagName": FEATURE_FLAG_NAME, "flagResolutionMethods": "is_flag_active"},
+                {
+                    "flagName": OTHER_FEATURE_FLAG_NAME,
+                    "flagResolutionMethods": "is_other_flag_active",
+                    "mode": "control",
+                },
+            ],
+        )
+
+    def test_removes_imports_and_declarations_of_every_flag(self):
+        self.assertCodemod(
+            _with_correct_indentation(
+                """\
+            from feature_flags import %(flag_name)s as MY_ALIASED_FLAG_NAME, UNRELATED_NAME
+            import feature_flags.%(other_flag_name)s
+
+            %(flag_name)s = 'my_flag'
+            %(other_flag_name)s = 'my_other_flag'
+
+            if is_flag_active(MY_ALIASED_FLAG_NAME):
+                print('Flag is active')
+
+            if not is_flag_active(%(other_flag_name)s):
+                print('Other flag is inactive')
+            """
+                % {"flag_name": FEATURE_FLAG_NAME, "other_flag_name": OTHER_FEATURE_FLAG_NAME}
+            ),
+            _with_correct_indentation(
+                """\
+            from feature_flags import UNRELATED_NAME
+            print('Flag is active')
+            """
+            ),
+            flags=[
+                {"flagName": FEATURE_FLAG_NAME, "flagResolutionMethods": "is_flag_active"},
+                {
+                    "flagName": OTHER_FEATURE_FLAG_NAME,
+                    "flagResolutionMethods": [{"methodName": "is_flag_active", "flagType": "treatment"}],
+                },
+            ],
+        )
+
+
+class PiranhaCodemodCleanupTest(CodemodTest):
+    TRANSFORM = PiranhaCommand
+
+    def test_removes_imports_only_used_by_the_removed_branch(self):
+        self.assertCodemod(
+            _with_correct_indentation(
+                """\
+            import logging
+            from feature_flags import %(flag_name)s, is_flag_active
+            from rendering import legacy_render, render
+
+            if is_flag_active(%(flag_name)s):
+                render()
+            else:
+                logging.info('Rendering the legacy page')
+                legacy_render()
+            """
+                % {"flag_name": FEATURE_FLAG_NAME}
+            ),
+            _with_correct_indentation(
+                """\
+            from rendering import render
+            render()
+            """
+            ),
+            flag_name=FEATURE_FLAG_NAME,
+            flag_resolution_methods="is_flag_active",
+            cleanup=True,
+        )
+
+    def test_keeps_local_assignments_to_names_later_updated_in_place(self):
+        self.assertCodemod(
+            _with_correct_indentation(
+                """\
+            def count_retries():
+                retries = 1
+                if not is_flag_active(%(flag_name)s):
+                    print(retries)
+                retries += 1
+            """
+                % {"flag_name": FEATURE_FLAG_NAME}
+            ),
+            _with_correct_indentation(
+                """\
+            def count_retries():
+                retries = 1
+                retries += 1
+            """
+            ),
+            flag_name=FEATURE_FLAG_NAME,
+            flag_resolution_methods="is_flag_active",
+            cleanup=True,
+        )
+
+    def test_removes_local_assignments_only_used_by_the_removed_branch(self):
+        self.assertCodemod(
+            _with_correct_indentation(
+                """\
+            def render_page(request):
+                legacy_template = 'legacy.html'
+                fallback_template = legacy_template
+                template = 'page.html'
+                retries = 3
+                client = build_client()
+                if is_flag_active(%(flag_name)s):
+                    return render(template)
+                return render(fallback_template, client)
+            """
+                % {"flag_name": FEATURE_FLAG_NAME}
+            ),
+            _with_correct_indentation(
+                """\
+            def render_page(request):
+                template = 'page.html'
+                retries = 3
+                client = build_client()
+                return render(template)
+            """
+            ),
+            flag_name=FEATURE_FLAG_NAME,
+            flag_resolution_methods="is_flag_active",
+            cleanup=True,
+        )
+
+    def test_removes_blocks_left_empty(self):
+        self.assertCodemod(
+            _with_correct_indentation(
+                """\
+            if debug:
+                if not is_flag_active(%(flag_name)s):
+                    print('Flag is inactive')
+
+            if verbose:
+                print('Verbose')
+            else:
+                if not is_flag_active(%(flag_name)s):
+                    print('Flag is inactive')
+            """
+                % {"flag_name": FEATURE_FLAG_NAME}
+            ),
+            _with_correct_indentation(
+                """\
+            if verbose:
+                print('Verbose')
+            """
+            ),
+            flag_name=FEATURE_FLAG_NAME,
+            flag_resolution_methods="is_flag_active",
+            cleanup=True,
+        )
+
+    def test_keeps_module_level_assignments_and_exported_imports(self):
+        self.assertCodemod(
+            _with_correct_indentation(
+                """\
+            from rendering import legacy_render
+
+            __all__ = ['legacy_render']
+            LEGACY_TEMPLATE = 'legacy.html'
+
+            if not is_flag_active(%(flag_name)s):
+                legacy_render(LEGACY_TEMPLATE)
+            """
+                % {"flag_name": FEATURE_FLAG_NAME}
+            ),
+            _with_correct_indentation(
+                """\
+            from rendering import legacy_render
+
+            __all__ = ['legacy_render']
+            LEGACY_TEMPLATE = 'legacy.html'
+            """
+            ),
+            flag_name=FEATURE_FLAG_NAME,
+            flag_resolution_methods="is_flag_active",
+            cleanup=True,
+        )
+
+    def test_keeps_imports_left_unused_without_cleanup(self):
+        self.assertCodemod(
+            _with_correct_indentation(
+                """\
+            from rendering import legacy_render
+
+            if not is_flag_active(%(flag_name)s):
+                legacy_render()
+            """
+                % {"flag_name": FEATURE_FLAG_NAME}
+            ),
+            _with_correct_indentation(
+                """\
+            from rendering import legacy_render
+            """
+            ),
+            flag_name=FEATURE_FLAG_NAME,
+            flag_resolution_methods="is_flag_active",
+        )
+
+
+class PiranhaCodemodFollowedByTest(CodemodTest):
+    TRANSFORM = PiranhaCommand
+
+    def test_runs_the_following_transforms_in_order_over_modules_the_flag_was_removed_from(self):
+        self.assertCodemod(
+            _with_correct_indentation(
+                """\
+            if is_flag_active(%(flag_name)s):
+                render()
+            """
+                % {"flag_name": FEATURE_FLAG_NAME}
+            ),
+            _with_correct_indentation(
+                """\
+            render_v2()
+            """
+            ),
+            flag_name=FEATURE_FLAG_NAME,
+            flag_resolution_methods="is_flag_active",
+            followed_by=[RenamingRenderTransformer, "test.test_codemods.RenamingRenderPageCommand"],
+        )
+
+    def test_doesnt_run_the_following_transforms_over_modules_without_the_flag(self):
+        self.assertCodemod(
+            "render()",
+            "render()",
+            flag_name=FEATURE_FLAG_NAME,
+            flag_resolution_methods="is_flag_active",
+            followed_by=[RenamingRenderTransformer],
+        )
+
+    def test_following_transforms_must_be_libcst_codemods_or_transformers(self):
+        with self.assertRaises(ValueError):
+            PiranhaCommand(
+                CodemodContext(),
+                flag_name=FEATURE_FLAG_NAME,
+                flag_resolution_methods="is_flag_active",
+                followed_by=["test.test_codemods._always_return_true"],
+            )
+
+
+class PiranhaCodemodDispatchTest(CodemodTest):
+    TRANSFORM = PiranhaCommand
+
+    def test_visit_methods_returning_false_skip_the_children_and_attributes_of_a_node(self):
+        code = _with_correct_indentation(
+            """\
+            def skipped():
+                if is_flag_active(%(flag_name)s):
+                    print('Flag is active')
+
+            def visited():
+                return 2
+            """
+            % {"flag_name": FEATURE_FLAG_NAME}
+        )
+        command = _recording_command(RecordingPiranhaCommand)
+
+        tree = command.transform_module(parse_module(code))
+
+        self.assertEqual(tree.code, code)
+        self.assertEqual(
+            command.calls,
+            [
+                ("visit_FunctionDef", "skipped"),
+                ("visit_FunctionDef", "visited"),
+                ("visit_FunctionDef_body", "visited"),
+                ("visit_Integer", "2"),
+                ("leave_FunctionDef_body", "visited"),
+            ],
+        )
+
+    def test_calls_the_same_methods_with_the_same_results_as_libcst_dispatch(self):
+        code = _with_correct_indentation(
+            """\
+            from flags import %(flag_name)s, OTHER_FLAG
+
+            %(flag_name)s, other = 'flag', 'other'
+
+            def skipped():
+                if is_flag_active(%(flag_name)s):
+                    print('Flag is active')
+
+            def visited(argument):
+                if not is_flag_active(%(flag_name)s) and argument:
+                    print(1)
+                elif is_flag_active(%(flag_name)s) or argument:
+                    print(2)
+                else:
+                    print(3)
+                return is_flag_active(%(flag_name)s)
+            """
+            % {"flag_name": FEATURE_FLAG_NAME}
+        )
+
+        for mode in ("treated", "control"):
+            with self.subTest(mode=mode):
+                command = _recording_command(RecordingPiranhaCommand, mode)
+                libcst_dispatched_command = _recording_command(LibcstDispatchedRecordingPiranhaCommand, mode)
+
+                tree = command.transform_module(parse_module(code))
+                libcst_dispatched_tree = libcst_dispatched_command.transform_module(parse_module(code))
+
+                self.assertNotEqual(tree.code, code)
+                self.assertEqual(tree.code, libcst_dispatched_tree.code)
+                self.assertEqual(command.calls, libcst_dispatched_command.calls)
+                self.assertEqual(command.replacements, libcst_dispatched_command.replacements)
+
+
+class RenamingRenderTransformer(CSTTransformer):
+    def leave_Name(self, original_node, updated_node):
+        return updated_node.with_changes(value="render_page") if updated_node.value == "render" else updated_node
+
+
+class RenamingRenderPageCommand(VisitorBasedCodemodCommand):
+    def leave_Name(self, original_node, updated_node):
+        return updated_node.with_changes(value="render_v2") if updated_node.value == "render_page" else updated_node
+
+
+class RecordingPiranhaCommand(PiranhaCommand):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.calls = []
+
+    def visit_FunctionDef(self, node):
+        self.calls.append(("visit_FunctionDef", node.name.value))
+        return False if node.name.value == "skipped" else None
+
+    def visit_FunctionDef_body(self, node):
+        self.calls.append(("visit_FunctionDef_body", node.name.value))
+
+    def leave_FunctionDef_body(self, node):
+        self.calls.append(("leave_FunctionDef_body", node.name.value))
+
+    def visit_Integer(self, node):
+        self.calls.append(("visit_Integer", node.value))
+
+
+class LibcstDispatchedRecordingPiranhaCommand(RecordingPiranhaCommand):
+    on_visit = VisitorBasedCodemodCommand.on_visit
+    on_leave = VisitorBasedCodemodCommand.on_leave
+    on_visit_attribute = VisitorBasedCodemodCommand.on_visit_attribute
+    on_leave_attribute = VisitorBasedCodemodCommand.on_leave_attribute
+
+
+def _recording_command(command_class, mode="treated"):
+    return command_class(
+        CodemodContext(), flag_name=FEATURE_FLAG_NAME, flag_resolution_methods="is_flag_active", mode=mode
+    )
+
+
 def _context_representing_test_module():
     return CodemodContext(filename="test_module.py", full_module_name="piranha.test_module")
 
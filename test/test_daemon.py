@@ -0,0 +1,86 @@
+import contextlib
+import io
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from piranha_python import client
+from piranha_python.daemon import Daemon
+
+FEATURE_FLAG_NAME = "FEATURE_FLAG_NAME"
+FLAGS = [{"flagName": FEATURE_FLAG_NAME, "flagResolutionMethods": "is_flag_active", "mode": "treated"}]
+FLAG_USAGE = """\
+print('Before the flag')
+if is_flag_active(FEATURE_FLAG_NAME):
+    print('Flag is active')
+"""
+
+
+class DaemonTest(unittest.TestCase):
+    def setUp(self):
+        self.repo = tempfile.TemporaryDirectory()
+        self.addCleanup(self.repo.cleanup)
+        self.socket_path = os.path.join(self.repo.name, ".piranha", "daemon.sock")
+        self.paths = []
+        for filename, source in (("flag_usage.py", FLAG_USAGE), ("test_flag_usage.py", FLAG_USAGE), ("other.py", "")):
+            path = os.path.join(self.repo.name, filename)
+            with open(path, "w") as module_file:
+                module_file.write(source)
+            self.paths.append(path)
+
+    def test_returns_diffs_of_the_requested_files_without_writing_them(self):
+        self._start_daemon(jobs=1)
+
+        response = client.request(
+            {"flags": FLAGS, "paths": [self.repo.name], "repoRoot": self.repo.name}, self.socket_path
+        )
+
+        self.assertEqual(
+            [(r["path"], r["status"]) for r in response["results"]],
+            [(self.paths[0], "changed"), (self.paths[2], "skipped_by_prefilter")],
+        )
+        self.assertIn("-if is_flag_active(FEATURE_FLAG_NAME):\n", response["results"][0]["diff"])
+        self.assertIn("+++ b/flag_usage.py\n", response["results"][0]["diff"])
+        with open(self.paths[0]) as module_file:
+            self.assertEqual(module_file.read(), FLAG_USAGE)
+
+    def test_serves_several_requests_with_worker_processes(self):
+        self._start_daemon(jobs=2)
+        treated_request = {"flags": FLAGS, "paths": self.paths[:1] + self.paths[2:], "repoRoot": self.repo.name}
+        control_request = dict(treated_request, flags=[dict(FLAGS[0], mode="control")])
+
+        treated_response = client.request(treated_request, self.socket_path)
+        control_response = client.request(control_request, self.socket_path)
+
+        self.assertIn("+print('Flag is active')\n", treated_response["results"][0]["diff"])
+        self.assertIn("-    print('Flag is active')\n", control_response["results"][0]["diff"])
+
+    def test_reports_invalid_requests(self):
+        self._start_daemon(jobs=1)
+
+        with self.assertRaisesRegex(RuntimeError, "KeyError"):
+            client.request({"paths": self.paths}, self.socket_path)
+
+    def test_client_prints_diffs(self):
+        self._start_daemon(jobs=1)
+        output = io.StringIO()
+
+        with contextlib.redirect_stdout(output):
+            exit_code = client.main(
+                ["--socket", self.socket_path, "--flag-name", FEATURE_FLAG_NAME, "--method-name", "is_flag_active"]
+                + ["--repo-root", self.repo.name, self.paths[0]]
+            )
+
+        self.assertEqual(exit_code, 0)
+        self.assertIn("--- a/flag_usage.py\n", output.getvalue())
+
+    def _start_daemon(self, jobs):
+        daemon = Daemon(self.socket_path, jobs=jobs)
+        serving_thread = threading.Thread(target=daemon.serve_forever)
+        serving_thread.start()
+        self.addCleanup(serving_thread.join)
+        self.addCleanup(client.request, {"command": "shutdown"}, self.socket_path)
+        while not os.path.exists(self.socket_path):
+            time.sleep(0.01)
@@ -0,0 +1,57 @@
+import unittest
+
+from libcst.codemod import CodemodContext
+from piranha_python.codemods import MultiFlagPiranhaCommand
+from piranha_python.detection import confirms_flag_usage
+
+FEATURE_FLAG_NAME = "FEATURE_FLAG_NAME"
+
+
+class FlagUsageDetectionTest(unittest.TestCase):
+    def setUp(self):
+        self.command = MultiFlagPiranhaCommand(
+            CodemodContext(),
+            [
+                {
+                    "flagName": FEATURE_FLAG_NAME,
+                    "flagResolutionMethods": [
+                        {"methodName": "is_enabled", "flagType": "treatment", "receiverType": "flags_client"}
+                    ],
+                }
+            ],
+            flag_aliases_by_module={"app.consumer": {"LOCAL_FLAG": FEATURE_FLAG_NAME}},
+        )
+
+    def test_confirms_flag_checks_assignments_and_imports(self):
+        for source in (
+            "if is_enabled(FEATURE_FLAG_NAME):\n    pass\n",
+            "def f():\n    if not flags_client.is_enabled(FEATURE_FLAG_NAME):\n        pass\n",
+            "if a:\n    pass\nelif flags_client.is_enabled(FEATURE_FLAG_NAME):\n    pass\n",
+            "FEATURE_FLAG_NAME = 'feature_flag'\n",
+            "FEATURE_FLAG_NAME, OTHER_FLAG = 'feature_flag', 'other_flag'\n",
+            "from flags import FEATURE_FLAG_NAME as ALIASED_FLAG\n",
+            "import flags.FEATURE_FLAG_NAME\n",
+        ):
+            with self.subTest(source=source):
+                self.assertTrue(confirms_flag_usage(self.command, source.encode("utf-8")))
+
+    def test_does_not_confirm_modules_only_mentioning_the_flag(self):
+        for source in (
+            "print('FEATURE_FLAG_NAME is only mentioned here')\n",
+            "# FEATURE_FLAG_NAME\n",
+            "log(FEATURE_FLAG_NAME)\n",
+            "if is_enabled(FEATURE_FLAG_NAME) and other_condition:\n    pass\n",
+            "if is_other_method(FEATURE_FLAG_NAME):\n    pass\n",
+            "x = FEATURE_FLAG_NAME\n",
+        ):
+            with self.subTest(source=source):
+                self.assertFalse(confirms_flag_usage(self.command, source.encode("utf-8")))
+
+    def test_confirms_checks_of_flags_re_exported_to_the_module(self):
+        source = b"if is_enabled(LOCAL_FLAG):\n    pass\n"
+
+        self.assertTrue(confirms_flag_usage(self.command, source, "app.consumer"))
+        self.assertFalse(confirms_flag_usage(self.command, source, "app.other"))
+
+    def test_confirms_modules_the_standard_library_cant_parse(self):
+        self.assertTrue(confirms_flag_usage(self.command, b"if is_enabled(FEATURE_FLAG_NAME)\n"))
@@ -0,0 +1,218 @@
+import os
+import tempfile
+import textwrap
+import unittest
+from unittest import mock
+
+from libcst.codemod import CodemodContext
+from piranha_python import driver
+from piranha_python.codemods import PiranhaCommand
+from piranha_python.profiling import TransformProfiler
+
+FEATURE_FLAG_NAME = "FEATURE_FLAG_NAME"
+
+
+class PiranhaDriverTest(unittest.TestCase):
+    def setUp(self):
+        self.repo_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.repo_root.cleanup)
+
+    def test_files_that_cant_reference_the_flag_never_reach_the_parser(self):
+        unrelated_module = self._write_module("unrelated.py", "print('Nothing to see here')\n")
+
+        with mock.patch.object(driver, "parse_module") as parse_module:
+            report = driver.run(_command(), [self.repo_root.name], repo_root=self.repo_root.name)
+
+        parse_module.assert_not_called()
+        self.assertEqual(report.counters["files_skipped_by_prefilter"], 1)
+        self.assertEqual(report.counters["files_processed"], 1)
+        self.assertEqual(_read(unrelated_module), "print('Nothing to see here')\n")
+
+    def test_rewrites_files_that_use_the_flag(self):
+        flag_module = self._write_module(
+            "package/flag_usage.py",
+            """\
+            if is_flag_active(%s):
+                print('Flag is active')
+            """
+            % FEATURE_FLAG_NAME,
+        )
+        self._write_module("package/unrelated.py", "print('Nothing to see here')\n")
+
+        report = driver.run(_command(), [self.repo_root.name], repo_root=self.repo_root.name)
+
+        self.assertEqual(_read(flag_module), "print('Flag is active')\n")
+        self.assertEqual(report.counters["files_changed"], 1)
+        self.assertEqual(report.counters["files_skipped_by_prefilter"], 1)
+
+    def test_ignored_modules_are_not_read(self):
+        self._write_module(
+            "test_flag_usage.py",
+            """\
+            if is_flag_active(%s):
+                print('Flag is active')
+            """
+            % FEATURE_FLAG_NAME,
+        )
+
+        with mock.patch("builtins.open") as opened_file:
+            report = driver.run(_command(), [self.repo_root.name], repo_root=self.repo_root.name, write=False)
+
+        opened_file.assert_not_called()
+        self.assertEqual(report.counters["files_ignored"], 1)
+
+    def test_reports_files_that_fail_to_parse(self):
+        broken_module = self._write_module("broken.py", "if is_flag_active(%s)\n" % FEATURE_FLAG_NAME)
+
+        report = driver.run(_command(), [self.repo_root.name], repo_root=self.repo_root.name)
+
+        self.assertEqual(report.counters["files_failed"], 1)
+        self.assertIn(broken_module, report.failures)
+
+    def test_skips_code_generation_of_modules_without_flag_sites(self):
+        # Detection confirms any assignment to the flag, though only tuple targets are rewritten by the transform
+        self._write_module("list_assignment.py", "[%s, other] = values\n" % FEATURE_FLAG_NAME)
+        profiler = TransformProfiler()
+
+        report = driver.run(_command(), [self.repo_root.name], repo_root=self.repo_root.name, profiler=profiler)
+
+        self.assertEqual(report.counters["files_unchanged"], 1)
+        self.assertGreater(profiler.phases["transform"], 0)
+        self.assertEqual(profiler.phases["codegen"], 0)
+
+    def test_modules_only_mentioning_the_flag_never_reach_libcst(self):
+        self._write_module("mention.py", "print('%s is only mentioned here')\n" % FEATURE_FLAG_NAME)
+        self._write_module("flag_usage.py", "if is_flag_active(%s):\n    print('Flag is active')\n" % FEATURE_FLAG_NAME)
+
+        with mock.patch.object(driver, "parse_module", wraps=driver.parse_module) as parse_module:
+            report = driver.run(_command(), [self.repo_root.name], repo_root=self.repo_root.name)
+
+        self.assertEqual(parse_module.call_count, 1)
+        self.assertEqual(report.counters["files_skipped_by_detection"], 1)
+        self.assertEqual(report.counters["files_confirmed"], 1)
+        self.assertEqual(report.counters["files_changed"], 1)
+        self.assertEqual(report.as_dict()["confirmationRate"], 0.5)
+
+    def test_transforms_following_the_flag_removal_reuse_its_parse(self):
+        flag_module = self._write_module("flag_usage.py", "if is_flag_active(%s):\n    render()\n" % FEATURE_FLAG_NAME)
+        command = PiranhaCommand(
+            CodemodContext(),
+            flag_name=FEATURE_FLAG_NAME,
+            flag_resolution_methods="is_flag_active",
+            followed_by=["test.test_codemods.RenamingRenderTransformer"],
+        )
+
+        with mock.patch.object(driver, "parse_module", wraps=driver.parse_module) as parse_module:
+            report = driver.run(command, [self.repo_root.name], repo_root=self.repo_root.name)
+
+        self.assertEqual(parse_module.call_count, 1)
+        self.assertEqual(report.counters["files_changed"], 1)
+        self.assertEqual(_read(flag_module), "render_page()\n")
+
+    def test_modules_transformed_after_a_failure_dont_inherit_its_state(self):
+        command = _command()
+        flag_name = FEATURE_FLAG_NAME.encode("utf-8")
+        failing_source = b"def f():\n    if is_flag_active(%s):\n        return 1\n    x = 1\n" % flag_name
+        source = b"if is_flag_active(%s):\n    print('Flag is active')\nprint('Done')\n" % flag_name
+
+        with mock.patch.object(PiranhaCommand, "leave_Assign", side_effect=TypeError("boom")):
+            failed_result = driver.transform_source(command, "failing.py", failing_source)
+        result = driver.transform_source(command, "module.py", source)
+
+        self.assertEqual(failed_result.status, driver.FAILED)
+        self.assertEqual(result.transformed_source, b"print('Flag is active')\nprint('Done')\n")
+
+    def test_edits_only_span_the_changed_lines(self):
+        source = b"first = 1\nif is_flag_active(FLAG):\n    second = 2\nthird = 3\n"
+        transformed_source = b"first = 1\nsecond = 2\nthird = 3\n"
+
+        edits = driver.edits_between(source, transformed_source)
+
+        self.assertEqual(edits, [(10, 50, b"second = 2\n")])
+        self.assertEqual(driver.spliced(source, edits), transformed_source)
+
+    def test_edits_of_repetitive_lines_dont_take_quadratic_time(self):
+        source = b"    pass\n" * 20000
+        transformed_source = b"pass\n" * 20000
+
+        edits = driver.edits_between(source, transformed_source)
+
+        self.assertEqual(len(edits), 1)
+        self.assertEqual(driver.spliced(source, edits), transformed_source)
+
+    def test_edits_only_span_the_lines_around_unique_anchors(self):
+        source = b"".join(b"    value_%d = %d\n" % (i, i) for i in range(1000))
+        transformed_source = source.replace(b"    value_500 = 500\n", b"")
+
+        edits = driver.edits_between(source, transformed_source)
+
+        self.assertEqual(len(edits), 1)
+        self.assertEqual(edits[0][2], b"")
+        self.assertEqual(driver.spliced(source, edits), transformed_source)
+
+    def test_writes_edits_atomically_keeping_file_permissions(self):
+        flag_module = self._write_module(
+            "flag_usage.py",
+            """\
+            import os
+            if is_flag_active(%s):
+                print('Flag is active')
+            """
+            % FEATURE_FLAG_NAME,
+        )
+        os.chmod(flag_module, 0o750)
+        with open(flag_module, "rb") as module_file:
+            source = module_file.read()
+        result = driver.as_edits(driver.transform_source(_command(), flag_module, source), source)
+
+        written_result = driver.write_result(result)
+
+        self.assertIs(written_result, result)
+        self.assertIsNone(result.transformed_source)
+        self.assertEqual(_read(flag_module), "import os\nprint('Flag is active')\n")
+        self.assertEqual(os.stat(flag_module).st_mode & 0o777, 0o750)
+        self.assertEqual(os.listdir(self.repo_root.name), ["flag_usage.py"])
+
+    def test_doesnt_write_files_that_changed_since_they_were_transformed(self):
+        flag_module = self._write_module("flag_usage.py", "if is_flag_active(%s):\n    pass\n" % FEATURE_FLAG_NAME)
+        with open(flag_module, "rb") as module_file:
+            source = module_file.read()
+        result = driver.as_edits(driver.transform_source(_command(), flag_module, source), source)
+        self._write_module("flag_usage.py", "print('Edited meanwhile')\n")
+
+        written_result = driver.write_result(result)
+
+        self.assertEqual(written_result.status, driver.FAILED)
+        self.assertEqual(_read(flag_module), "print('Edited meanwhile')\n")
+
+    def test_doesnt_touch_files_already_holding_the_new_content(self):
+        flag_module = self._write_module("flag_usage.py", "print('Flag is active')\n")
+        os.utime(flag_module, ns=(0, 0))
+        result = driver.FileResult(flag_module, driver.CHANGED, transformed_source=b"print('Flag is active')\n")
+
+        driver.write_result(result)
+
+        self.assertEqual(os.stat(flag_module).st_mtime_ns, 0)
+
+    def test_computes_full_module_names_relative_to_repo_root(self):
+        self.assertEqual(
+            driver.full_module_name_of(os.path.join("root", "package", "module.py"), "root"), "package.module"
+        )
+        self.assertEqual(driver.full_module_name_of(os.path.join("root", "package", "__init__.py"), "root"), "package")
+
+    def _write_module(self, relative_path, code):
+        path = os.path.join(self.repo_root.name, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as module_file:
+            module_file.write(textwrap.dedent(code))
+
+        return path
+
+
+def _command():
+    return PiranhaCommand(CodemodContext(), flag_name=FEATURE_FLAG_NAME, flag_resolution_methods="is_flag_active")
+
+
+def _read(path):
+    with open(path) as module_file:
+        return module_file.read()
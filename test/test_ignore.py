@@ -0,0 +1,99 @@
+import os
+import tempfile
+import unittest
+
+from libcst.codemod import CodemodContext
+from piranha_python import driver, scheduler
+from piranha_python.codemods import PiranhaCommand
+from piranha_python.ignore import IgnoreRules
+
+FEATURE_FLAG_NAME = "FEATURE_FLAG_NAME"
+FLAG_USAGE = "if is_flag_active(FEATURE_FLAG_NAME):\n    print('Flag is active')\n"
+
+
+class IgnoreRulesTest(unittest.TestCase):
+    def test_globs_match_whole_paths(self):
+        rules = IgnoreRules(exclude_globs=["vendor/*", "*_pb2.py"])
+
+        self.assertTrue(rules.ignores("vendor/lib/module.py"))
+        self.assertTrue(rules.ignores("app/messages_pb2.py"))
+        self.assertFalse(rules.ignores("app/vendor/module.py"))
+        self.assertFalse(rules.ignores("app/module.py"))
+
+    def test_regexes_match_anywhere_in_paths(self):
+        rules = IgnoreRules(exclude_regexes=[r"(^|/)migrations/"])
+
+        self.assertTrue(rules.ignores("app/migrations/0001_initial.py"))
+        self.assertTrue(rules.ignores("migrations/0001_initial.py"))
+        self.assertFalse(rules.ignores("app/migrations.py"))
+
+    def test_only_included_paths_are_kept_when_there_are_include_rules(self):
+        rules = IgnoreRules(include_globs=["app/*"], include_regexes=["^lib/"], exclude_globs=["app/generated/*"])
+
+        self.assertFalse(rules.ignores("app/module.py"))
+        self.assertFalse(rules.ignores("lib/module.py"))
+        self.assertTrue(rules.ignores("scripts/module.py"))
+        self.assertTrue(rules.ignores("app/generated/module.py"))
+
+    def test_round_trips_through_dicts(self):
+        rules = IgnoreRules(include_globs=["app/*"], exclude_regexes=["_pb2\\.py$"])
+
+        self.assertEqual(IgnoreRules.from_dict(rules.as_dict()).as_dict(), rules.as_dict())
+
+
+class IgnoredPathsDiscoveryTest(unittest.TestCase):
+    def setUp(self):
+        self.repo = tempfile.TemporaryDirectory()
+        self.addCleanup(self.repo.cleanup)
+        for relative_path, source in (
+            ("app/module.py", FLAG_USAGE),
+            ("app/vendor/lib.py", "this isn't valid Python"),
+            ("app/messages_pb2.py", FLAG_USAGE),
+            ("scripts/tool.py", FLAG_USAGE),
+        ):
+            path = os.path.join(self.repo.name, relative_path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as module_file:
+                module_file.write(source)
+
+    def test_discovery_skips_excluded_files_and_directories(self):
+        rules = IgnoreRules(exclude_globs=["*/vendor/*", "*_pb2.py"], include_globs=["app/*"])
+
+        self.assertEqual(
+            list(driver.python_files_in([self.repo.name], rules, repo_root=self.repo.name)),
+            [os.path.join(self.repo.name, "app", "module.py")],
+        )
+
+    def test_explicitly_passed_files_are_filtered_too(self):
+        rules = IgnoreRules(exclude_globs=["scripts/*"])
+        paths = [os.path.join(self.repo.name, "scripts", "tool.py"), os.path.join(self.repo.name, "app", "module.py")]
+
+        self.assertEqual(list(driver.python_files_in(paths, rules, repo_root=self.repo.name)), paths[1:])
+
+    def test_runs_never_read_ignored_files(self):
+        command = _command(IgnoreRules(exclude_globs=["app/vendor/*"], exclude_regexes=["_pb2\\.py$"]))
+
+        report = scheduler.run_parallel(command, [self.repo.name], repo_root=self.repo.name, write=False, jobs=2)
+
+        self.assertEqual(report.counters["files_processed"], 2)
+        self.assertEqual(report.counters["files_changed"], 2)
+        self.assertEqual(report.counters["files_failed"], 0)
+
+    def test_module_check_function_still_applies_alongside_rules(self):
+        with open(os.path.join(self.repo.name, "app", "test_module.py"), "w") as module_file:
+            module_file.write(FLAG_USAGE)
+        command = _command(IgnoreRules(exclude_globs=["app/vendor/*"]))
+
+        report = driver.run(command, [os.path.join(self.repo.name, "app")], repo_root=self.repo.name, write=False)
+
+        self.assertEqual(report.counters["files_ignored"], 1)
+        self.assertEqual(report.counters["files_changed"], 2)
+
+
+def _command(ignore_rules):
+    return PiranhaCommand(
+        CodemodContext(),
+        flag_name=FEATURE_FLAG_NAME,
+        flag_resolution_methods="is_flag_active",
+        ignore_rules=ignore_rules,
+    )
@@ -0,0 +1,140 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from libcst.codemod import CodemodContext
+from piranha_python import driver
+from piranha_python.cli import main
+from piranha_python.codemods import PiranhaCommand
+from piranha_python.import_graph import ImportGraph
+
+FEATURE_FLAG_NAME = "FEATURE_FLAG_NAME"
+MODULES = {
+    "flags/__init__.py": "from .definitions import FEATURE_FLAG_NAME as NEW_FLAG_NAME, OTHER_FLAG\n",
+    "flags/definitions.py": "FEATURE_FLAG_NAME = 'feature_flag'\nOTHER_FLAG = 'other_flag'\n",
+    "intermediate.py": "from flags import NEW_FLAG_NAME, OTHER_FLAG\n\nRENAMED_FLAG = NEW_FLAG_NAME\n",
+    "app/consumer.py": (
+        "from intermediate import RENAMED_FLAG as LOCAL_FLAG\n"
+        "\n"
+        "if is_flag_active(LOCAL_FLAG):\n"
+        "    print('Flag is active')\n"
+    ),
+    "app/star_consumer.py": (
+        "from flags import *\n"
+        "\n"
+        "if is_flag_active(NEW_FLAG_NAME):\n"
+        "    print('Flag is active')\n"
+        "if is_flag_active(OTHER_FLAG):\n"
+        "    print('Other flag is active')\n"
+    ),
+}
+
+
+class ImportGraphTest(unittest.TestCase):
+    def setUp(self):
+        self.repo = tempfile.TemporaryDirectory()
+        self.addCleanup(self.repo.cleanup)
+        for relative_path, source in MODULES.items():
+            self._write(relative_path, source)
+        self.graph_path = os.path.join(self.repo.name, ".piranha", "import_graph.json")
+
+    def test_finds_names_flags_are_re_exported_as(self):
+        graph = ImportGraph(self.graph_path, repo_root=self.repo.name)
+        graph.update([self.repo.name])
+
+        self.assertEqual(
+            graph.flag_aliases_by_module([FEATURE_FLAG_NAME]),
+            {
+                "app.consumer": {"LOCAL_FLAG": FEATURE_FLAG_NAME},
+                "app.star_consumer": {"NEW_FLAG_NAME": FEATURE_FLAG_NAME},
+                "flags": {"NEW_FLAG_NAME": FEATURE_FLAG_NAME},
+                "intermediate": {"NEW_FLAG_NAME": FEATURE_FLAG_NAME, "RENAMED_FLAG": FEATURE_FLAG_NAME},
+            },
+        )
+
+    def test_survives_import_cycles(self):
+        self._write("cycle_a.py", "from cycle_b import B as A\n")
+        self._write("cycle_b.py", "from cycle_a import A as B\n")
+        graph = ImportGraph(self.graph_path, repo_root=self.repo.name)
+        graph.update([self.repo.name])
+
+        aliases = graph.flag_aliases_by_module([FEATURE_FLAG_NAME])
+
+        self.assertNotIn("cycle_a", aliases)
+        self.assertNotIn("cycle_b", aliases)
+
+    def test_only_parses_files_changed_since_the_last_update(self):
+        graph = ImportGraph(self.graph_path, repo_root=self.repo.name)
+        self.assertEqual(graph.update([self.repo.name]), len(MODULES))
+        graph.save()
+
+        self._write("intermediate.py", "from flags import NEW_FLAG_NAME\n")
+        os.remove(os.path.join(self.repo.name, "app", "consumer.py"))
+        graph = ImportGraph(self.graph_path, repo_root=self.repo.name)
+
+        self.assertEqual(graph.update([self.repo.name]), 1)
+        self.assertEqual(
+            graph.flag_aliases_by_module([FEATURE_FLAG_NAME])["intermediate"], {"NEW_FLAG_NAME": FEATURE_FLAG_NAME}
+        )
+        self.assertNotIn("app.consumer", graph.flag_aliases_by_module([FEATURE_FLAG_NAME]))
+
+    def test_removal_follows_re_exports(self):
+        graph = ImportGraph(self.graph_path, repo_root=self.repo.name)
+        graph.update([self.repo.name])
+        command = PiranhaCommand(
+            CodemodContext(),
+            flag_name=FEATURE_FLAG_NAME,
+            flag_resolution_methods="is_flag_active",
+            flag_aliases_by_module=graph.flag_aliases_by_module([FEATURE_FLAG_NAME]),
+        )
+
+        report = driver.run(command, [self.repo.name], repo_root=self.repo.name)
+
+        self.assertEqual(report.counters["files_changed"], 5)
+        self.assertEqual(self._read("flags/__init__.py"), "from .definitions import OTHER_FLAG\n")
+        self.assertEqual(self._read("intermediate.py"), "from flags import OTHER_FLAG\n")
+        self.assertEqual(self._read("app/consumer.py"), "print('Flag is active')\n")
+        self.assertEqual(
+            self._read("app/star_consumer.py"),
+            "from flags import *\n"
+            "print('Flag is active')\n"
+            "if is_flag_active(OTHER_FLAG):\n"
+            "    print('Other flag is active')\n",
+        )
+
+    def test_run_subcommand_follows_re_exports_on_request(self):
+        subprocess.run(
+            [sys.executable, "-m", "piranha_python", "run", "--flag-name", FEATURE_FLAG_NAME]
+            + ["--method-name", "is_flag_active", "--follow-reexports", "-j", "1", "--repo-root", self.repo.name]
+            + [os.path.join(self.repo.name, "app")],
+            check=True,
+            stderr=subprocess.DEVNULL,
+        )
+
+        self.assertTrue(os.path.exists(self.graph_path))
+        self.assertEqual(self._read("app/consumer.py"), "print('Flag is active')\n")
+
+    def test_run_subcommand_opens_the_files_the_index_lists_for_re_exported_flags(self):
+        index_path = os.path.join(self.repo.name, ".piranha", "index.json")
+        main(["index", "--method-name", "is_flag_active", "--index-file", index_path, self.repo.name])
+
+        main(
+            ["run", "--flag-name", FEATURE_FLAG_NAME, "--method-name", "is_flag_active", "--follow-reexports"]
+            + ["--index-file", index_path, "-j", "1", "--repo-root", self.repo.name]
+            + [os.path.join(self.repo.name, "app")]
+        )
+
+        self.assertEqual(self._read("app/consumer.py"), "print('Flag is active')\n")
+        self.assertNotIn("NEW_FLAG_NAME", self._read("app/star_consumer.py"))
+
+    def _write(self, relative_path, source):
+        path = os.path.join(self.repo.name, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as module_file:
+            module_file.write(source)
+
+    def _read(self, relative_path):
+        with open(os.path.join(self.repo.name, relative_path)) as module_file:
+            return module_file.read()
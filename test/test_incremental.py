@@ -0,0 +1,109 @@
+import os
+import subprocess
+import tempfile
+import unittest
+
+from libcst.codemod import CodemodContext
+from piranha_python import incremental
+from piranha_python.cli import main
+from piranha_python.codemods import PiranhaCommand
+
+FEATURE_FLAG_NAME = "FEATURE_FLAG_NAME"
+
+
+class IncrementalRunTest(unittest.TestCase):
+    def setUp(self):
+        self.repo = tempfile.TemporaryDirectory()
+        self.addCleanup(self.repo.cleanup)
+        self.repo_root = os.path.realpath(self.repo.name)
+        self._git("init", "-q")
+        self._write_module("first.py", "print('first')\n")
+        self._write_module("second.py", "print('second')\n")
+        self._commit()
+        self.state = incremental.IncrementalState(os.path.join(self.repo_root, incremental.DEFAULT_STATE_PATH))
+        self.command = PiranhaCommand(
+            CodemodContext(), flag_name=FEATURE_FLAG_NAME, flag_resolution_methods="is_flag_active"
+        )
+
+    def test_first_run_processes_every_requested_path(self):
+        paths, head_commit = incremental.paths_changed_since_last_run(
+            self.state, self.command, [self.repo_root], self.repo_root
+        )
+
+        self.assertEqual(paths, [self.repo_root])
+        self.assertEqual(head_commit, self._git("rev-parse", "HEAD").strip())
+
+    def test_later_runs_only_process_files_changed_since_the_recorded_commit(self):
+        self.state.record(self.command, [self.repo_root], self._git("rev-parse", "HEAD").strip(), self.repo_root)
+        self._write_module("second.py", "print('changed')\n")
+        self._commit()
+        self._write_module("third.py", "print('untracked')\n")
+
+        paths, _ = incremental.paths_changed_since_last_run(
+            incremental.IncrementalState(self.state.path), self.command, [self.repo_root], self.repo_root
+        )
+
+        self.assertEqual(paths, [os.path.join(self.repo_root, "second.py"), os.path.join(self.repo_root, "third.py")])
+
+    def test_recorded_commits_are_kept_per_flag_configuration(self):
+        self.state.record(self.command, [self.repo_root], self._git("rev-parse", "HEAD").strip(), self.repo_root)
+        control_command = PiranhaCommand(
+            CodemodContext(), flag_name=FEATURE_FLAG_NAME, flag_resolution_methods="is_flag_active", mode="control"
+        )
+
+        self.assertIsNone(self.state.base_commit_for(control_command, [self.repo_root], self.repo_root))
+
+    def test_recorded_commits_are_kept_per_set_of_requested_paths(self):
+        self._write_module("third.py", "print('third')\n")
+        self._commit()
+        first_module_path = os.path.join(self.repo_root, "first.py")
+        self.state.record(self.command, [first_module_path], self._git("rev-parse", "HEAD").strip(), self.repo_root)
+
+        paths, _ = incremental.paths_changed_since_last_run(self.state, self.command, [self.repo_root], self.repo_root)
+
+        self.assertEqual(paths, [self.repo_root])
+
+    def test_falls_back_to_a_full_scan_when_the_recorded_commit_no_longer_exists(self):
+        self.state.record(self.command, [self.repo_root], "0" * 40, self.repo_root)
+
+        paths, _ = incremental.paths_changed_since_last_run(self.state, self.command, [self.repo_root], self.repo_root)
+
+        self.assertEqual(paths, [self.repo_root])
+
+    def test_dry_runs_and_shards_dont_record_the_processed_commit(self):
+        for extra_args in (["--no-write"], ["--shard", "1/2"]):
+            with self.subTest(extra_args=extra_args):
+                main(self._run_args() + extra_args + [self.repo_root])
+
+                self.assertEqual(incremental.IncrementalState(self.state.path)._base_commits, {})
+
+        main(self._run_args() + [self.repo_root])
+
+        self.assertEqual(len(incremental.IncrementalState(self.state.path)._base_commits), 1)
+
+    def _run_args(self):
+        return [
+            "run",
+            "--flag-name",
+            FEATURE_FLAG_NAME,
+            "--method-name",
+            "is_flag_active",
+            "--jobs",
+            "1",
+            "--incremental",
+            "--repo-root",
+            self.repo_root,
+        ]
+
+    def _write_module(self, relative_path, code):
+        with open(os.path.join(self.repo_root, relative_path), "w") as module_file:
+            module_file.write(code)
+
+    def _commit(self):
+        self._git("add", "-A")
+        self._git("-c", "user.name=piranha", "-c", "user.email=piranha@example.com", "commit", "-q", "-m", "commit")
+
+    def _git(self, *args):
+        return subprocess.run(
+            ["git"] + list(args), cwd=self.repo_root, stdout=subprocess.PIPE, check=True, universal_newlines=True
+        ).stdout
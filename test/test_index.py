@@ -0,0 +1,131 @@
+import os
+import tempfile
+import textwrap
+import unittest
+from unittest import mock
+
+from piranha_python import index
+from piranha_python.cli import main
+from piranha_python.index import FlagUsageIndex
+
+
+class FlagUsageIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.repo = tempfile.TemporaryDirectory()
+        self.addCleanup(self.repo.cleanup)
+        self.repo_root = self.repo.name
+        self.index_path = os.path.join(self.repo_root, index.DEFAULT_INDEX_PATH)
+        self._write_module("flags.py", "FIRST_FLAG = 'first'\nSECOND_FLAG = 'second'\n")
+        self._write_module(
+            "first_usage.py",
+            """\
+            from flags import FIRST_FLAG, SECOND_FLAG as ALIASED_FLAG
+
+            if is_flag_active(FIRST_FLAG):
+                print('First flag is active')
+
+            if is_flag_active(ALIASED_FLAG) and is_flag_active(FIRST_FLAG):
+                print('Both flags are active')
+            """,
+        )
+        self._write_module("unrelated.py", "print('Nothing to see here')\n")
+
+    def test_indexes_line_spans_of_every_flag_passed_to_the_resolution_methods(self):
+        flag_index = self._updated_index()
+
+        self.assertEqual(flag_index.usages_of("FIRST_FLAG"), {"first_usage.py": [[3, 3], [6, 6]]})
+        self.assertEqual(flag_index.usages_of("SECOND_FLAG"), {"first_usage.py": [[6, 6]]})
+        self.assertEqual(
+            flag_index.usage_counts(),
+            {"FIRST_FLAG": {"usages": 2, "files": 1}, "SECOND_FLAG": {"usages": 1, "files": 1}},
+        )
+
+    def test_indexes_resolution_methods_called_on_a_receiver(self):
+        self._write_module("receiver_usage.py", "if flags_client.is_flag_active(SECOND_FLAG):\n    print('Active')\n")
+
+        flag_index = self._updated_index()
+
+        self.assertEqual(flag_index.usages_of("SECOND_FLAG")["receiver_usage.py"], [[1, 1]])
+
+    def test_lists_the_files_declaring_importing_or_using_a_flag(self):
+        flag_index = self._updated_index()
+
+        self.assertEqual(
+            flag_index.files_referencing(["SECOND_FLAG"]),
+            [os.path.join(self.repo_root, "first_usage.py"), os.path.join(self.repo_root, "flags.py")],
+        )
+
+    def test_updates_only_files_that_changed_since_it_was_saved(self):
+        self._updated_index().save()
+        self._write_module("second_usage.py", "if is_flag_active(SECOND_FLAG):\n    print('Second flag is active')\n")
+        os.remove(os.path.join(self.repo_root, "unrelated.py"))
+
+        flag_index = FlagUsageIndex(self.index_path, ["is_flag_active"], repo_root=self.repo_root)
+        with mock.patch.object(index, "_scanned_file_entry", wraps=index._scanned_file_entry) as scanned_file_entry:
+            flag_index.update([self.repo_root])
+
+        self.assertEqual(scanned_file_entry.call_count, 1)
+        self.assertNotIn("unrelated.py", flag_index.files)
+        self.assertEqual(flag_index.usage_counts()["SECOND_FLAG"], {"usages": 2, "files": 2})
+
+    def test_is_rebuilt_when_the_resolution_methods_change(self):
+        self._updated_index().save()
+
+        flag_index = FlagUsageIndex(self.index_path, ["is_other_flag_active"], repo_root=self.repo_root)
+
+        self.assertEqual(flag_index.files, {})
+
+    def test_covering_index_may_have_been_built_for_more_resolution_methods(self):
+        FlagUsageIndex(self.index_path, ["is_flag_active", "is_other_flag_active"], repo_root=self.repo_root).save()
+
+        flag_index = FlagUsageIndex.covering(self.index_path, ["is_flag_active"], repo_root=self.repo_root)
+
+        self.assertEqual(flag_index.resolution_method_names, ["is_flag_active", "is_other_flag_active"])
+
+    def test_covering_index_must_have_been_built_for_every_resolution_method(self):
+        self._updated_index().save()
+
+        with self.assertRaisesRegex(ValueError, "wasn't built for is_other_flag_active"):
+            FlagUsageIndex.covering(self.index_path, ["is_flag_active", "is_other_flag_active"])
+        with self.assertRaisesRegex(ValueError, "no flag usage index"):
+            FlagUsageIndex.covering(os.path.join(self.repo_root, "missing.json"), ["is_flag_active"])
+
+    def test_run_updates_the_index_before_listing_the_files_to_transform(self):
+        self._updated_index().save()
+        self._write_module("second_usage.py", "if is_flag_active(SECOND_FLAG):\n    print('Second flag is active')\n")
+
+        main(self._run_args("SECOND_FLAG", "is_flag_active"))
+
+        with open(os.path.join(self.repo_root, "second_usage.py")) as module_file:
+            self.assertEqual(module_file.read(), "print('Second flag is active')\n")
+
+    def test_run_fails_when_the_index_wasnt_built_for_the_resolution_method(self):
+        self._updated_index().save()
+
+        with self.assertRaisesRegex(SystemExit, "wasn't built for is_other_flag_active"):
+            main(self._run_args("SECOND_FLAG", "is_other_flag_active"))
+
+    def _run_args(self, flag_name, method_name):
+        return [
+            "run",
+            "--flag-name",
+            flag_name,
+            "--method-name",
+            method_name,
+            "--jobs",
+            "1",
+            "--index-file",
+            self.index_path,
+            "--repo-root",
+            self.repo_root,
+            self.repo_root,
+        ]
+
+    def _updated_index(self):
+        flag_index = FlagUsageIndex(self.index_path, ["is_flag_active"], repo_root=self.repo_root)
+        flag_index.update([self.repo_root])
+        return flag_index
+
+    def _write_module(self, relative_path, code):
+        with open(os.path.join(self.repo_root, relative_path), "w") as module_file:
+            module_file.write(textwrap.dedent(code))
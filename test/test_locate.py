@@ -0,0 +1,94 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from libcst.codemod import CodemodContext
+from piranha_python import locate
+from piranha_python.codemods import PiranhaCommand
+
+FEATURE_FLAG_NAME = "FEATURE_FLAG_NAME"
+FLAG_USAGE = """\
+from flags import OTHER_FLAG, FEATURE_FLAG_NAME as ALIASED_FLAG
+
+
+def func():
+    print('Café')
+    if is_flag_active(ALIASED_FLAG):
+        print('Flag is active')
+    elif other_condition():
+        print('Other condition')
+    if not is_flag_active(ALIASED_FLAG): print('Flag is inactive')
+""".encode(
+    "utf-8"
+)
+
+
+class LocateTest(unittest.TestCase):
+    def test_reports_sites_and_the_branches_kept_in_treated_mode(self):
+        sites = locate.locate_in_source(_command("treated"), "module.py", FLAG_USAGE)
+
+        self.assertEqual(
+            [(s.kind, s.flag_name, s.lines, s.kept_branch, s.kept_lines) for s in sites],
+            [
+                ("import", FEATURE_FLAG_NAME, (1, 1), None, None),
+                ("if", FEATURE_FLAG_NAME, (6, 9), "body", (7, 7)),
+                ("if", FEATURE_FLAG_NAME, (10, 10), None, None),
+            ],
+        )
+
+    def test_reports_sites_and_the_branches_kept_in_control_mode(self):
+        sites = locate.locate_in_source(_command("control"), "module.py", FLAG_USAGE)
+
+        self.assertEqual(
+            [(s.kind, s.kept_branch, s.kept_lines) for s in sites],
+            [("import", None, None), ("if", "else", (9, 9)), ("if", "body", (10, 10))],
+        )
+
+    def test_reports_byte_offsets_of_each_site(self):
+        sites = locate.locate_in_source(_command("treated"), "module.py", FLAG_USAGE)
+
+        self.assertEqual(FLAG_USAGE[sites[0].start : sites[0].end], FLAG_USAGE.splitlines()[0])
+        self.assertTrue(FLAG_USAGE[sites[1].start : sites[1].end].startswith(b"if is_flag_active(ALIASED_FLAG):"))
+        self.assertTrue(FLAG_USAGE[sites[1].start : sites[1].end].endswith(b"print('Other condition')"))
+        self.assertEqual(
+            FLAG_USAGE[sites[2].start : sites[2].end], b"if not is_flag_active(ALIASED_FLAG): print('Flag is inactive')"
+        )
+
+    def test_reports_flag_declarations(self):
+        sites = locate.locate_in_source(
+            _command("treated"), "module.py", b"OTHER_FLAG, FEATURE_FLAG_NAME = 'other', 'feature'\n"
+        )
+
+        self.assertEqual([(s.kind, s.lines, s.start, s.end) for s in sites], [("assignment", (1, 1), 0, 50)])
+
+    def test_reports_nothing_for_modules_not_referencing_the_flag(self):
+        self.assertEqual(locate.locate_in_source(_command("treated"), "module.py", b"print('Hello')\n"), [])
+
+    def test_locate_subcommand_prints_sites_as_json_lines(self):
+        with tempfile.TemporaryDirectory() as repo:
+            with open(os.path.join(repo, "module.py"), "wb") as module_file:
+                module_file.write(FLAG_USAGE)
+            with open(os.path.join(repo, "test_module.py"), "wb") as module_file:
+                module_file.write(FLAG_USAGE)
+
+            output = subprocess.run(
+                [sys.executable, "-m", "piranha_python", "locate", "--flag-name", FEATURE_FLAG_NAME]
+                + ["--method-name", "is_flag_active", "--repo-root", repo, repo],
+                check=True,
+                stdout=subprocess.PIPE,
+            ).stdout
+
+            sites = [json.loads(line) for line in output.decode("utf-8").splitlines()]
+            self.assertEqual([s["kind"] for s in sites], ["import", "if", "if"])
+            self.assertEqual({s["path"] for s in sites}, {os.path.join(repo, "module.py")})
+            self.assertEqual(sites[1]["keptBranch"], "body")
+            self.assertEqual(sites[1]["keptLines"], [7, 7])
+
+
+def _command(mode):
+    return PiranhaCommand(
+        CodemodContext(), flag_name=FEATURE_FLAG_NAME, flag_resolution_methods="is_flag_active", mode=mode
+    )
@@ -0,0 +1,152 @@
+import concurrent.futures
+import os
+import sys
+import tempfile
+import textwrap
+import unittest
+from unittest import mock
+
+from libcst.codemod import CodemodContext
+from piranha_python import driver, pipeline, scheduler
+from piranha_python.cli import main
+from piranha_python.codemods import PiranhaCommand
+from piranha_python.verdicts import VerdictStore
+
+FEATURE_FLAG_NAME = "FEATURE_FLAG_NAME"
+FLAG_USAGE = (
+    """\
+if is_flag_active(%s):
+    print('Flag is active')
+"""
+    % FEATURE_FLAG_NAME
+)
+
+
+class PipelinedRunTest(unittest.TestCase):
+    def setUp(self):
+        self.repo_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.repo_root.cleanup)
+        for i in range(6):
+            self._write_module("package/flag_usage_%d.py" % i, FLAG_USAGE)
+            self._write_module("package/unrelated_%d.py" % i, "print('Nothing to see here')\n")
+        self._write_module("package/test_flag_usage.py", FLAG_USAGE)
+        self.command = PiranhaCommand(
+            CodemodContext(), flag_name=FEATURE_FLAG_NAME, flag_resolution_methods="is_flag_active"
+        )
+
+    def test_transforms_and_writes_every_file(self):
+        report = pipeline.run_pipelined(self.command, [self.repo_root.name], repo_root=self.repo_root.name, jobs=2)
+
+        self.assertEqual(report.counters["files_changed"], 6)
+        self.assertEqual(report.counters["files_skipped_by_prefilter"], 6)
+        self.assertEqual(report.counters["files_ignored"], 1)
+        self.assertEqual(self._read("package/flag_usage_3.py"), "print('Flag is active')\n")
+        self.assertEqual(self._read("package/test_flag_usage.py"), FLAG_USAGE)
+
+    def test_queue_depths_stay_within_their_bounds(self):
+        queue_depths = pipeline.QueueDepths()
+
+        pipeline.run_pipelined(
+            self.command,
+            [self.repo_root.name],
+            repo_root=self.repo_root.name,
+            write=False,
+            jobs=1,
+            max_queued_files=2,
+            max_in_flight=1,
+            io_threads=1,
+            queue_depths=queue_depths,
+        )
+
+        depths = queue_depths.as_dict()
+        self.assertEqual(sorted(depths), ["paths", "results", "sources"])
+        self.assertEqual(depths["paths"]["samples"], 13)
+        self.assertEqual(depths["sources"]["samples"], 6)
+        self.assertEqual(depths["results"]["samples"], 6)
+        self.assertTrue(all(0 < d["max"] <= d["capacity"] == 2 for d in depths.values()))
+
+    def test_records_diffs_and_verdicts(self):
+        self._write_module("package/flag_assignment.py", "[%s, other] = values\n" % FEATURE_FLAG_NAME)
+        verdict_store = VerdictStore(os.path.join(self.repo_root.name, ".piranha", "verdicts.db"))
+        self.addCleanup(verdict_store.close)
+
+        report = pipeline.run_pipelined(
+            self.command,
+            [os.path.join(self.repo_root.name, "package")],
+            repo_root=self.repo_root.name,
+            write=False,
+            jobs=1,
+            verdicts=verdict_store,
+            diffs=True,
+        )
+        rerun_report = pipeline.run_pipelined(
+            self.command,
+            [os.path.join(self.repo_root.name, "package")],
+            repo_root=self.repo_root.name,
+            write=False,
+            jobs=1,
+            verdicts=verdict_store,
+        )
+
+        self.assertEqual(len(report.diffs), 6)
+        self.assertEqual(report.counters["files_unchanged"], 1)
+        self.assertEqual(rerun_report.counters["verdict_hits"], 1)
+        self.assertEqual(rerun_report.counters["files_changed"], 6)
+
+    def test_stops_when_the_workers_cant_start(self):
+        with mock.patch.object(scheduler, "initialize_worker", _exit):
+            with self.assertRaises(concurrent.futures.process.BrokenProcessPool):
+                pipeline.run_pipelined(
+                    self.command, [self.repo_root.name], repo_root=self.repo_root.name, jobs=1, max_queued_files=1
+                )
+
+        self.assertEqual(self._read("package/flag_usage_0.py"), FLAG_USAGE)
+
+    def test_stops_when_a_stage_fails(self):
+        with mock.patch.object(driver, "with_diff", side_effect=RuntimeError("diff failed")):
+            with self.assertRaisesRegex(RuntimeError, "diff failed"):
+                pipeline.run_pipelined(
+                    self.command,
+                    [self.repo_root.name],
+                    repo_root=self.repo_root.name,
+                    write=False,
+                    jobs=1,
+                    max_queued_files=1,
+                    diffs=True,
+                )
+
+    def test_command_line_entry_point(self):
+        exit_code = main(
+            [
+                "run",
+                "--flag-name",
+                FEATURE_FLAG_NAME,
+                "--method-name",
+                "is_flag_active",
+                "--jobs",
+                "1",
+                "--pipelined",
+                "--max-queued-files",
+                "4",
+                "--repo-root",
+                self.repo_root.name,
+                self.repo_root.name,
+            ]
+        )
+
+        self.assertEqual(exit_code, 0)
+        self.assertEqual(self._read("package/flag_usage_0.py"), "print('Flag is active')\n")
+
+    def _write_module(self, relative_path, code):
+        path = os.path.join(self.repo_root.name, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as module_file:
+            module_file.write(textwrap.dedent(code))
+
+    def _read(self, relative_path):
+        with open(os.path.join(self.repo_root.name, relative_path)) as module_file:
+            return module_file.read()
+
+
+def _exit(*args):
+    sys.exit(1)
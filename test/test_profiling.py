@@ -0,0 +1,82 @@
+import json
+import os
+import tempfile
+import unittest
+
+from libcst.codemod import CodemodContext
+from piranha_python import driver
+from piranha_python.codemods import PiranhaCommand
+from piranha_python.profiling import TransformProfiler
+
+FEATURE_FLAG_NAME = "FEATURE_FLAG_NAME"
+
+
+class TransformProfilerTest(unittest.TestCase):
+    def setUp(self):
+        self.repo = tempfile.TemporaryDirectory()
+        self.addCleanup(self.repo.cleanup)
+        self.flag_module = os.path.join(self.repo.name, "flag_usage.py")
+        with open(self.flag_module, "w") as module_file:
+            module_file.write(
+                "from flags import %(flag_name)s\n\n"
+                "def func():\n"
+                "    if is_flag_active(%(flag_name)s):\n"
+                "        print('Flag is active')\n" % {"flag_name": FEATURE_FLAG_NAME}
+            )
+        with open(os.path.join(self.repo.name, "unrelated.py"), "w") as module_file:
+            module_file.write("print('Nothing to see here')\n")
+
+    def test_records_calls_and_time_of_each_callback(self):
+        profiler = TransformProfiler()
+
+        driver.run(_command(), [self.repo.name], repo_root=self.repo.name, profiler=profiler)
+
+        callbacks = profiler.as_dict()["callbacks"]
+        self.assertEqual(callbacks["visit_Module"]["calls"], 1)
+        self.assertEqual(callbacks["leave_If"]["calls"], 1)
+        self.assertEqual(callbacks["leave_ImportFrom"]["calls"], 1)
+        self.assertEqual(callbacks["leave_FunctionDef"]["calls"], 1)
+        self.assertTrue(all(c["seconds"] >= 0 for c in callbacks.values()))
+
+    def test_instrumented_command_dispatches_to_the_timed_callbacks(self):
+        command = _command()
+        driver.run(command, [self.repo.name], repo_root=self.repo.name, write=False)
+        profiler = TransformProfiler()
+
+        report = driver.run(command, [self.repo.name], repo_root=self.repo.name, write=False, profiler=profiler)
+
+        callbacks = profiler.as_dict()["callbacks"]
+        self.assertEqual(report.counters["files_changed"], 1)
+        self.assertEqual(callbacks["visit_If"]["calls"], 1)
+        self.assertEqual(callbacks["leave_If"]["calls"], 1)
+        self.assertEqual(callbacks["visit_IndentedBlock"]["calls"], callbacks["leave_IndentedBlock"]["calls"])
+
+    def test_records_phase_timings_of_each_parsed_file(self):
+        profiler = TransformProfiler()
+
+        driver.run(_command(), [self.repo.name], repo_root=self.repo.name, write=False, profiler=profiler)
+
+        profile = profiler.as_dict()
+        self.assertEqual([f["path"] for f in profile["files"]], [self.flag_module])
+        self.assertTrue(all(profile["phases"][phase] > 0 for phase in ("detect", "parse", "transform", "codegen")))
+        self.assertAlmostEqual(
+            profile["files"][0]["total"],
+            profile["files"][0]["detect"]
+            + profile["files"][0]["parse"]
+            + profile["files"][0]["transform"]
+            + profile["files"][0]["codegen"],
+        )
+
+    def test_exports_profile_as_json(self):
+        profiler = TransformProfiler()
+        driver.run(_command(), [self.repo.name], repo_root=self.repo.name, write=False, profiler=profiler)
+        profile_path = os.path.join(self.repo.name, "profile.json")
+
+        profiler.write_json(profile_path)
+
+        with open(profile_path) as profile_file:
+            self.assertEqual(json.load(profile_file), json.loads(json.dumps(profiler.as_dict())))
+
+
+def _command():
+    return PiranhaCommand(CodemodContext(), flag_name=FEATURE_FLAG_NAME, flag_resolution_methods="is_flag_active")
@@ -0,0 +1,113 @@
+import os
+import tempfile
+import textwrap
+import unittest
+from unittest import mock
+
+from libcst.codemod import CodemodContext
+from piranha_python import scheduler
+from piranha_python.cli import main
+from piranha_python.codemods import PiranhaCommand
+
+FEATURE_FLAG_NAME = "FEATURE_FLAG_NAME"
+FLAG_USAGE = (
+    """\
+if is_flag_active(%s):
+    print('Flag is active')
+"""
+    % FEATURE_FLAG_NAME
+)
+
+
+class BatchingTest(unittest.TestCase):
+    def test_dispatches_largest_files_first(self):
+        batches = scheduler.batches_of([("small.py", 10), ("large.py", 1000), ("medium.py", 100)], jobs=1)
+
+        self.assertEqual([path for batch in batches for path in batch], ["large.py", "medium.py", "small.py"])
+
+    def test_groups_small_files_together_up_to_the_batch_bounds(self):
+        files_with_sizes = [("module_%d.py" % i, 10) for i in range(100)]
+
+        batches = scheduler.batches_of(files_with_sizes, jobs=1, max_batch_bytes=1000, max_batch_files=8)
+
+        self.assertEqual(sum(len(batch) for batch in batches), 100)
+        self.assertLess(len(batches), 100)
+        self.assertTrue(all(len(batch) <= 8 for batch in batches))
+
+    def test_large_files_are_dispatched_on_their_own(self):
+        batches = scheduler.batches_of(
+            [("large.py", 5000), ("small.py", 10), ("tiny.py", 1)], jobs=2, max_batch_bytes=1000
+        )
+
+        self.assertEqual(batches[0], ["large.py"])
+
+
+class ParallelRunTest(unittest.TestCase):
+    def setUp(self):
+        self.repo_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.repo_root.cleanup)
+        for i in range(6):
+            self._write_module("package/flag_usage_%d.py" % i, FLAG_USAGE)
+            self._write_module("package/unrelated_%d.py" % i, "print('Nothing to see here')\n")
+        self._write_module("package/test_flag_usage.py", FLAG_USAGE)
+
+    def test_transforms_files_in_worker_processes(self):
+        command = PiranhaCommand(
+            CodemodContext(), flag_name=FEATURE_FLAG_NAME, flag_resolution_methods="is_flag_active"
+        )
+
+        report = scheduler.run_parallel(command, [self.repo_root.name], repo_root=self.repo_root.name, jobs=2)
+
+        self.assertEqual(report.counters["files_changed"], 6)
+        self.assertEqual(report.counters["files_skipped_by_prefilter"], 6)
+        self.assertEqual(report.counters["files_ignored"], 1)
+        self.assertEqual(self._read("package/flag_usage_3.py"), "print('Flag is active')\n")
+        self.assertEqual(self._read("package/test_flag_usage.py"), FLAG_USAGE)
+
+    def test_workers_only_receive_files_passing_the_prefilter_and_read_them_themselves(self):
+        command = PiranhaCommand(
+            CodemodContext(), flag_name=FEATURE_FLAG_NAME, flag_resolution_methods="is_flag_active"
+        )
+        transformed_paths = []
+        transform_in_worker = scheduler.transform_in_worker
+
+        def recording_transform_in_worker(path, source=None, as_edits=False):
+            transformed_paths.append((os.path.basename(path), source))
+            return transform_in_worker(path, source, as_edits)
+
+        with mock.patch.object(scheduler, "transform_in_worker", recording_transform_in_worker), mock.patch.object(
+            scheduler.driver, "read_if_may_reference_flags", side_effect=AssertionError("read in the parent")
+        ):
+            report = scheduler.run_parallel(command, [self.repo_root.name], repo_root=self.repo_root.name, jobs=1)
+
+        self.assertEqual(sorted(transformed_paths), [("flag_usage_%d.py" % i, None) for i in range(6)])
+        self.assertEqual(report.counters["files_changed"], 6)
+
+    def test_command_line_entry_point(self):
+        exit_code = main(
+            [
+                "run",
+                "--flag-name",
+                FEATURE_FLAG_NAME,
+                "--method-name",
+                "is_flag_active",
+                "--jobs",
+                "1",
+                "--repo-root",
+                self.repo_root.name,
+                self.repo_root.name,
+            ]
+        )
+
+        self.assertEqual(exit_code, 0)
+        self.assertEqual(self._read("package/flag_usage_0.py"), "print('Flag is active')\n")
+
+    def _write_module(self, relative_path, code):
+        path = os.path.join(self.repo_root.name, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as module_file:
+            module_file.write(textwrap.dedent(code))
+
+    def _read(self, relative_path):
+        with open(os.path.join(self.repo_root.name, relative_path)) as module_file:
+            return module_file.read()
@@ -0,0 +1,77 @@
+import contextlib
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from piranha_python import sharding
+from piranha_python.cli import main
+
+FEATURE_FLAG_NAME = "FEATURE_FLAG_NAME"
+FLAG_USAGE = "if is_flag_active(%s):\n    print('Flag is active')\n" % FEATURE_FLAG_NAME
+
+
+class ShardingTest(unittest.TestCase):
+    def setUp(self):
+        self.repo = tempfile.TemporaryDirectory()
+        self.addCleanup(self.repo.cleanup)
+        for i in range(8):
+            self._write("package/flag_usage_%d.py" % i, FLAG_USAGE + "print('padding')\n" * i)
+            self._write("package/unrelated_%d.py" % i, "print('Nothing to see here')\n" * (8 - i))
+
+    def test_parses_shard_specifications(self):
+        self.assertEqual(sharding.parse_shard("2/4"), (2, 4))
+        for shard_spec in ("0/4", "5/4", "1", "a/b"):
+            with self.subTest(shard_spec=shard_spec):
+                with self.assertRaises(ValueError):
+                    sharding.parse_shard(shard_spec)
+
+    def test_splits_files_evenly_by_size_into_disjoint_shards(self):
+        shards = [sharding.files_of_shard([self.repo.name], i, 3, repo_root=self.repo.name) for i in (1, 2, 3)]
+
+        all_files = [p for shard in shards for p in shard]
+        self.assertEqual(len(all_files), 16)
+        self.assertEqual(len(set(all_files)), 16)
+        shard_bytes = [sum(os.path.getsize(p) for p in shard) for shard in shards]
+        self.assertLess(max(shard_bytes) - min(shard_bytes), max(os.path.getsize(p) for p in all_files))
+        self.assertEqual(shards[1], sharding.files_of_shard([self.repo.name], 2, 3, repo_root=self.repo.name))
+
+    def test_merges_the_results_of_every_shard(self):
+        shard_result_paths = [self._run_shard(i, 2) for i in (1, 2)]
+        output = io.StringIO()
+        report_path = os.path.join(self.repo.name, "report.json")
+
+        with contextlib.redirect_stdout(output), contextlib.redirect_stderr(io.StringIO()):
+            exit_code = main(["merge", "--report-json", report_path] + shard_result_paths)
+
+        self.assertEqual(exit_code, 0)
+        with open(report_path) as report_file:
+            report = json.load(report_file)
+        self.assertEqual(report["counters"]["files_processed"], 16)
+        self.assertEqual(report["counters"]["files_changed"], 8)
+        self.assertEqual(sorted(report["diffs"]), ["package/flag_usage_%d.py" % i for i in range(8)])
+        self.assertIn("+++ b/package/flag_usage_3.py\n", output.getvalue())
+
+    def test_refuses_to_merge_an_incomplete_set_of_shards(self):
+        shard_result_paths = [self._run_shard(1, 2), self._run_shard(1, 2)]
+
+        with self.assertRaisesRegex(SystemExit, "shards 1 to 2 exactly once"):
+            main(["merge"] + shard_result_paths)
+
+    def _run_shard(self, index, count):
+        # Shards run on hosts with checkouts of their own, so they must not see each other's writes here
+        shard_result_path = os.path.join(self.repo.name, "shard_%d_of_%d.json" % (index, count))
+        with contextlib.redirect_stderr(io.StringIO()):
+            main(
+                ["run", "--flag-name", FEATURE_FLAG_NAME, "--method-name", "is_flag_active", "-j", "1", "--no-write"]
+                + ["--shard", "%d/%d" % (index, count), "--shard-result", shard_result_path]
+                + ["--repo-root", self.repo.name, os.path.join(self.repo.name, "package")]
+            )
+        return shard_result_path
+
+    def _write(self, relative_path, source):
+        path = os.path.join(self.repo.name, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as module_file:
+            module_file.write(source)
@@ -0,0 +1,84 @@
+import io
+import os
+import subprocess
+import tempfile
+import unittest
+
+from libcst.codemod import CodemodContext
+from piranha_python import driver, streaming
+from piranha_python.codemods import PiranhaCommand
+
+FEATURE_FLAG_NAME = "FEATURE_FLAG_NAME"
+FLAG_USAGE = b"""\
+print('Before the flag')
+if is_flag_active(FEATURE_FLAG_NAME):
+    print('Flag is active')
+print('After the flag')"""
+
+
+class StreamingTest(unittest.TestCase):
+    def setUp(self):
+        self.repo = tempfile.TemporaryDirectory()
+        self.addCleanup(self.repo.cleanup)
+
+    def test_reads_newline_and_nul_separated_paths(self):
+        self.assertEqual(
+            list(streaming.paths_from(io.BytesIO(b"first.py\nsecond.py\n\n"))),
+            [("first.py", None), ("second.py", None)],
+        )
+        self.assertEqual(
+            list(streaming.paths_from(io.BytesIO(b"first.py\0with space.py\0"), b"\0")),
+            [("first.py", None), ("with space.py", None)],
+        )
+
+    def test_reads_nul_separated_contents(self):
+        records = streaming.contents_from(io.BytesIO(b"first.py\0print(1)\n\0second.py\0print(2)\n\0"))
+
+        self.assertEqual(list(records), [("first.py", b"print(1)\n"), ("second.py", b"print(2)\n")])
+
+    def test_yields_diffs_tagged_with_file_paths(self):
+        path = os.path.join(self.repo.name, "module.py")
+
+        results = list(streaming.stream_diffs(_command(), [(path, FLAG_USAGE)], repo_root=self.repo.name))
+
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0].status, driver.CHANGED)
+        self.assertEqual(
+            results[0].diff,
+            "--- a/module.py\n"
+            "+++ b/module.py\n"
+            "@@ -1,4 +1,3 @@\n"
+            " print('Before the flag')\n"
+            "-if is_flag_active(FEATURE_FLAG_NAME):\n"
+            "-    print('Flag is active')\n"
+            "+print('Flag is active')\n"
+            " print('After the flag')\n"
+            "\\ No newline at end of file\n",
+        )
+
+    def test_diffs_can_be_applied_by_git(self):
+        path = os.path.join(self.repo.name, "module.py")
+        with open(path, "wb") as module_file:
+            module_file.write(FLAG_USAGE)
+        subprocess.run(["git", "init", "-q"], cwd=self.repo.name, check=True)
+
+        (result,) = streaming.stream_diffs(_command(), [(path, None)], repo_root=self.repo.name)
+        subprocess.run(["git", "apply"], cwd=self.repo.name, input=result.diff.encode("utf-8"), check=True)
+
+        with open(path, "rb") as module_file:
+            self.assertEqual(
+                module_file.read(), driver.transform_source(_command(), path, FLAG_USAGE).transformed_source
+            )
+
+    def test_streams_results_from_worker_processes(self):
+        records = [(os.path.join(self.repo.name, "module_%d.py" % i), FLAG_USAGE) for i in range(6)]
+        records.append((os.path.join(self.repo.name, "unrelated.py"), b"print('Nothing to see here')\n"))
+
+        results = list(streaming.stream_diffs(_command(), records, repo_root=self.repo.name, jobs=2, max_in_flight=2))
+
+        self.assertEqual(sorted(r.path for r in results), sorted(p for p, _ in records))
+        self.assertEqual(len([r for r in results if r.diff is not None]), 6)
+
+
+def _command():
+    return PiranhaCommand(CodemodContext(), flag_name=FEATURE_FLAG_NAME, flag_resolution_methods="is_flag_active")
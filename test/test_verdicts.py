@@ -0,0 +1,138 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from libcst.codemod import CodemodContext
+from piranha_python import driver, scheduler
+from piranha_python.cli import main
+from piranha_python.codemods import MultiFlagPiranhaCommand, PiranhaCommand
+from piranha_python.verdicts import VerdictStore
+
+FEATURE_FLAG_NAME = "FEATURE_FLAG_NAME"
+FLAG_USAGE = b"if is_flag_active(FEATURE_FLAG_NAME):\n    print('Flag is active')\n"
+FLAG_MENTION = b"print('FEATURE_FLAG_NAME was retired')\n"
+
+
+class VerdictStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.store_path = os.path.join(self.directory.name, "verdicts.sqlite3")
+
+    def test_remembers_clean_modules_across_runs(self):
+        store = VerdictStore(self.store_path)
+        store.record_clean(store.keys_for(_command(), FLAG_MENTION))
+        store.close()
+
+        store = VerdictStore(self.store_path)
+        self.addCleanup(store.close)
+        self.assertTrue(store.is_clean(store.keys_for(_command(), FLAG_MENTION)))
+        self.assertFalse(store.is_clean(store.keys_for(_command(), FLAG_MENTION + b"\n")))
+
+    def test_verdicts_depend_on_the_resolution_methods_mode_and_aliases_of_each_flag(self):
+        store = VerdictStore(self.store_path)
+        self.addCleanup(store.close)
+        store.record_clean(store.keys_for(_command(), FLAG_MENTION))
+
+        self.assertFalse(store.is_clean(store.keys_for(_command(mode="control"), FLAG_MENTION)))
+        self.assertFalse(store.is_clean(store.keys_for(_command(methods="is_enabled"), FLAG_MENTION)))
+        aliased_command = _command(flag_aliases_by_module={"consumer": {"ALIASED_FLAG": FEATURE_FLAG_NAME}})
+        self.assertTrue(store.is_clean(store.keys_for(aliased_command, FLAG_MENTION, "other")))
+        self.assertFalse(store.is_clean(store.keys_for(aliased_command, FLAG_MENTION, "consumer")))
+
+    def test_modules_are_only_clean_of_a_flag_combination_if_clean_of_each_flag(self):
+        store = VerdictStore(self.store_path)
+        self.addCleanup(store.close)
+        both_flags = MultiFlagPiranhaCommand(
+            CodemodContext(),
+            [
+                {"flagName": FEATURE_FLAG_NAME, "flagResolutionMethods": "is_flag_active"},
+                {"flagName": "OTHER_FLAG", "flagResolutionMethods": "is_flag_active"},
+            ],
+        )
+        store.record_clean(store.keys_for(_command(), FLAG_MENTION))
+
+        self.assertFalse(store.is_clean(store.keys_for(both_flags, FLAG_MENTION)))
+        store.record_clean(store.keys_for(both_flags, FLAG_MENTION))
+        self.assertTrue(store.is_clean(store.keys_for(_command(), FLAG_MENTION)))
+
+    def test_evicts_least_recently_used_verdicts(self):
+        store = VerdictStore(self.store_path, max_entries=2)
+        self.addCleanup(store.close)
+        keys = [store.keys_for(_command(), b"module_%d = 1\n" % i) for i in range(3)]
+        for module_keys in keys:
+            store.record_clean(module_keys)
+        store.is_clean(keys[0])
+
+        store.evict()
+
+        self.assertTrue(store.is_clean(keys[0]))
+        self.assertFalse(store.is_clean(keys[1]))
+        self.assertTrue(store.is_clean(keys[2]))
+
+
+class VerdictStoreRunTest(unittest.TestCase):
+    def setUp(self):
+        self.repo_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.repo_root.cleanup)
+        self.store_path = os.path.join(self.repo_root.name, ".piranha", "verdicts.sqlite3")
+        for filename, source in (("mention.py", FLAG_MENTION), ("declaration.py", b"OTHER = FEATURE_FLAG_NAME\n")):
+            with open(os.path.join(self.repo_root.name, filename), "wb") as module_file:
+                module_file.write(source)
+
+    def test_later_runs_skip_modules_found_clean(self):
+        store = VerdictStore(self.store_path)
+        self.addCleanup(store.close)
+        first_report = driver.run(_command(), [self.repo_root.name], repo_root=self.repo_root.name, verdicts=store)
+
+        with mock.patch.object(driver, "confirms_flag_usage") as confirms_flag_usage:
+            second_report = driver.run(_command(), [self.repo_root.name], repo_root=self.repo_root.name, verdicts=store)
+
+        confirms_flag_usage.assert_not_called()
+        self.assertEqual(first_report.counters["verdict_hits"], 0)
+        self.assertEqual(second_report.counters["verdict_hits"], 2)
+        self.assertEqual(second_report.counters["files_unchanged"], 2)
+
+    def test_modules_using_the_flag_are_not_recorded_as_clean(self):
+        with open(os.path.join(self.repo_root.name, "flag_usage.py"), "wb") as module_file:
+            module_file.write(FLAG_USAGE)
+        store = VerdictStore(self.store_path)
+        self.addCleanup(store.close)
+        driver.run(_command(), [self.repo_root.name], repo_root=self.repo_root.name, write=False, verdicts=store)
+
+        report = driver.run(_command(), [self.repo_root.name], repo_root=self.repo_root.name, verdicts=store)
+
+        self.assertEqual(report.counters["verdict_hits"], 2)
+        self.assertEqual(report.counters["files_changed"], 1)
+
+    def test_parallel_runs_record_and_use_verdicts(self):
+        store = VerdictStore(self.store_path)
+        self.addCleanup(store.close)
+        scheduler.run_parallel(_command(), [self.repo_root.name], repo_root=self.repo_root.name, jobs=2, verdicts=store)
+
+        report = scheduler.run_parallel(
+            _command(), [self.repo_root.name], repo_root=self.repo_root.name, jobs=2, verdicts=store
+        )
+
+        self.assertEqual(report.counters["verdict_hits"], 2)
+
+    def test_command_line_option(self):
+        arguments = ["run", "--flag-name", FEATURE_FLAG_NAME, "--method-name", "is_flag_active", "-j", "1"]
+        arguments += ["--verdict-store", self.store_path, "--repo-root", self.repo_root.name, self.repo_root.name]
+
+        self.assertEqual(main(arguments), 0)
+
+        store = VerdictStore(self.store_path)
+        self.addCleanup(store.close)
+        self.assertTrue(store.is_clean(store.keys_for(_command(), FLAG_MENTION)))
+
+
+def _command(mode="treated", methods="is_flag_active", flag_aliases_by_module=None):
+    return PiranhaCommand(
+        CodemodContext(),
+        flag_name=FEATURE_FLAG_NAME,
+        flag_resolution_methods=methods,
+        mode=mode,
+        flag_aliases_by_module=flag_aliases_by_module,
+    )